@@ -1,7 +1,7 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from datetime import datetime
-from typing import List, NewType, Optional, Sequence, TypedDict
+from typing import List, NewType, Optional, Sequence, TypedDict, Union, overload
 
 AgentId = NewType("AgentId", str)
 AgentType = NewType("AgentType", str)
@@ -16,6 +16,18 @@ class Agent:
     created_at: datetime
 
 
+class PartialAgent(TypedDict, total=False):
+    """
+    An agent read with a projection: its id and the projected fields only.
+    """
+
+    id: AgentId
+    type: AgentType
+    name: str
+    description: Optional[str]
+    created_at: datetime
+
+
 class AgentUpdateParams(TypedDict, total=False):
     name: str
     description: Optional[str]
@@ -31,13 +43,30 @@ class AgentStore(ABC):
         created_at: Optional[datetime] = None,
     ) -> Agent: ...
 
+    @overload
+    async def list_agents(
+        self,
+        offset: int = 0,
+        limit: int = 10,
+        projection: None = None,
+    ) -> Sequence[Agent]: ...
+
+    @overload
+    async def list_agents(
+        self,
+        offset: int = 0,
+        limit: int = 10,
+        *,
+        projection: List[str],
+    ) -> Sequence[PartialAgent]: ...
+
     @abstractmethod
     async def list_agents(
         self,
         offset: int = 0,
         limit: int = 10,
         projection: Optional[List[str]] = None,
-    ) -> Sequence[Agent]: ...
+    ) -> Union[Sequence[Agent], Sequence[PartialAgent]]: ...
 
     @abstractmethod
     async def read_agent(
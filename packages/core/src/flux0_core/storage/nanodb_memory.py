@@ -1,10 +1,29 @@
 import asyncio
-from dataclasses import dataclass
-from datetime import datetime, timezone
-from typing import List, Mapping, Optional, Self, Sequence, TypedDict, Union, override
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, fields
+from datetime import datetime, timedelta, timezone
+from typing import (
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Self,
+    Sequence,
+    TypedDict,
+    Union,
+    cast,
+    overload,
+    override,
+)
 
-from flux0_core.agents import Agent, AgentId, AgentStore, AgentType, AgentUpdateParams
-from flux0_core.async_utils import RWLock
+from flux0_core.agents import (
+    Agent,
+    AgentId,
+    AgentStore,
+    AgentType,
+    AgentUpdateParams,
+    PartialAgent,
+)
 from flux0_core.ids import gen_id
 from flux0_core.sessions import (
     ConsumerId,
@@ -24,7 +43,10 @@ from flux0_core.sessions import (
 from flux0_core.types import JSONSerializable
 from flux0_core.users import User, UserId, UserStore, UserUpdateParams
 from flux0_nanodb.api import DocumentCollection, DocumentDatabase
+from flux0_nanodb.projection import Projection
 from flux0_nanodb.query import And, Comparison, QueryFilter
+from flux0_nanodb.schema import compile_deserializer, compile_serializer
+from flux0_nanodb.ttl import Cascade, ExpirySweeper, TTLIndex
 from flux0_nanodb.types import DocumentID, DocumentVersion
 
 
@@ -40,16 +62,26 @@ class _UserDocument(TypedDict, total=False):
     created_at: datetime
 
 
+# Documents are built from (and back into) the dataclasses of the domain by functions generated
+# from the schemas, as the fields have the same names.
+_user_to_document = compile_serializer(_UserDocument, User)
+_user_from_document = compile_deserializer(_UserDocument, User)
+
+
 class UserDocumentStore(UserStore):
     VERSION = DocumentVersion("0.0.1")
 
     def __init__(self, db: DocumentDatabase):
         self.db = db
         self._user_col: DocumentCollection[_UserDocument]
-        self._lock = RWLock()
+        # Serializes writes. Reads take no lock, as each read of a collection sees it at a single
+        # point in time and never waits for writers.
+        self._lock = asyncio.Lock()
 
     async def __aenter__(self) -> Self:
         self._user_col = await self.db.create_collection("users", _UserDocument)
+        await self._user_col.create_index("id", unique=True)
+        await self._user_col.create_index("sub")
         return self
 
     async def __aexit__(
@@ -64,26 +96,13 @@ class UserDocumentStore(UserStore):
         self,
         user: User,
     ) -> _UserDocument:
-        return _UserDocument(
-            id=DocumentID(user.id),
-            version=self.VERSION,
-            sub=user.sub,
-            name=user.name,
-            email=user.email,
-            created_at=user.created_at,
-        )
+        return _user_to_document(user, version=self.VERSION)
 
     def _deserialize_user(
         self,
         doc: _UserDocument,
     ) -> User:
-        return User(
-            id=UserId(doc["id"]),
-            sub=doc["sub"],
-            name=doc["name"],
-            email=doc.get("email"),
-            created_at=doc["created_at"],
-        )
+        return _user_from_document(doc)
 
     @override
     async def create_user(
@@ -101,7 +120,7 @@ class UserDocumentStore(UserStore):
             email=email,
             created_at=created_at,
         )
-        async with self._lock.writer_lock:
+        async with self._lock:
             await self._user_col.insert_one(document=self._serialize_user(user))
         return user
 
@@ -110,18 +129,16 @@ class UserDocumentStore(UserStore):
         self,
         user_id: UserId,
     ) -> Optional[User]:
-        async with self._lock.reader_lock:
-            result = await self._user_col.find(Comparison(path="id", op="$eq", value=user_id))
-            return self._deserialize_user(result[0]) if result else None
+        result = await self._user_col.find_one(Comparison(path="id", op="$eq", value=user_id))
+        return self._deserialize_user(result) if result else None
 
     @override
     async def read_user_by_sub(
         self,
         sub: str,
     ) -> Optional[User]:
-        async with self._lock.reader_lock:
-            result = await self._user_col.find(Comparison(path="sub", op="$eq", value=sub))
-            return self._deserialize_user(result[0]) if result else None
+        result = await self._user_col.find_one(Comparison(path="sub", op="$eq", value=sub))
+        return self._deserialize_user(result) if result else None
 
     @override
     async def update_user(
@@ -144,16 +161,22 @@ class _AgentDocument(TypedDict, total=False):
     created_at: datetime
 
 
+_agent_to_document = compile_serializer(_AgentDocument, Agent)
+_agent_from_document = compile_deserializer(_AgentDocument, Agent)
+_agent_fields = frozenset(field.name for field in fields(Agent))
+
+
 class AgentDocumentStore(AgentStore):
     VERSION = DocumentVersion("0.0.1")
 
     def __init__(self, db: DocumentDatabase):
         self.db = db
         self._agent_col: DocumentCollection[_AgentDocument]
-        self._lock = RWLock()
+        self._lock = asyncio.Lock()
 
     async def __aenter__(self) -> Self:
         self._agent_col = await self.db.create_collection("agents", _AgentDocument)
+        await self._agent_col.create_index("id", unique=True)
         return self
 
     async def __aexit__(
@@ -168,26 +191,13 @@ class AgentDocumentStore(AgentStore):
         self,
         agent: Agent,
     ) -> _AgentDocument:
-        return _AgentDocument(
-            id=DocumentID(agent.id),
-            version=self.VERSION,
-            type=agent.type,
-            name=agent.name,
-            description=agent.description,
-            created_at=agent.created_at,
-        )
+        return _agent_to_document(agent, version=self.VERSION)
 
     def _deserialize_agent(
         self,
         doc: _AgentDocument,
     ) -> Agent:
-        return Agent(
-            id=AgentId(doc["id"]),
-            type=doc["type"],
-            name=doc["name"],
-            description=doc["description"],
-            created_at=doc["created_at"],
-        )
+        return _agent_from_document(doc)
 
     @override
     async def create_agent(
@@ -205,7 +215,7 @@ class AgentDocumentStore(AgentStore):
             description=description,
             created_at=created_at,
         )
-        async with self._lock.writer_lock:
+        async with self._lock:
             await self._agent_col.insert_one(document=self._serialize_agent(agent))
         return agent
 
@@ -214,9 +224,25 @@ class AgentDocumentStore(AgentStore):
         self,
         agent_id: AgentId,
     ) -> Optional[Agent]:
-        async with self._lock.reader_lock:
-            result = await self._agent_col.find(Comparison(path="id", op="$eq", value=agent_id))
-            return self._deserialize_agent(result[0]) if result else None
+        result = await self._agent_col.find_one(Comparison(path="id", op="$eq", value=agent_id))
+        return self._deserialize_agent(result) if result else None
+
+    @overload
+    async def list_agents(
+        self,
+        offset: int = 0,
+        limit: int = 10,
+        projection: None = None,
+    ) -> Sequence[Agent]: ...
+
+    @overload
+    async def list_agents(
+        self,
+        offset: int = 0,
+        limit: int = 10,
+        *,
+        projection: List[str],
+    ) -> Sequence[PartialAgent]: ...
 
     @override
     async def list_agents(
@@ -224,13 +250,21 @@ class AgentDocumentStore(AgentStore):
         offset: int = 0,
         limit: int = 10,
         projection: Optional[List[str]] = None,
-    ) -> Sequence[Agent]:
+    ) -> Union[Sequence[Agent], Sequence[PartialAgent]]:
         if offset != 0 or limit != 10:
             raise NotImplementedError("Pagination is not supported")
-        if projection is not None:
-            raise NotImplementedError("Projection not supported")
-        async with self._lock.reader_lock:
-            return [self._deserialize_agent(d) for d in await self._agent_col.find(filters=None)]
+        if projection is None:
+            docs = await self._agent_col.find(filters=None)
+            return [self._deserialize_agent(d) for d in docs]
+
+        # Projected agents only hold the projected fields and their id, so they are no agents.
+        unknown = [field for field in projection if field not in _agent_fields]
+        if unknown:
+            raise ValueError(f"Unknown agent fields in projection: {unknown}")
+        included: Dict[str, Projection] = {"_id": Projection.EXCLUDE, "id": Projection.INCLUDE}
+        included.update((field, Projection.INCLUDE) for field in projection)
+        docs = await self._agent_col.find(filters=None, projection=included)
+        return [cast(PartialAgent, dict(d)) for d in docs]
 
     @override
     async def update_agent(
@@ -245,7 +279,7 @@ class AgentDocumentStore(AgentStore):
         self,
         agent_id: AgentId,
     ) -> bool:
-        async with self._lock.writer_lock:
+        async with self._lock:
             result = await self._agent_col.delete_one(
                 Comparison(path="id", op="$eq", value=agent_id)
             )
@@ -283,91 +317,98 @@ class _EventDocument(TypedDict, total=False):
     metadata: Optional[Mapping[str, JSONSerializable]]
 
 
+_session_to_document = compile_serializer(_SessionDocument, Session)
+_session_from_document = compile_deserializer(_SessionDocument, Session)
+_event_to_document = compile_serializer(_EventDocument, Event)
+_event_from_document = compile_deserializer(_EventDocument, Event)
+
+
 class SessionDocumentStore(SessionStore):
     VERSION = DocumentVersion("0.0.1")
 
-    def __init__(self, db: DocumentDatabase):
+    def __init__(self, db: DocumentDatabase, session_ttl: Optional[timedelta] = None):
+        """
+        If `session_ttl` is given, sessions created longer ago than that are deleted in the
+        background, along with their events.
+        """
         self.db = db
         self._session_col: DocumentCollection[_SessionDocument]
         self._event_col: DocumentCollection[_EventDocument]
-        self._lock = RWLock()
+        self._lock = asyncio.Lock()
+        self._session_ttl = session_ttl
+        self._sweeper: Optional[ExpirySweeper] = None
+        self._exit_stack = AsyncExitStack()
 
     async def __aenter__(self) -> Self:
-        self._session_col = await self.db.create_collection("sessions", _SessionDocument)
-        self._event_col = await self.db.create_collection("session_events", _EventDocument)
+        async with AsyncExitStack() as exit_stack:
+            await self._open(exit_stack)
+            # Resources entered so far are released on exit, or right away if opening failed.
+            self._exit_stack = exit_stack.pop_all()
         return self
 
+    async def _open(self, exit_stack: AsyncExitStack) -> None:
+        self._session_col = await self.db.create_collection("sessions", _SessionDocument)
+        # Events are only ever listed by session, which keeps them apart so that the history of
+        # a session is read at the same cost however many sessions there are.
+        self._event_col = await self.db.create_collection(
+            "session_events", _EventDocument, partition_key="session_id"
+        )
+        await self._session_col.create_index("id", unique=True)
+        await self._session_col.create_index("agent_id")
+        await self._session_col.create_index("user_id")
+        # Event ids are unique across sessions, and tell the session of an event, so that
+        # reading or deleting an event by id reads a single session.
+        await self._event_col.create_index("id", unique=True)
+        # Serves session history queries: equality on the session, range on the offset. Being
+        # unique, it also keeps stores sharing the database from giving two events one offset.
+        await self._event_col.create_index(("session_id", "offset"), unique=True)
+        if self._session_ttl is not None:
+            self._sweeper = await exit_stack.enter_async_context(
+                ExpirySweeper(
+                    [
+                        TTLIndex(
+                            self._session_col,
+                            "created_at",
+                            self._session_ttl,
+                            cascade=[Cascade(self._event_col, "session_id")],
+                        )
+                    ]
+                )
+            )
+
     async def __aexit__(
         self,
         exc_type: Optional[type[BaseException]],
         exc_value: Optional[BaseException],
         exec_tb: Optional[object],
     ) -> None:
-        pass
+        await self._exit_stack.aclose()
+        self._sweeper = None
 
     def _serialize_session(
         self,
         session: Session,
     ) -> _SessionDocument:
-        return _SessionDocument(
-            id=DocumentID(session.id),
-            version=self.VERSION,
-            agent_id=session.agent_id,
-            user_id=session.user_id,
-            mode=session.mode,
-            title=session.title,
-            consumption_offsets=session.consumption_offsets,
-            created_at=session.created_at,
-        )
+        return _session_to_document(session, version=self.VERSION)
 
     def _deserialize_session(
         self,
         doc: _SessionDocument,
     ) -> Session:
-        return Session(
-            id=SessionId(doc["id"]),
-            agent_id=doc["agent_id"],
-            user_id=doc["user_id"],
-            mode=doc["mode"],
-            title=doc.get("title"),
-            consumption_offsets=doc["consumption_offsets"],
-            created_at=doc["created_at"],
-        )
+        return _session_from_document(doc)
 
     def _serialize_event(
         self,
         session_id: SessionId,
         event: Event,
     ) -> _EventDocument:
-        return _EventDocument(
-            id=DocumentID(event.id),
-            version=self.VERSION,
-            session_id=session_id,
-            source=event.source,
-            type=event.type,
-            offset=event.offset,
-            correlation_id=event.correlation_id,
-            data=event.data,
-            deleted=event.deleted,
-            created_at=event.created_at,
-            metadata=event.metadata,
-        )
+        return _event_to_document(event, version=self.VERSION, session_id=session_id)
 
     def _deserialize_event(
         self,
         doc: _EventDocument,
     ) -> Event:
-        return Event(
-            id=EventId(doc["id"]),
-            source=doc["source"],
-            type=doc["type"],
-            offset=doc["offset"],
-            correlation_id=doc["correlation_id"],
-            data=doc["data"],
-            deleted=doc["deleted"],
-            created_at=doc["created_at"],
-            metadata=doc.get("metadata"),
-        )
+        return _event_from_document(doc)
 
     @override
     async def create_session(
@@ -390,7 +431,7 @@ class SessionDocumentStore(SessionStore):
             consumption_offsets=consumption_offsets,
             created_at=created_at,
         )
-        async with self._lock.writer_lock:
+        async with self._lock:
             await self._session_col.insert_one(document=self._serialize_session(session))
         return session
 
@@ -399,26 +440,19 @@ class SessionDocumentStore(SessionStore):
         self,
         session_id: SessionId,
     ) -> Optional[Session]:
-        async with self._lock.reader_lock:
-            result = await self._session_col.find(Comparison(path="id", op="$eq", value=session_id))
-            return self._deserialize_session(result[0]) if result else None
+        result = await self._session_col.find_one(Comparison(path="id", op="$eq", value=session_id))
+        return self._deserialize_session(result) if result else None
 
     @override
     async def delete_session(
         self,
         session_id: SessionId,
     ) -> bool:
-        async with self._lock.writer_lock:
+        async with self._lock:
             # delete events
-            events = await self.list_events(session_id)
-            # for event in events:
-            futures = [
-                asyncio.ensure_future(
-                    self._event_col.delete_one(Comparison(path="id", op="$eq", value=e.id))
-                )
-                for e in events
-            ]
-            await asyncio.gather(*futures, return_exceptions=False)
+            await self._event_col.delete_many(
+                Comparison(path="session_id", op="$eq", value=session_id)
+            )
 
             # delete session
             result = await self._session_col.delete_one(
@@ -452,10 +486,7 @@ class SessionDocumentStore(SessionStore):
         if expressions:
             query_filter = And(expressions=expressions)
 
-        async with self._lock.reader_lock:
-            return [
-                self._deserialize_session(d) for d in await self._session_col.find(query_filter)
-            ]
+        return [self._deserialize_session(d) for d in await self._session_col.find(query_filter)]
 
     @override
     async def create_event(
@@ -468,28 +499,53 @@ class SessionDocumentStore(SessionStore):
         metadata: Optional[Mapping[str, JSONSerializable]] = None,
         created_at: Optional[datetime] = None,
     ) -> Event:
-        async with self._lock.writer_lock:
-            session = await self.read_session(session_id)
-            if session is None:
+        async with self._lock:
+            if not await self._session_col.exists(
+                Comparison(path="id", op="$eq", value=session_id)
+            ):
                 raise ValueError(f"Session not found: {session_id}")
 
-            events = await self.list_events(session_id)
-            offset = len(list(events))
+            offset = await self._event_col.count(
+                And(
+                    expressions=[
+                        Comparison(path="session_id", op="$eq", value=session_id),
+                        Comparison(path="deleted", op="$eq", value=False),
+                    ]
+                )
+            )
 
             created_at = created_at or datetime.now(timezone.utc)
-            event = Event(
-                id=EventId(gen_id()),
-                source=source,
-                type=type,
-                offset=offset,
-                correlation_id=correlation_id,
-                data=data,
-                metadata=metadata,
-                deleted=False,
-                created_at=created_at,
-            )
-            await self._event_col.insert_one(document=self._serialize_event(session_id, event))
-        return event
+            while True:
+                event = Event(
+                    id=EventId(gen_id()),
+                    source=source,
+                    type=type,
+                    offset=offset,
+                    correlation_id=correlation_id,
+                    data=data,
+                    metadata=metadata,
+                    deleted=False,
+                    created_at=created_at,
+                )
+                try:
+                    await self._event_col.insert_one(
+                        document=self._serialize_event(session_id, event)
+                    )
+                    return event
+                except ValueError:
+                    # The lock only orders the writers of this process: another one sharing the
+                    # database (or a deleted event leaving a gap) may have taken the offset, which
+                    # the unique (session_id, offset) index refuses. Take the next one.
+                    if not await self._event_col.exists(
+                        And(
+                            expressions=[
+                                Comparison(path="session_id", op="$eq", value=session_id),
+                                Comparison(path="offset", op="$eq", value=offset),
+                            ]
+                        )
+                    ):
+                        raise
+                    offset += 1
 
     @override
     async def read_event(
@@ -497,23 +553,22 @@ class SessionDocumentStore(SessionStore):
         session_id: SessionId,
         event_id: EventId,
     ) -> Optional[Event]:
-        async with self._lock.reader_lock:
-            result = await self._event_col.find(
-                And(
-                    expressions=[
-                        Comparison(path="id", op="$eq", value=event_id),
-                        Comparison(path="session_id", op="$eq", value=session_id),
-                    ]
-                )
+        result = await self._event_col.find_one(
+            And(
+                expressions=[
+                    Comparison(path="id", op="$eq", value=event_id),
+                    Comparison(path="session_id", op="$eq", value=session_id),
+                ]
             )
-            return self._deserialize_event(result[0]) if result else None
+        )
+        return self._deserialize_event(result) if result else None
 
     @override
     async def delete_event(
         self,
         event_id: EventId,
     ) -> bool:
-        async with self._lock.writer_lock:
+        async with self._lock:
             result = await self._event_col.delete_one(
                 Comparison(path="id", op="$eq", value=event_id)
             )
@@ -550,5 +605,4 @@ class SessionDocumentStore(SessionStore):
         if expressions:
             query_filter = And(expressions=expressions)
 
-        async with self._lock.reader_lock:
-            return [self._deserialize_event(d) for d in await self._event_col.find(query_filter)]
+        return [self._deserialize_event(d) for d in await self._event_col.find(query_filter)]
@@ -3,3 +3,5 @@ from enum import Enum
 
 class StorageType(Enum):
     NANODB_MEMORY = "nanodb_memory"
+    NANODB_FILE = "nanodb_file"
+    NANODB_SQLITE = "nanodb_sqlite"
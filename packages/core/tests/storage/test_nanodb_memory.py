@@ -1,17 +1,25 @@
 # Fixture to provide a DocumentDatabase instance.
 
+import asyncio
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
 import pytest
 from flux0_core.agents import AgentId, AgentStore, AgentType
-from flux0_core.sessions import SessionStore, StatusEventData
+from flux0_core.sessions import SessionId, SessionStore, StatusEventData
 from flux0_core.storage.nanodb_memory import (
     AgentDocumentStore,
     SessionDocumentStore,
     UserDocumentStore,
+    _EventDocument,
     _SessionDocument,
 )
 from flux0_core.users import UserId, UserStore
 from flux0_nanodb.api import DocumentCollection, DocumentDatabase
 from flux0_nanodb.memory import MemoryDocumentDatabase
+from flux0_nanodb.query import And, Comparison
+from flux0_nanodb.shared import DatabaseServer, RemoteDocumentDatabase
+from flux0_nanodb.types import PlanStage, QueryPlan
 
 
 @pytest.fixture
@@ -56,6 +64,19 @@ async def test_agent_crud(agent_store: AgentStore) -> None:
     assert ra is None
 
 
+async def test_list_agents_projection(agent_store: AgentStore) -> None:
+    a = await agent_store.create_agent(
+        name="agent1", type=AgentType("mock"), description="first agent"
+    )
+    assert await agent_store.list_agents() == [a]
+
+    projected = await agent_store.list_agents(projection=["name"])
+    assert projected == [{"id": a.id, "name": a.name}]
+
+    with pytest.raises(ValueError):
+        await agent_store.list_agents(projection=["secret"])
+
+
 #############
 # Users
 #############
@@ -257,3 +278,112 @@ async def test_session_events_list(session_store: SessionStore) -> None:
     assert len(es) == 0
     ok = await session_store.delete_session(s.id)
     assert not ok
+
+
+async def test_session_event_offsets(tmp_path: Path) -> None:
+    path = tmp_path / "db.sock"
+
+    async def create(store: SessionStore, session_id: SessionId, n: int) -> None:
+        for _ in range(n):
+            await store.create_event(
+                session_id,
+                correlation_id="c1",
+                type="status",
+                source="ai_agent",
+                data=StatusEventData(type="status", status="ready"),
+            )
+
+    # Stores sharing a database, as server workers do, give every event its own offset.
+    async with (
+        DatabaseServer(MemoryDocumentDatabase(), path),
+        RemoteDocumentDatabase(path) as first_db,
+        RemoteDocumentDatabase(path) as second_db,
+        SessionDocumentStore(first_db) as first,
+        SessionDocumentStore(second_db) as second,
+    ):
+        s = await first.create_session(user_id=UserId("u1"), agent_id=AgentId("a1"))
+        await asyncio.gather(create(first, s.id, 5), create(second, s.id, 5))
+        events = await first.list_events(s.id)
+        assert sorted(e.offset for e in events) == list(range(10))
+
+        # Deleting an event leaves a gap that later events do not fill.
+        await first.delete_event(events[0].id)
+        await create(second, s.id, 1)
+        offsets = sorted(e.offset for e in await first.list_events(s.id))
+        assert offsets == [o for o in range(11) if o != events[0].offset]
+
+
+async def test_session_queries_use_indexes(
+    db: DocumentDatabase, session_store: SessionStore
+) -> None:
+    s = await session_store.create_session(user_id=UserId("u1"), agent_id=AgentId("a1"))
+    other = await session_store.create_session(user_id=UserId("u2"), agent_id=AgentId("a1"))
+    for status in ("processing", "typing", "ready"):
+        await session_store.create_event(
+            s.id,
+            correlation_id="c1",
+            type="status",
+            source="ai_agent",
+            data=StatusEventData(type="status", status=status),
+        )
+    event = await session_store.create_event(
+        other.id,
+        correlation_id="c2",
+        type="status",
+        source="ai_agent",
+        data=StatusEventData(type="status", status="ready"),
+    )
+    sessions = await db.get_collection("sessions", _SessionDocument)
+    events = await db.get_collection("session_events", _EventDocument)
+
+    result = await sessions.explain(Comparison(path="id", op="$eq", value=s.id))
+    assert result.plan.stage == PlanStage.INDEX_SEEK
+    # The incremental history fetch reads the partition of the session only, where it is served
+    # by the (session_id, offset) index.
+    result = await events.explain(
+        And(
+            expressions=[
+                Comparison(path="session_id", op="$eq", value=s.id),
+                Comparison(path="offset", op="$gte", value=1),
+                Comparison(path="deleted", op="$eq", value=False),
+            ]
+        )
+    )
+    assert result.plan == QueryPlan(
+        stage=PlanStage.PARTITIONS,
+        children=[QueryPlan(stage=PlanStage.INDEX_SEEK, index=("session_id", "offset"))],
+    )
+    assert result.documents_examined == 2
+    # Events looked up by id, as when deleting them, are found in their session only.
+    result = await events.explain(Comparison(path="id", op="$eq", value=event.id))
+    assert result.plan == QueryPlan(
+        stage=PlanStage.PARTITIONS,
+        children=[QueryPlan(stage=PlanStage.INDEX_SEEK, index=("id",))],
+    )
+
+
+async def test_session_ttl(db: DocumentDatabase) -> None:
+    async with SessionDocumentStore(db, session_ttl=timedelta(days=1)) as store:
+        old = await store.create_session(
+            user_id=UserId("u1"),
+            agent_id=AgentId("a1"),
+            created_at=datetime.now(timezone.utc) - timedelta(days=2),
+        )
+        new = await store.create_session(user_id=UserId("u1"), agent_id=AgentId("a1"))
+        for s in (old, new):
+            await store.create_event(
+                s.id,
+                correlation_id="c1",
+                type="status",
+                source="ai_agent",
+                data=StatusEventData(type="status", status="ready"),
+            )
+
+        assert store._sweeper is not None
+        assert await store._sweeper.sweep() == 2
+        assert await store.list_sessions() == [new]
+        assert await store.list_events(old.id) == []
+        assert len(await store.list_events(new.id)) == 1
+        sweeper = store._sweeper
+    # The sweeper stops with the store.
+    assert sweeper is not None and sweeper._task is None
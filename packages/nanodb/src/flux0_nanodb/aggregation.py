@@ -0,0 +1,127 @@
+import asyncio
+from typing import AbstractSet, Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from flux0_nanodb.index import OrderedKey, ordered_key
+from flux0_nanodb.types import Accumulator
+
+# The running value of every accumulator of a group: a count, or the ordered key of the smallest
+# or largest value seen so far (None until there is one).
+State = List[Any]
+
+
+class Aggregation:
+    """
+    Folds documents into groups in a single pass, keeping nothing but the running value of each
+    accumulator per group.
+
+    `$min` and `$max` compare values the way ordered indexes do (numbers, then strings, then
+    naive and aware datetimes) and skip documents holding none of these in their field, so that
+    indexes can answer them. Groups are told apart by the values of their fields, which must be
+    hashable; a missing field groups as None.
+    """
+
+    def __init__(self, group_by: Sequence[str], accumulators: Mapping[str, Accumulator]) -> None:
+        if len(set(group_by)) != len(group_by):
+            raise ValueError("Cannot group by the same field twice")
+        for name, accumulator in accumulators.items():
+            if name in group_by:
+                raise ValueError(f"Accumulator '{name}' clashes with a group field")
+            if accumulator.op == "$count":
+                if accumulator.path is not None:
+                    raise ValueError(f"Accumulator '{name}' counts documents, it takes no path")
+            elif accumulator.op in ("$min", "$max"):
+                if accumulator.path is None:
+                    raise ValueError(f"Accumulator '{name}' needs the path of its field")
+            else:
+                raise ValueError(f"Unknown accumulator operator '{accumulator.op}'")
+        self.group_by = tuple(group_by)
+        self._accumulators = dict(accumulators)
+        self._specs = [(a.op, a.path) for a in accumulators.values()]
+        self._groups: Dict[Tuple[Any, ...], State] = {}
+
+    @property
+    def counts_only(self) -> bool:
+        """
+        Whether every accumulator counts documents, reading no field.
+        """
+        return all(op == "$count" for op, _ in self._specs)
+
+    def covered_by(self, fields: AbstractSet[str]) -> bool:
+        """
+        Whether the accumulators read no field but the given ones.
+        """
+        return all(path is None or path in fields for _, path in self._specs)
+
+    def _state(self, key: Tuple[Any, ...]) -> State:
+        try:
+            state = self._groups.get(key)
+        except TypeError:
+            raise TypeError(f"Cannot group by unhashable values {key!r}") from None
+        if state is None:
+            state = [0 if op == "$count" else None for op, _ in self._specs]
+            self._groups[key] = state
+        return state
+
+    def _accumulate(self, state: State, i: int, op: str, value: Optional[OrderedKey]) -> None:
+        if value is None:
+            return
+        current = state[i]
+        if current is None or (value < current if op == "$min" else current < value):
+            state[i] = value
+
+    def add(self, document: Mapping[str, Any]) -> None:
+        """
+        Fold a document into its group.
+        """
+        state = self._state(tuple(document.get(field) for field in self.group_by))
+        for i, (op, path) in enumerate(self._specs):
+            if path is None:
+                state[i] += 1
+            else:
+                self._accumulate(state, i, op, ordered_key(document.get(path)))
+
+    async def add_all(self, matches: Iterable[Optional[Mapping[str, Any]]]) -> None:
+        """
+        Fold the documents of a cooperative read, letting other tasks run at every None (see
+        `flux0_nanodb.cooperative`).
+        """
+        for document in matches:
+            if document is None:
+                await asyncio.sleep(0)
+            else:
+                self.add(document)
+
+    def add_group(
+        self,
+        key: Tuple[Any, ...],
+        count: int,
+        bounds: Mapping[str, Tuple[OrderedKey, OrderedKey]],
+    ) -> None:
+        """
+        Fold `count` documents of a group at once, knowing the smallest and largest ordered key
+        of the fields in `bounds` among them, as an index tells them without reading documents.
+        Accumulators have to be `covered_by` the group fields and the bound ones.
+        """
+        state = self._state(key)
+        values = dict(zip(self.group_by, key))
+        for i, (op, path) in enumerate(self._specs):
+            if path is None:
+                state[i] += count
+            elif path in values:
+                self._accumulate(state, i, op, ordered_key(values[path]))
+            else:
+                low, high = bounds[path]
+                self._accumulate(state, i, op, low if op == "$min" else high)
+
+    def results(self) -> List[Dict[str, Any]]:
+        """
+        Return one document per group, holding the values of the group fields and the value of
+        every accumulator.
+        """
+        results = []
+        for key, state in self._groups.items():
+            result = dict(zip(self.group_by, key))
+            for name, (op, _), value in zip(self._accumulators, self._specs, state):
+                result[name] = value if op == "$count" or value is None else value[1]
+            results.append(result)
+        return results
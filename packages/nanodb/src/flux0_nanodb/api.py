@@ -1,16 +1,33 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from typing import Generic, List, Mapping, Optional, Sequence, Tuple, Type
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Generic,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
 
+from flux0_nanodb.changes import BUFFER_SIZE, ChangeStream
 from flux0_nanodb.projection import Projection
 from flux0_nanodb.query import QueryFilter
 from flux0_nanodb.types import (
+    Accumulator,
     DeleteResult,
+    ExplainResult,
+    InsertManyResult,
     InsertOneResult,
     JSONPatchOperation,
     SortingOrder,
     TDocument,
+    UpdateManyResult,
     UpdateOneResult,
 )
 
@@ -18,10 +35,16 @@ from flux0_nanodb.types import (
 class DocumentDatabase(ABC):
     @abstractmethod
     async def create_collection(
-        self, name: str, schema: Type[TDocument]
+        self, name: str, schema: Type[TDocument], partition_key: Optional[str] = None
     ) -> DocumentCollection[TDocument]:
         """
         Create a new collection with the given name and document schema.
+
+        If `partition_key` is given, documents are kept apart by the value of that (top-level)
+        field, which every document must have, so that queries pinning it with `$eq` or `$in`
+        only read the documents of the partitions they name, however many there are. Updates
+        cannot change it, and unique indexes have to include it. Backends that have no use for
+        partitions index the field instead.
         """
         pass
 
@@ -43,6 +66,12 @@ class DocumentDatabase(ABC):
 
 
 class DocumentCollection(ABC, Generic[TDocument]):
+    """
+    A collection of documents. Each read sees the collection at a single point in time, as left
+    by the writes completed before it, so that callers need no lock to read consistently. Writes
+    apply in full or not at all.
+    """
+
     @abstractmethod
     async def find(
         self,
@@ -64,6 +93,93 @@ class DocumentCollection(ABC, Generic[TDocument]):
         """
         pass
 
+    @abstractmethod
+    def find_iter(
+        self,
+        filters: Optional[QueryFilter] = None,
+        projection: Optional[Mapping[str, Projection]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]] = None,
+        batch_size: int = 100,
+    ) -> AsyncIterator[TDocument]:
+        """
+        Like `find`, but return an async iterator over the matching documents instead of a list.
+
+        Documents are produced lazily, `batch_size` at a time, and the projection is applied to
+        each batch as it is produced, so large results can be streamed without holding them in
+        memory. The iterator reads the collection as it was when iteration started: documents
+        written while iterating are returned as they were, deleted ones included, and documents
+        inserted while iterating are not returned.
+        """
+        pass
+
+    @abstractmethod
+    async def find_one(
+        self,
+        filters: Optional[QueryFilter] = None,
+        projection: Optional[Mapping[str, Projection]] = None,
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]] = None,
+    ) -> Optional[TDocument]:
+        """
+        Find the first document that matches the optional filters, or None if there is none.
+        The search stops at the first match, unless a sort order has to be honoured.
+        """
+        pass
+
+    @abstractmethod
+    async def count(self, filters: Optional[QueryFilter] = None) -> int:
+        """
+        Count the documents that match the optional filters, without retrieving them.
+        """
+        pass
+
+    @abstractmethod
+    async def exists(self, filters: Optional[QueryFilter] = None) -> bool:
+        """
+        Check whether any document matches the optional filters, stopping at the first match.
+        """
+        pass
+
+    @abstractmethod
+    async def aggregate(
+        self,
+        filters: Optional[QueryFilter],
+        group_by: Sequence[str],
+        accumulators: Mapping[str, Accumulator],
+    ) -> Sequence[Dict[str, Any]]:
+        """
+        Group the documents matching the optional filters by the values of the `group_by`
+        fields, and reduce each group with the accumulators, in a single pass and without
+        returning the documents themselves. Return one document per group, in no particular
+        order, holding the group fields and, under the name of every accumulator, its value:
+
+        - `Accumulator("$count")` counts the documents of the group.
+        - `Accumulator("$min", path)` and `Accumulator("$max", path)` take the smallest and
+          largest value of a top-level field, None if no document of the group holds a number,
+          string or datetime in it (see `flux0_nanodb.aggregation`).
+
+        Without `group_by`, the matching documents form a single group, and none form none.
+        """
+        pass
+
+    @abstractmethod
+    async def explain(
+        self,
+        filters: Optional[QueryFilter] = None,
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        projection: Optional[Mapping[str, Projection]] = None,
+    ) -> ExplainResult:
+        """
+        Run a query like `find` does and report how it was executed: the plan chosen (full
+        scan, index seek, intersection or union of seeks), whether it was covered by an index
+        (answered without reading any document), how many documents were examined and how
+        many were returned.
+        """
+        pass
+
     @abstractmethod
     async def insert_one(self, document: TDocument) -> InsertOneResult:
         """
@@ -71,6 +187,14 @@ class DocumentCollection(ABC, Generic[TDocument]):
         """
         pass
 
+    @abstractmethod
+    async def insert_many(self, documents: Sequence[TDocument]) -> InsertManyResult:
+        """
+        Insert several documents in one operation. If any document is invalid or violates a
+        unique index, none of them is inserted.
+        """
+        pass
+
     @abstractmethod
     async def update_one(
         self, filters: QueryFilter, patch: List[JSONPatchOperation], upsert: bool = False
@@ -89,9 +213,70 @@ class DocumentCollection(ABC, Generic[TDocument]):
         """
         pass
 
+    @abstractmethod
+    async def update_many(
+        self, filters: QueryFilter, patch: List[JSONPatchOperation], upsert: bool = False
+    ) -> UpdateManyResult:
+        """
+        Apply a JSON Patch (RFC 6902) to every document that matches the provided filters.
+        If the patch cannot be applied to one of them, no document is modified.
+        If upsert is True and no document matches, insert a new document.
+        """
+        pass
+
     @abstractmethod
     async def delete_one(self, filters: QueryFilter) -> DeleteResult[TDocument]:
         """
         Delete the first document that matches the provided filters.
         """
         pass
+
+    @abstractmethod
+    async def delete_many(self, filters: QueryFilter) -> DeleteResult[TDocument]:
+        """
+        Delete every document that matches the provided filters. The result only reports how
+        many documents were deleted.
+        """
+        pass
+
+    @abstractmethod
+    def watch(
+        self,
+        filters: Optional[QueryFilter] = None,
+        resume_after: Optional[str] = None,
+        buffer_size: int = BUFFER_SIZE,
+    ) -> ChangeStream[TDocument]:
+        """
+        Open a change stream: an async iterator of the documents inserted, updated and deleted
+        from now on (optionally only those matching `filters`), one event per document, in the
+        order of their sequence numbers.
+
+        Passing the resume token of an event resumes a stream right after it, as long as the
+        collection still remembers the events that followed; otherwise a ValueError is raised.
+        A stream buffers at most `buffer_size` events: once its reader falls further behind, it
+        is closed and reading it raises a ValueError.
+        """
+        pass
+
+    @abstractmethod
+    async def create_index(
+        self, field: Union[str, Sequence[str]], unique: bool = False, ordered: bool = False
+    ) -> None:
+        """
+        Create an index on the given field so that equality lookups (`$eq` and `$in`) on it no
+        longer scan the whole collection. Existing documents are indexed immediately.
+
+        If `unique` is True, inserting or updating a document so that two documents share the
+        same value for the field raises a ValueError.
+
+        If `ordered` is True, the index also answers range comparisons (`$gt`, `$gte`, `$lt`,
+        `$lte`) on numeric and datetime values, and `find` uses it to return documents sorted
+        on the field without sorting them.
+
+        Passing several fields creates an ordered compound index. It serves equality on a prefix
+        of its fields, optionally followed by a range or `$in` on the next field, e.g. an index
+        on `("session_id", "offset")` answers "offset >= N within session S" directly.
+
+        Creating an index that already exists with the same options is a no-op.
+        """
+        pass
@@ -0,0 +1,150 @@
+import sys
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Generic,
+    Hashable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    cast,
+)
+
+from flux0_nanodb.projection import Projection, Projector
+from flux0_nanodb.query import Comparison, QueryFilter, canonical_form
+from flux0_nanodb.types import SortingOrder, TDocument
+
+
+@dataclass(frozen=True)
+class CacheStats:
+    hits: int
+    misses: int
+    # The number of results cached, and the memory they take in bytes (estimated).
+    entries: int
+    size: int
+
+
+def query_key(
+    filters: Optional[QueryFilter],
+    projection: Optional[Mapping[str, Projection]],
+    limit: Optional[int],
+    offset: Optional[int],
+    sort: Optional[Sequence[Tuple[str, SortingOrder]]],
+) -> Optional[Hashable]:
+    """
+    Return a hashable representation of a query; equal queries have equal keys. Queries whose
+    filters compare to unhashable values have none (None): their results are not cached.
+    """
+    if filters is not None and not _hashable_filters(filters):
+        return None
+    return (
+        canonical_form(filters) if filters is not None else None,
+        # Projections list their fields in the order results hold them.
+        tuple(projection.items()) if projection else None,
+        limit,
+        offset or 0,
+        tuple((field, order) for field, order in sort) if sort else None,
+    )
+
+
+def _hashable_filters(filters: QueryFilter) -> bool:
+    if isinstance(filters, Comparison):
+        return _hashable(filters.value)
+    return all(_hashable_filters(expression) for expression in filters.expressions)
+
+
+def _hashable(value: Any) -> bool:
+    # Lists of hashable values are hashed as tuples, see `canonical_form`.
+    if isinstance(value, list):
+        return all(_hashable(v) for v in value)
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+def _footprint(docs: Sequence[object]) -> int:
+    # Documents are measured shallowly, and as if the result held the only reference to them,
+    # which overestimates results holding stored documents rather than projected ones.
+    return sys.getsizeof(docs) + sum(sys.getsizeof(doc) for doc in docs)
+
+
+class ResultCache(Generic[TDocument]):
+    """
+    The results of the latest queries of a collection, by `query_key`, taking at most `budget`
+    bytes, the least recently used results being evicted first.
+
+    Results are valid for a single generation of the collection: every write starts a new one
+    (see `invalidate`), dropping every result. A query records the generation it started in, so
+    that a result read while a write went ahead is not cached.
+    """
+
+    def __init__(self, budget: int) -> None:
+        if budget <= 0:
+            raise ValueError("Cache budget must be positive")
+        self._budget = budget
+        self._entries: OrderedDict[Hashable, Tuple[List[TDocument], int]] = OrderedDict()
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self.generation = 0
+
+    @property
+    def stats(self) -> CacheStats:
+        return CacheStats(self._hits, self._misses, len(self._entries), self._size)
+
+    def invalidate(self) -> None:
+        """
+        Start a new generation, once the collection has been written to.
+        """
+        self.generation += 1
+        self._entries.clear()
+        self._size = 0
+
+    def _put(self, key: Hashable, generation: int, docs: List[TDocument]) -> None:
+        size = _footprint(docs)
+        if generation != self.generation or size > self._budget:
+            return
+        self._entries[key] = (docs, size)
+        self._size += size
+        while self._size > self._budget:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._size -= evicted
+
+    async def fetch(
+        self,
+        key: Optional[Hashable],
+        read: Callable[[], Awaitable[List[TDocument]]],
+        project: Optional[Projector] = None,
+    ) -> List[TDocument]:
+        """
+        Return the result of a query, read with `read` unless it is cached, or cannot be (its
+        `key` is None). The list returned belongs to the caller, the documents are shared with
+        the cache unless the query has a projection: the documents it built are then projected
+        again with `project` for every caller, as they are its own in an uncached query.
+        """
+        if key is None:
+            return await read()
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._hits += 1
+            self._entries.move_to_end(key)
+            return self._hand_out(entry[0], project)
+        self._misses += 1
+        generation = self.generation
+        docs = await read()
+        if key not in self._entries:
+            self._put(key, generation, docs)
+        return self._hand_out(docs, project)
+
+    @staticmethod
+    def _hand_out(docs: List[TDocument], project: Optional[Projector]) -> List[TDocument]:
+        if project is None:
+            return list(docs)
+        return [cast(TDocument, project(doc)) for doc in docs]
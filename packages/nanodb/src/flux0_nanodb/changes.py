@@ -0,0 +1,196 @@
+import asyncio
+import uuid
+from collections import deque
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Generic,
+    List,
+    Mapping,
+    Optional,
+    Self,
+    Sequence,
+    Set,
+    cast,
+)
+
+from flux0_nanodb.query import QueryFilter, compile_query
+from flux0_nanodb.types import ChangeEvent, ChangeOperation, DocumentID, TDocument
+
+# How many events a collection keeps to resume change streams from, and how many events a change
+# stream buffers before it is closed for falling behind, by default.
+HISTORY_SIZE = 1024
+BUFFER_SIZE = 1024
+
+
+class ChangeStream(Generic[TDocument]):
+    """
+    An async iterator over the changes made to a collection after it was opened, in the order
+    they were made. A change stream buffers at most `buffer_size` events for its reader: once a
+    slow reader lets more pile up, the stream is closed and reading raises a ValueError, and a
+    new stream can be resumed after the last event read (see `resume_token`).
+    """
+
+    def __init__(
+        self,
+        feed: "ChangeFeed[TDocument]",
+        match: Optional[Callable[[Mapping[str, Any]], bool]],
+        buffer_size: int,
+    ) -> None:
+        self._feed = feed
+        self._match = match
+        self._buffer_size = buffer_size
+        self._events: Deque[ChangeEvent[TDocument]] = deque()
+        self._wakeup = asyncio.Event()
+        self._overflowed = False
+        self._closed = False
+        self._error: Optional[Exception] = None
+        self.resume_token: Optional[str] = None
+
+    def _push(self, event: ChangeEvent[TDocument]) -> None:
+        if self._match is not None and not self._match(event.document):
+            return
+        if len(self._events) >= self._buffer_size:
+            # Stop buffering for a reader that cannot keep up, rather than growing unbounded.
+            self._overflowed = True
+            self._events.clear()
+            self._feed._streams.discard(self)
+        else:
+            self._events.append(event)
+        self._wakeup.set()
+
+    def __aiter__(self) -> Self:
+        return self
+
+    async def __anext__(self) -> ChangeEvent[TDocument]:
+        while not self._events:
+            if self._error is not None:
+                raise self._error
+            if self._overflowed:
+                raise ValueError(
+                    f"Change stream fell more than {self._buffer_size} events behind, resume "
+                    f"it after '{self.resume_token}'"
+                )
+            if self._closed:
+                raise StopAsyncIteration
+            self._wakeup.clear()
+            await self._wakeup.wait()
+        event = self._events.popleft()
+        self.resume_token = event.resume_token
+        return event
+
+    def close(self) -> None:
+        """
+        Stop receiving events. Pending reads end once the buffered events are consumed.
+        """
+        self._closed = True
+        self._feed._streams.discard(self)
+        self._wakeup.set()
+
+    def _take(self) -> List[ChangeEvent[TDocument]]:
+        """
+        Read every buffered event at once, without waiting for more.
+        """
+        events = list(self._events)
+        self._events.clear()
+        if events:
+            self.resume_token = events[-1].resume_token
+        return events
+
+    def _fail(self, error: Exception) -> None:
+        """
+        Stop receiving events, pending reads raising `error` once the buffered events are
+        consumed.
+        """
+        self._error = error
+        self._feed._streams.discard(self)
+        self._wakeup.set()
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc_value: Optional[BaseException],
+        exc_tb: Optional[object],
+    ) -> None:
+        self.close()
+
+
+class ChangeFeed(Generic[TDocument]):
+    """
+    Numbers the changes made to a collection and hands them out to its change streams, keeping
+    the latest ones in a bounded history for streams to resume from.
+
+    Nothing is recorded until the collection is first watched, so that collections nobody
+    watches pay for nothing but a check of `watched`.
+    """
+
+    def __init__(self, history_size: int = HISTORY_SIZE) -> None:
+        # Resume tokens only make sense to the feed that issued them, not to one recreated since.
+        self._epoch = uuid.uuid4().hex[:12]
+        self._sequence = 0
+        self._history: Deque[ChangeEvent[TDocument]] = deque(maxlen=history_size)
+        self._streams: Set[ChangeStream[TDocument]] = set()
+        self._watched = False
+
+    @property
+    def watched(self) -> bool:
+        """
+        Whether changes have to be published in full, as opposed to merely counted.
+        """
+        return self._watched
+
+    def publish(self, operation: ChangeOperation, documents: Sequence[TDocument]) -> None:
+        """
+        Record a change to the given documents: the documents as inserted or updated, or as they
+        were before being deleted.
+        """
+        if not self._watched:
+            return
+        for document in documents:
+            self._sequence += 1
+            event = ChangeEvent(
+                operation=operation,
+                sequence=self._sequence,
+                resume_token=f"{self._epoch}:{self._sequence}",
+                document_id=cast(DocumentID, document.get("id")),
+                document=document,
+            )
+            self._history.append(event)
+            for stream in list(self._streams):
+                stream._push(event)
+
+    def _resume_sequence(self, resume_after: str) -> int:
+        epoch, _, sequence = resume_after.partition(":")
+        if epoch != self._epoch or not sequence.isdigit():
+            raise ValueError(f"Invalid resume token '{resume_after}'")
+        resumed = int(sequence)
+        oldest = self._history[0].sequence if self._history else self._sequence + 1
+        if resumed > self._sequence or resumed < oldest - 1:
+            raise ValueError(f"Cannot resume after '{resume_after}', history has moved on")
+        return resumed
+
+    def watch(
+        self,
+        filters: Optional[QueryFilter] = None,
+        resume_after: Optional[str] = None,
+        buffer_size: int = BUFFER_SIZE,
+    ) -> ChangeStream[TDocument]:
+        if buffer_size <= 0:
+            raise ValueError("Buffer size must be positive")
+        resumed = self._resume_sequence(resume_after) if resume_after is not None else None
+        stream = ChangeStream(
+            self, compile_query(filters) if filters is not None else None, buffer_size
+        )
+        self._watched = True
+        if resumed is not None:
+            stream.resume_token = resume_after
+            for event in self._history:
+                if event.sequence > resumed:
+                    stream._push(event)
+        if not stream._overflowed:
+            self._streams.add(stream)
+        return stream
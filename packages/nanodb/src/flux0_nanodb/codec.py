@@ -0,0 +1,45 @@
+import json
+from datetime import datetime
+from typing import Any, Dict
+
+# Datetimes have no JSON representation, so they are written as a single-key object holding
+# their ISO 8601 form. Documents must not use this key for anything else.
+_DATETIME_KEY = "$datetime"
+
+
+def _encode_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {_DATETIME_KEY: value.isoformat()}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+_encoder = json.JSONEncoder(default=_encode_default, ensure_ascii=False, separators=(",", ":"))
+_strict_encoder = json.JSONEncoder(
+    default=_encode_default, ensure_ascii=False, separators=(",", ":"), allow_nan=False
+)
+
+
+def _decode_object(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1 and _DATETIME_KEY in obj:
+        return datetime.fromisoformat(obj[_DATETIME_KEY])
+    return obj
+
+
+_decoder = json.JSONDecoder(object_hook=_decode_object)
+
+
+def encode(value: Any, allow_nan: bool = True) -> str:
+    """
+    Encode a value holding documents as compact JSON, preserving datetimes (naive or aware).
+
+    NaN and infinite numbers are written as in JavaScript unless `allow_nan` is false, in which
+    case they raise a ValueError, as standard JSON cannot represent them.
+    """
+    return (_encoder if allow_nan else _strict_encoder).encode(value)
+
+
+def decode(text: str) -> Any:
+    """
+    Decode JSON produced by `encode`.
+    """
+    return _decoder.decode(text)
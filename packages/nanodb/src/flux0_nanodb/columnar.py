@@ -0,0 +1,402 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    MutableSequence,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+    cast,
+    overload,
+)
+
+from flux0_nanodb.codec import decode, encode
+from flux0_nanodb.types import TDocument
+
+# Columnar snapshot files start with this magic, followed by the length of their JSON header
+# (8 bytes) and the header itself. Every section the header points to is 8-byte aligned.
+MAGIC = b"NANODBC1"
+
+# Type tags of column values, one byte per row. Values of the other types (nested documents,
+# lists, integers beyond 64 bits, datetimes in other timezones) are read from the document.
+_ABSENT, _NULL, _FALSE, _TRUE, _INT, _FLOAT, _STR, _NAIVE, _UTC, _OTHER = range(10)
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+_INT64_MIN, _INT64_MAX = -(2**63), 2**63 - 1
+
+# Returned by columns for rows missing the field, and for values they do not hold.
+_MISSING = object()
+_UNKNOWN = object()
+
+
+def _pad(size: int) -> int:
+    return -size % 8
+
+
+class _Column:
+    """
+    The values of a field in every row: a type tag, and a fixed-width value for scalar types.
+    Strings are stored in a shared heap, the value being their offset in it.
+    """
+
+    def __init__(self, snapshot: "ColumnarSnapshot", tags: memoryview, values: memoryview) -> None:
+        self._snapshot = snapshot
+        self._tags = tags
+        self._ints = values.cast("q")
+        self._floats = values.cast("d")
+
+    def value(self, row: int) -> Any:
+        tag = self._tags[row]
+        if tag == _ABSENT:
+            return _MISSING
+        if tag == _INT:
+            return self._ints[row]
+        if tag == _STR:
+            return self._snapshot._string(self._ints[row])
+        if tag == _FLOAT:
+            return self._floats[row]
+        if tag == _UTC:
+            return _EPOCH_UTC + self._ints[row] * _MICROSECOND
+        if tag == _NAIVE:
+            return _EPOCH + self._ints[row] * _MICROSECOND
+        if tag == _TRUE:
+            return True
+        if tag == _FALSE:
+            return False
+        if tag == _NULL:
+            return None
+        return _UNKNOWN
+
+    def release(self) -> None:
+        self._ints.release()
+        self._floats.release()
+        self._tags.release()
+
+
+class ColumnarSnapshot:
+    """
+    A read-only snapshot of a collection's slots, mapped in memory.
+
+    Each document is stored as JSON in a blob region, located through a table of offsets;
+    tombstones are empty. Fields chosen when writing the snapshot (typically the indexed ones)
+    are also stored as fixed-width columns, so that filters and indexes can read them without
+    decoding documents, and documents are only decoded when they are actually needed. Opening a
+    snapshot reads nothing but its header: the OS pages the rest in as it is accessed.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._map)
+        self._view = view
+        self.columns: Dict[str, _Column] = {}
+        if bytes(view[:8]) != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a columnar snapshot")
+        (header_size,) = struct.unpack_from("<Q", view, 8)
+        header = decode(bytes(view[16 : 16 + header_size]).decode())
+        if header["byteorder"] != sys.byteorder:
+            self.close()
+            raise ValueError(f"{path} was written on a machine of another byte order")
+        self.rows: int = header["rows"]
+        self.live: int = header["live"]
+        self._offsets = view[header["offsets"] : header["offsets"] + 8 * (self.rows + 1)].cast("Q")
+        self._strings: int = header["strings"]
+        self._blobs: int = header["blobs"]
+        for column in header["columns"]:
+            tags = view[column["tags"] : column["tags"] + self.rows]
+            values = view[column["values"] : column["values"] + 8 * self.rows]
+            self.columns[column["field"]] = _Column(self, tags, values)
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def is_live(self, row: int) -> bool:
+        return self._offsets[row + 1] > self._offsets[row]
+
+    def raw(self, row: int) -> bytes:
+        """
+        The JSON of a document, as written by `flux0_nanodb.codec.encode`.
+        """
+        start = self._blobs + self._offsets[row]
+        return bytes(self._view[start : self._blobs + self._offsets[row + 1]])
+
+    def document(self, row: int) -> Dict[str, Any]:
+        return cast(Dict[str, Any], decode(self.raw(row).decode()))
+
+    def _string(self, offset: int) -> str:
+        start = self._strings + offset
+        (size,) = struct.unpack_from("<I", self._view, start)
+        return bytes(self._view[start + 4 : start + 4 + size]).decode()
+
+    def close(self) -> None:
+        for column in self.columns.values():
+            column.release()
+        self.columns = {}
+        if hasattr(self, "_offsets"):
+            self._offsets.release()
+        self._view.release()
+        self._map.close()
+
+
+class _Row(Mapping[str, Any]):
+    """
+    The fields of a document in a snapshot, read from the columns when they hold them and from
+    the document, decoded on first use, otherwise.
+    """
+
+    __slots__ = ("_snapshot", "_row", "_document")
+
+    def __init__(self, snapshot: ColumnarSnapshot, row: int) -> None:
+        self._snapshot = snapshot
+        self._row = row
+        self._document: Optional[Dict[str, Any]] = None
+
+    def _load(self) -> Dict[str, Any]:
+        if self._document is None:
+            self._document = self._snapshot.document(self._row)
+        return self._document
+
+    def get(self, key: str, default: Any = None) -> Any:
+        column = self._snapshot.columns.get(key)
+        if column is not None:
+            value = column.value(self._row)
+            if value is _MISSING:
+                return default
+            if value is not _UNKNOWN:
+                return value
+        return self._load().get(key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._load())
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+
+# Marks the slots whose document has not been decoded yet.
+_PENDING: Any = object()
+
+
+class SnapshotSlots(MutableSequence[Optional[TDocument]]):
+    """
+    Document slots (see `flux0_nanodb.memory.MemoryDocumentCollection`) restored from a columnar
+    snapshot. Documents are decoded from the snapshot the first time they are read, so that
+    memory grows with the documents in use rather than with the whole collection; slots can be
+    replaced and appended to like a list.
+    """
+
+    def __init__(
+        self,
+        snapshot: ColumnarSnapshot,
+        items: Optional[List[Any]] = None,
+        rows: Optional["array[int]"] = None,
+    ) -> None:
+        self.snapshot = snapshot
+        self._items: List[Any] = (
+            [_PENDING if snapshot.is_live(row) else None for row in range(len(snapshot))]
+            if items is None
+            else items
+        )
+        # The snapshot row of each pending slot, when slots have moved since the snapshot.
+        self._rows = rows
+
+    def _snapshot_row(self, position: int) -> int:
+        return position if self._rows is None else self._rows[position]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @overload
+    def __getitem__(self, index: int) -> Optional[TDocument]: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> MutableSequence[Optional[TDocument]]: ...
+
+    def __getitem__(
+        self, index: Union[int, slice]
+    ) -> Union[Optional[TDocument], MutableSequence[Optional[TDocument]]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        item = self._items[index]
+        if item is _PENDING:
+            item = self.snapshot.document(self._snapshot_row(index))
+            self._items[index] = item
+        return cast(Optional[TDocument], item)
+
+    @overload
+    def __setitem__(self, index: int, value: Optional[TDocument]) -> None: ...
+
+    @overload
+    def __setitem__(self, index: slice, value: Iterable[Optional[TDocument]]) -> None: ...
+
+    def __setitem__(self, index: Union[int, slice], value: Any) -> None:
+        if isinstance(index, slice):
+            raise TypeError("Slots cannot be assigned by slice")
+        self._items[index] = value
+
+    def __delitem__(self, index: Union[int, slice]) -> None:
+        raise TypeError("Slots cannot be deleted, only emptied")
+
+    def insert(self, index: int, value: Optional[TDocument]) -> None:
+        if index != len(self._items):
+            raise TypeError("Slots can only be appended")
+        self._items.append(value)
+
+    def extend(self, values: Iterable[Optional[TDocument]]) -> None:
+        self._items.extend(values)
+
+    def row(self, position: int) -> Optional[Mapping[str, Any]]:
+        """
+        The fields of the document in a slot, without decoding it if it is still pending.
+        """
+        item = self._items[position]
+        if item is _PENDING:
+            return _Row(self.snapshot, self._snapshot_row(position))
+        return cast(Optional[Mapping[str, Any]], item)
+
+    def raw(self, position: int) -> Optional[bytes]:
+        """
+        The JSON of the document in a slot if it is still pending, None otherwise.
+        """
+        if self._items[position] is _PENDING:
+            return self.snapshot.raw(self._snapshot_row(position))
+        return None
+
+    def copy(self) -> "SnapshotSlots[TDocument]":
+        return SnapshotSlots(self.snapshot, list(self._items), self._rows)
+
+    def compacted(self) -> "SnapshotSlots[TDocument]":
+        """
+        Return the slots without their tombstones, leaving pending documents pending.
+        """
+        kept = [position for position, item in enumerate(self._items) if item is not None]
+        rows = array("q", (self._snapshot_row(position) for position in kept))
+        return SnapshotSlots(self.snapshot, [self._items[position] for position in kept], rows)
+
+
+def _encode_value(value: Any, strings: bytearray) -> Tuple[int, int]:
+    """
+    Return the type tag and the 64-bit value of a field in a column.
+    """
+    if isinstance(value, bool):
+        return (_TRUE if value else _FALSE), 0
+    if isinstance(value, int):
+        if _INT64_MIN <= value <= _INT64_MAX:
+            return _INT, value
+        return _OTHER, 0
+    if isinstance(value, float):
+        return _FLOAT, struct.unpack("<q", struct.pack("<d", value))[0]
+    if isinstance(value, str):
+        offset = len(strings)
+        data = value.encode()
+        strings += struct.pack("<I", len(data)) + data
+        return _STR, offset
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            return _NAIVE, (value - _EPOCH) // _MICROSECOND
+        if value.utcoffset() == timedelta(0):
+            return _UTC, (value - _EPOCH_UTC) // _MICROSECOND
+        return _OTHER, 0
+    if value is None:
+        return _NULL, 0
+    return _OTHER, 0
+
+
+def write_snapshot(
+    path: Union[str, Path], slots: Sequence[Optional[Mapping[str, Any]]], fields: Sequence[str]
+) -> None:
+    """
+    Write document slots (tombstones included) to a columnar snapshot, with a column for each of
+    the given fields, and make it durable. Documents still pending in `SnapshotSlots` are copied
+    from their snapshot without being decoded.
+    """
+    blobs = bytearray()
+    strings = bytearray()
+    offsets = array("Q", [0])
+    tags = {field: bytearray() for field in fields}
+    values: Dict[str, "array[int]"] = {field: array("q") for field in fields}
+    live = 0
+    for position in range(len(slots)):
+        row: Optional[Mapping[str, Any]]
+        raw: Optional[bytes] = None
+        if isinstance(slots, SnapshotSlots):
+            row, raw = slots.row(position), slots.raw(position)
+        else:
+            row = slots[position]
+        if row is not None:
+            live += 1
+            blobs += raw if raw is not None else encode(row).encode()
+        offsets.append(len(blobs))
+        for field in fields:
+            tag, value = _ABSENT, 0
+            if row is not None and field in row:
+                tag, value = _encode_value(row[field], strings)
+            tags[field].append(tag)
+            values[field].append(value)
+
+    # Lay out the sections after the header, whose size depends on their offsets: reserve
+    # enough room for it first.
+    sections: List[Tuple[str, bytes]] = [("offsets", offsets.tobytes())]
+    for field in fields:
+        sections.append((f"tags:{field}", bytes(tags[field])))
+        sections.append((f"values:{field}", values[field].tobytes()))
+    sections.append(("strings", bytes(strings)))
+    sections.append(("blobs", bytes(blobs)))
+
+    def header(start: int) -> bytes:
+        where = {}
+        for name, data in sections:
+            where[name] = start
+            start += len(data) + _pad(len(data))
+        content = {
+            "byteorder": sys.byteorder,
+            "rows": len(slots),
+            "live": live,
+            "offsets": where["offsets"],
+            "strings": where["strings"],
+            "blobs": where["blobs"],
+            "columns": [
+                {"field": f, "tags": where[f"tags:{f}"], "values": where[f"values:{f}"]}
+                for f in fields
+            ],
+        }
+        return encode(content).encode()
+
+    # The header holds the offsets of the sections that follow it: grow the room left for it
+    # until it fits.
+    size = 0
+    while True:
+        encoded = header(size)
+        if 16 + len(encoded) <= size:
+            break
+        size = 16 + len(encoded)
+        size += _pad(size)
+
+    with open(path, "wb") as f:
+        f.write(MAGIC + struct.pack("<Q", len(encoded)) + encoded)
+        f.write(b"\0" * (size - 16 - len(encoded)))
+        for _, data in sections:
+            f.write(data)
+            f.write(b"\0" * _pad(len(data)))
+        f.flush()
+        os.fsync(f.fileno())
@@ -1,18 +1,11 @@
-from typing import Any, Dict, List, Mapping, Type, get_type_hints
+from typing import Any, Dict, List, Mapping, Type
 
+from flux0_nanodb.schema import compile_schema
 from flux0_nanodb.types import JSONPatchOperation
 
 
 def validate_is_total(document: Mapping[str, Any], schema: Type[Mapping[str, Any]]) -> None:
-    # Use the __required_keys__ attribute if it exists, otherwise fall back to all type hints.
-    required_keys = getattr(schema, "__required_keys__", get_type_hints(schema).keys())
-    missing_keys = [key for key in required_keys if key not in document]
-
-    if missing_keys:
-        raise TypeError(
-            f"TypedDict '{schema.__qualname__}' is missing required keys: {missing_keys}. "
-            f"Expected at least the keys: {list(required_keys)}."
-        )
+    compile_schema(schema).validate(document)
 
 
 def convert_patch(patch: List[JSONPatchOperation]) -> List[Dict[str, Any]]:
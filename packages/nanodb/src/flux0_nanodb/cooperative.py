@@ -0,0 +1,60 @@
+import asyncio
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from flux0_nanodb.sorting import sort_documents
+from flux0_nanodb.types import SortingOrder, TDocument
+
+# Reads expected to examine more documents than this are cooperative by default: rather than
+# holding the event loop until they are done, they let other tasks run as they go.
+SCAN_THRESHOLD = 10_000
+# How many documents a cooperative read examines between two turns of the event loop.
+SCAN_CHUNK = 1_000
+
+# The documents matching a query, with a None wherever the reader may let other tasks run.
+Matches = Iterator[Optional[TDocument]]
+
+
+def paginate(matches: Matches[TDocument], start: int, stop: Optional[int]) -> Matches[TDocument]:
+    """
+    Skip the first `start` matching documents and stop after the `stop`th, passing the Nones
+    through.
+    """
+    if stop is not None and stop <= start:
+        return
+    seen = 0
+    for doc in matches:
+        if doc is None:
+            yield None
+            continue
+        seen += 1
+        if seen > start:
+            yield doc
+        if stop is not None and seen >= stop:
+            return
+
+
+async def collect(
+    matches: Matches[TDocument],
+    start: int,
+    stop: Optional[int],
+    sort: Optional[Sequence[Tuple[str, SortingOrder]]],
+    threshold: Optional[int],
+) -> List[TDocument]:
+    """
+    Read a page of matching documents, sorted if `sort` is given, letting other tasks run at every
+    None. Sorting more than `threshold` documents happens on a worker thread, which is safe as
+    documents are never modified in place.
+    """
+    docs: List[TDocument] = []
+    for doc in matches if sort else paginate(matches, start, stop):
+        if doc is None:
+            await asyncio.sleep(0)
+        else:
+            docs.append(doc)
+    if not sort:
+        return docs
+    if threshold is not None and len(docs) > threshold:
+        docs = await asyncio.to_thread(sort_documents, docs, sort, stop)
+    else:
+        docs = sort_documents(docs, sort, k=stop)
+    return docs[start:]
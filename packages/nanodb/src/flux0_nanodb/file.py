@@ -0,0 +1,491 @@
+import asyncio
+import os
+from enum import Enum
+from pathlib import Path
+from typing import (
+    Any,
+    BinaryIO,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    MutableSequence,
+    Optional,
+    Self,
+    Sequence,
+    Type,
+    Union,
+    cast,
+)
+
+from flux0_nanodb.api import DocumentCollection, DocumentDatabase
+from flux0_nanodb.cache import ResultCache
+from flux0_nanodb.codec import decode, encode
+from flux0_nanodb.columnar import ColumnarSnapshot, SnapshotSlots, write_snapshot
+from flux0_nanodb.cooperative import SCAN_THRESHOLD
+from flux0_nanodb.index import OrderedIndex
+from flux0_nanodb.memory import MemoryDocumentCollection
+from flux0_nanodb.query import QueryFilter
+from flux0_nanodb.schema import compile_schema
+from flux0_nanodb.types import (
+    BaseDocument,
+    DeleteResult,
+    InsertManyResult,
+    InsertOneResult,
+    JSONPatchOperation,
+    TDocument,
+    UpdateManyResult,
+    UpdateOneResult,
+)
+
+# Lists the collections of the latest snapshot, whose documents are each in a columnar file.
+SNAPSHOT_FILE = "snapshot.json"
+
+
+class FsyncPolicy(Enum):
+    ALWAYS = "always"  # every write is on disk before it returns
+    GROUP = "group"  # writes are flushed to disk together, every `group_commit_interval_ms`
+    OS = "os"  # writes are handed to the OS, which decides when they reach the disk
+
+
+def _fsync_and_close(fd: int) -> None:
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WriteAheadLog:
+    """
+    An append-only log of writes, one JSON record per line, each numbered with a sequence number.
+
+    The log is split into segments named after the sequence number of their first record. Taking
+    a snapshot starts a new segment, so that the records it covers can be dropped by deleting
+    the segments that precede it.
+    """
+
+    def __init__(self, directory: Path, fsync: FsyncPolicy) -> None:
+        self._directory = directory
+        self._fsync = fsync
+        self._file: Optional[BinaryIO] = None
+        # Records written since the last fsync, and the fsync in progress, if any.
+        self._dirty = False
+        self._syncing: Optional[asyncio.Future[None]] = None
+        self.sequence = 0
+
+    def segments(self) -> List[Path]:
+        return sorted(self._directory.glob("wal-*.log"))
+
+    def read(self) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over the records of every segment, in order.
+
+        A record cut short by a crash can only be the last one of a segment; it was never
+        acknowledged, so it is dropped from the segment.
+        """
+        for segment in self.segments():
+            with open(segment, "rb+") as f:
+                position = 0
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("Incomplete record")
+                        record = decode(line.decode())
+                    except ValueError:
+                        if f.read(1):
+                            raise ValueError(f"Corrupted record in {segment.name}")
+                        f.truncate(position)
+                        break
+                    position += len(line)
+                    yield record
+
+    def open(self, sequence: int) -> None:
+        self.sequence = sequence
+        path = self._directory / f"wal-{sequence + 1:020d}.log"
+        self._file = open(path, "ab")
+
+    def append(self, record: Dict[str, Any]) -> None:
+        assert self._file is not None, "The log is not open"
+        self.sequence += 1
+        self._file.write(encode({"n": self.sequence, **record}).encode() + b"\n")
+        # Hand the record to the OS right away, so that it survives the process crashing.
+        self._file.flush()
+        self._dirty = True
+
+    async def commit(self) -> None:
+        """
+        Wait until the records appended so far are as durable as the fsync policy requires.
+        """
+        if self._fsync == FsyncPolicy.ALWAYS:
+            await self.sync()
+
+    async def sync(self) -> None:
+        """
+        Wait until the records appended so far are on disk.
+        """
+        if self._dirty and self._file is not None:
+            self._dirty = False
+            # fsync a duplicate of the descriptor, which stays valid even if the segment is
+            # closed in the meantime.
+            fd = os.dup(self._file.fileno())
+            self._syncing = asyncio.ensure_future(asyncio.to_thread(_fsync_and_close, fd))
+        # A sync already in progress covers every record appended before it started.
+        syncing = self._syncing
+        if syncing is not None:
+            await asyncio.shield(syncing)
+
+    def rotate(self) -> List[Path]:
+        """
+        Start a new segment and return the previous ones.
+        """
+        assert self._file is not None, "The log is not open"
+        if self._dirty:
+            os.fsync(self._file.fileno())
+            self._dirty = False
+        self._file.close()
+        self.open(self.sequence)
+        current = self._directory / f"wal-{self.sequence + 1:020d}.log"
+        return [segment for segment in self.segments() if segment != current]
+
+    def close(self) -> None:
+        if self._file is not None:
+            if self._dirty:
+                os.fsync(self._file.fileno())
+                self._dirty = False
+            self._file.close()
+            self._file = None
+
+
+class _LoggedCollection(MemoryDocumentCollection[TDocument]):
+    """
+    An in-memory collection that writes every change to the write-ahead log of its database.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        schema: Type[TDocument],
+        log: WriteAheadLog,
+        read_only: bool = False,
+        scan_threshold: Optional[int] = SCAN_THRESHOLD,
+        cache_budget: Optional[int] = None,
+    ) -> None:
+        super().__init__(name, schema, read_only, scan_threshold, cache_budget)
+        self._log = log
+
+    def _journal(self, record: Dict[str, Any]) -> None:
+        super()._journal(record)
+        self._log.append({"c": self._name, **record})
+
+    def _row(
+        self, slots: Sequence[Optional[TDocument]], position: int
+    ) -> Optional[Mapping[str, Any]]:
+        if isinstance(slots, SnapshotSlots):
+            return slots.row(position)
+        return slots[position]
+
+    def _compact(self) -> None:
+        if isinstance(self._slots, SnapshotSlots):
+            self._slots = self._slots.compacted()
+            self._rebuild_indexes()
+        else:
+            super()._compact()
+
+    def _state(self) -> Dict[str, Any]:
+        # Stored documents are never modified in place, only replaced, so a shallow copy of the
+        # slots is a consistent picture of the collection.
+        slots = self._slots
+        return {
+            "slots": slots.copy() if isinstance(slots, SnapshotSlots) else list(slots),
+            "indexes": [
+                {
+                    "fields": list(index.fields),
+                    "unique": index.unique,
+                    "ordered": isinstance(index, OrderedIndex),
+                }
+                for index in self._indexes.values()
+            ],
+        }
+
+    def _restore(
+        self, slots: MutableSequence[Optional[TDocument]], indexes: Sequence[Mapping[str, Any]]
+    ) -> None:
+        self._slots = slots
+        if isinstance(slots, SnapshotSlots):
+            self._size = slots.snapshot.live
+        else:
+            self._size = sum(1 for doc in slots if doc is not None)
+        # Indexed fields are columns of the snapshot, so this decodes no document.
+        for index in indexes:
+            self._create_index(tuple(index["fields"]), index["unique"], index["ordered"])
+
+    async def create_index(
+        self, field: Union[str, Sequence[str]], unique: bool = False, ordered: bool = False
+    ) -> None:
+        await super().create_index(field, unique, ordered)
+        await self._log.commit()
+
+    async def insert_one(self, document: TDocument) -> InsertOneResult:
+        result = await super().insert_one(document)
+        await self._log.commit()
+        return result
+
+    async def insert_many(self, documents: Sequence[TDocument]) -> InsertManyResult:
+        result = await super().insert_many(documents)
+        await self._log.commit()
+        return result
+
+    async def update_one(
+        self, filters: QueryFilter, patch: List[JSONPatchOperation], upsert: bool = False
+    ) -> UpdateOneResult:
+        result = await super().update_one(filters, patch, upsert)
+        await self._log.commit()
+        return result
+
+    async def update_many(
+        self, filters: QueryFilter, patch: List[JSONPatchOperation], upsert: bool = False
+    ) -> UpdateManyResult:
+        result = await super().update_many(filters, patch, upsert)
+        await self._log.commit()
+        return result
+
+    async def delete_one(self, filters: QueryFilter) -> DeleteResult[TDocument]:
+        result = await super().delete_one(filters)
+        await self._log.commit()
+        return result
+
+    async def delete_many(self, filters: QueryFilter) -> DeleteResult[TDocument]:
+        result = await super().delete_many(filters)
+        await self._log.commit()
+        return result
+
+
+class FileDocumentDatabase(DocumentDatabase):
+    """
+    A document database that serves reads and writes from memory, and persists every write to
+    an append-only log in a directory, along with periodic snapshots of all collections.
+
+    The database has to be entered as an async context manager: entering it loads the latest
+    snapshot and replays the log written since, exiting it takes a final snapshot. Collections
+    restored from disk are returned by `create_collection` instead of raising, so that
+    applications can declare their collections and indexes on every start.
+
+    Snapshots are columnar (see `flux0_nanodb.columnar`) and mapped in memory when loaded:
+    indexes are rebuilt from the columns of the indexed fields, and documents are only decoded
+    once read, so that starting up does not depend on the size of the collections.
+
+    `fsync` decides when writes reach the disk. With `FsyncPolicy.GROUP`, writes return as soon
+    as they are handed to the OS and are flushed to disk together every
+    `group_commit_interval_ms`, so that frequent small writes share a single fsync; a power loss
+    can lose at most that much. Snapshots are taken every `snapshot_interval` seconds if
+    anything was written, after which the log they cover is deleted.
+
+    With `read_only`, reads return read-only views of the documents, as with
+    `MemoryDocumentDatabase`.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        fsync: FsyncPolicy = FsyncPolicy.GROUP,
+        group_commit_interval_ms: int = 10,
+        snapshot_interval: Optional[float] = 300.0,
+        read_only: bool = False,
+    ) -> None:
+        self._path = Path(path)
+        self._fsync = fsync
+        self._group_commit_interval = group_commit_interval_ms / 1000
+        self._snapshot_interval = snapshot_interval
+        self._read_only = read_only
+        self._log = WriteAheadLog(self._path, fsync)
+        self._collections: dict[str, _LoggedCollection[Any]] = {}
+        self._snapshot_sequence = 0
+        self._snapshot_lock = asyncio.Lock()
+        self._tasks: List[asyncio.Task[None]] = []
+        self._snapshots: List[ColumnarSnapshot] = []
+
+    async def __aenter__(self) -> Self:
+        self._path.mkdir(parents=True, exist_ok=True)
+        sequence = await asyncio.to_thread(self._load)
+        self._snapshot_sequence = sequence
+        self._log.open(sequence)
+        if self._fsync == FsyncPolicy.GROUP:
+            self._tasks.append(asyncio.create_task(self._group_commit()))
+        if self._snapshot_interval is not None:
+            self._tasks.append(asyncio.create_task(self._snapshot_periodically()))
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc_value: Optional[BaseException],
+        exec_tb: Optional[object],
+    ) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        if self._log.sequence > self._snapshot_sequence:
+            await self.snapshot()
+        self._log.close()
+        for snapshot in self._snapshots:
+            snapshot.close()
+        self._snapshots.clear()
+
+    def _load(self) -> int:
+        """
+        Restore the collections from the snapshot and the log, returning the sequence number of
+        the last record applied.
+        """
+        sequence = 0
+        snapshot_path = self._path / SNAPSHOT_FILE
+        if snapshot_path.exists():
+            snapshot = decode(snapshot_path.read_text())
+            sequence = snapshot["n"]
+            for name, state in snapshot["collections"].items():
+                collection: _LoggedCollection[Any] = _LoggedCollection(
+                    name, BaseDocument, self._log, self._read_only
+                )
+                slots: MutableSequence[Optional[Any]]
+                if "file" in state:
+                    columnar = ColumnarSnapshot(self._path / state["file"])
+                    self._snapshots.append(columnar)
+                    slots = SnapshotSlots(columnar)
+                else:
+                    slots = list(state["slots"])  # written before snapshots were columnar
+                collection._restore(slots, state["indexes"])
+                self._collections[name] = collection
+
+        for record in self._log.read():
+            if record["n"] <= sequence:
+                continue  # already part of the snapshot
+            if record["n"] != sequence + 1:
+                raise ValueError(f"Missing log records {sequence + 1} to {record['n'] - 1}")
+            self._replay(record)
+            sequence = record["n"]
+        return sequence
+
+    def _replay(self, record: Mapping[str, Any]) -> None:
+        name = record["c"]
+        if record["op"] == "create":
+            self._collections[name] = _LoggedCollection(
+                name, BaseDocument, self._log, self._read_only
+            )
+        elif record["op"] == "drop":
+            del self._collections[name]
+        else:
+            self._collections[name]._apply(record)
+
+    async def _group_commit(self) -> None:
+        while True:
+            await asyncio.sleep(self._group_commit_interval)
+            await self._log.sync()
+
+    async def _snapshot_periodically(self) -> None:
+        assert self._snapshot_interval is not None
+        while True:
+            await asyncio.sleep(self._snapshot_interval)
+            if self._log.sequence > self._snapshot_sequence:
+                await self.snapshot()
+
+    async def snapshot(self) -> None:
+        """
+        Write a snapshot of every collection and delete the log it makes obsolete.
+        Writes can go on while the snapshot is being written.
+        """
+        async with self._snapshot_lock:
+            sequence = self._log.sequence
+            state = {
+                "n": sequence,
+                "collections": {
+                    name: collection._state() for name, collection in self._collections.items()
+                },
+            }
+            obsolete = self._log.rotate()
+            await asyncio.to_thread(self._write_snapshot, state, obsolete)
+            self._snapshot_sequence = sequence
+
+    def _write_snapshot(self, state: Mapping[str, Any], obsolete: Sequence[Path]) -> None:
+        collections: Dict[str, Any] = {}
+        for i, (name, collection) in enumerate(state["collections"].items()):
+            # Indexed fields get a column, to rebuild the indexes without decoding documents.
+            fields = list(
+                dict.fromkeys(f for index in collection["indexes"] for f in index["fields"])
+            )
+            file = f"{state['n']:020d}-{i}.cols"
+            write_snapshot(self._path / file, collection["slots"], fields)
+            collections[name] = {"file": file, "indexes": collection["indexes"]}
+
+        path = self._path / SNAPSHOT_FILE
+        temporary = path.with_suffix(".tmp")
+        with open(temporary, "wb") as f:
+            f.write(encode({"n": state["n"], "collections": collections}).encode())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+        # Make the rename itself durable before dropping the log it replaces.
+        fd = os.open(self._path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        for segment in obsolete:
+            segment.unlink(missing_ok=True)
+        files = {collection["file"] for collection in collections.values()}
+        for columnar in self._path.glob("*.cols"):
+            # Snapshots still mapped by collections stay readable once unlinked.
+            if columnar.name not in files:
+                columnar.unlink()
+
+    async def sync(self) -> None:
+        """
+        Wait until every write made so far is on disk, whatever the fsync policy.
+        """
+        await self._log.sync()
+
+    async def create_collection(
+        self,
+        name: str,
+        schema: Type[TDocument],
+        partition_key: Optional[str] = None,
+        scan_threshold: Optional[int] = SCAN_THRESHOLD,
+        cache_budget: Optional[int] = None,
+    ) -> DocumentCollection[TDocument]:
+        """
+        Reads of the collection expected to examine more than `scan_threshold` documents let
+        other tasks run as they go, and a `cache_budget` (in bytes) caches query results until
+        the next write, see `MemoryDocumentCollection`.
+        """
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = _LoggedCollection(
+                name, schema, self._log, self._read_only, scan_threshold, cache_budget
+            )
+            self._collections[name] = collection
+            self._log.append({"c": name, "op": "create"})
+            await self._log.commit()
+        else:
+            # Collections restored from disk do not know their schema (nor their read options)
+            # until they are declared.
+            collection._schema = compile_schema(schema)
+            collection._scan_threshold = scan_threshold
+            collection._cache = ResultCache(cache_budget) if cache_budget is not None else None
+        if partition_key is not None:
+            # The partition key is indexed instead, which serves pinned queries just as well.
+            await collection.create_index(partition_key)
+        return cast(DocumentCollection[TDocument], collection)
+
+    async def get_collection(
+        self, name: str, schema: Type[TDocument]
+    ) -> DocumentCollection[TDocument]:
+        collection = self._collections.get(name)
+        if collection is None:
+            raise ValueError(f"Collection '{name}' does not exist")
+        return cast(DocumentCollection[TDocument], collection)
+
+    async def delete_collection(self, name: str) -> None:
+        if name not in self._collections:
+            raise ValueError(f"Collection '{name}' does not exist")
+        del self._collections[name]
+        self._log.append({"c": name, "op": "drop"})
+        await self._log.commit()
@@ -0,0 +1,420 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from flux0_nanodb.query import LiteralValue
+
+
+def is_indexable(value: Any) -> bool:
+    # Only literal values can ever satisfy a comparison, so they are the only ones worth indexing.
+    return isinstance(value, (str, int, float, bool, datetime))
+
+
+# Ordered keys are prefixed with a rank so that values which cannot be compared with each other
+# (numbers, strings, naive and aware datetimes) live in separate, contiguous runs of the index.
+OrderedKey = Tuple[Any, ...]
+
+
+def ordered_key(value: Any) -> Optional[OrderedKey]:
+    if isinstance(value, (int, float)):
+        if value != value:  # NaN has no place in an ordering
+            return None
+        return (0, value)
+    if isinstance(value, str):
+        return (1, value)
+    if isinstance(value, datetime):
+        return (2, value) if value.tzinfo is None else (3, value)
+    return None
+
+
+# Above this many entries, removing them from an ordered index rewrites it in a single pass.
+_BULK_REMOVE_THRESHOLD = 32
+
+# Sorts after every ordered key, whatever its rank.
+_HIGHEST: OrderedKey = (4,)
+
+
+class Index(ABC):
+    """
+    An index over one or more document fields, mapping their values to the positions of the
+    documents holding them. Documents missing a field, or holding a non-literal value in it, are
+    not indexed.
+    """
+
+    def __init__(self, fields: Sequence[str], unique: bool = False) -> None:
+        self.fields = tuple(fields)
+        self.unique = unique
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """
+        The number of indexed documents.
+        """
+        pass
+
+    @abstractmethod
+    def check(self, document: Mapping[str, Any], position: Optional[int] = None) -> None:
+        """
+        Raise a ValueError if adding the document would violate the uniqueness of the index.
+        `position` is the document's own position when it is being updated in place.
+        """
+        pass
+
+    @abstractmethod
+    def add(self, position: int, document: Mapping[str, Any]) -> None:
+        pass
+
+    def add_many(self, entries: Sequence[Tuple[int, Mapping[str, Any]]]) -> None:
+        """
+        Add several documents at once. Either all of them are added, or a ValueError is raised
+        and the index is left unchanged.
+        """
+        added: List[Tuple[int, Mapping[str, Any]]] = []
+        try:
+            for position, document in entries:
+                self.add(position, document)
+                added.append((position, document))
+        except ValueError:
+            for position, document in added:
+                self.remove(position, document)
+            raise
+
+    @abstractmethod
+    def remove(self, position: int, document: Mapping[str, Any]) -> None:
+        pass
+
+    def remove_many(self, entries: Sequence[Tuple[int, Mapping[str, Any]]]) -> None:
+        for position, document in entries:
+            self.remove(position, document)
+
+    @abstractmethod
+    def clear(self) -> None:
+        pass
+
+    @abstractmethod
+    def lookup(self, value: LiteralValue) -> List[int]:
+        """
+        Return the ascending positions of the documents whose (first) field equals `value`.
+        The returned list may be owned by the index and must not be mutated.
+        """
+        pass
+
+
+class HashIndex(Index):
+    """
+    A hash index over a single field, answering equality lookups in constant time.
+
+    Each distinct value maps to the positions of the documents holding it, kept in ascending order
+    so that lookups preserve insertion order.
+    """
+
+    def __init__(self, field: str, unique: bool = False) -> None:
+        super().__init__((field,), unique)
+        self.field = field
+        self._entries: Dict[Any, List[int]] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def check(self, document: Mapping[str, Any], position: Optional[int] = None) -> None:
+        if not self.unique:
+            return
+        value = document.get(self.field)
+        if not is_indexable(value):
+            return
+        positions = self._entries.get(value)
+        if positions and positions != [position]:
+            raise ValueError(f"Duplicate value {value!r} for unique index on field '{self.field}'")
+
+    def add(self, position: int, document: Mapping[str, Any]) -> None:
+        value = document.get(self.field)
+        if not is_indexable(value):
+            return
+        self.check(document, position)
+        insort(self._entries.setdefault(value, []), position)
+        self._size += 1
+
+    def remove(self, position: int, document: Mapping[str, Any]) -> None:
+        value = document.get(self.field)
+        if not is_indexable(value):
+            return
+        positions = self._entries.get(value)
+        if not positions:
+            return
+        i = bisect_left(positions, position)
+        if i < len(positions) and positions[i] == position:
+            positions.pop(i)
+            self._size -= 1
+        if not positions:
+            del self._entries[value]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._size = 0
+
+    def lookup(self, value: LiteralValue) -> List[int]:
+        if not is_indexable(value):
+            return []
+        return self._entries.get(value, [])
+
+    def groups(self) -> Iterator[Tuple[Any, int]]:
+        """
+        Iterate over the distinct indexed values, with the number of documents holding each.
+        """
+        for value, positions in self._entries.items():
+            yield value, len(positions)
+
+
+class OrderedIndex(Index):
+    """
+    An ordered index over one or more fields, answering prefix and range lookups in
+    O(log n + k) and iterating documents in field order.
+
+    Entries are `(key, position)` pairs kept in a sorted list, where `key` holds the ordered key
+    of every indexed field, so documents sharing a key are ordered by insertion. A compound index
+    on `(a, b)` serves equality on `a` alone, and equality on `a` combined with a range on `b`,
+    as long as no document holding `a` is left out for missing `b` (see `complete`).
+    """
+
+    def __init__(self, fields: Sequence[str], unique: bool = False) -> None:
+        super().__init__(fields, unique)
+        self._entries: List[Tuple[Tuple[OrderedKey, ...], int]] = []
+        # The number of documents left out of the index by how many leading fields they hold.
+        self._omitted = [0] * len(self.fields)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _key(self, document: Mapping[str, Any]) -> Optional[Tuple[OrderedKey, ...]]:
+        key = []
+        for field in self.fields:
+            part = ordered_key(document.get(field))
+            if part is None:
+                return None
+            key.append(part)
+        return tuple(key)
+
+    def _omit(self, document: Mapping[str, Any], count: int) -> None:
+        held = 0
+        while held < len(self.fields) and ordered_key(document.get(self.fields[held])) is not None:
+            held += 1
+        self._omitted[held] += count
+
+    def complete(self, width: int) -> bool:
+        """
+        Return whether seeking the first `width` fields finds every document matching the seek,
+        which is not the case if a document holding these fields misses one of the others.
+        """
+        return not any(self._omitted[width:])
+
+    def _bounds(self, prefix: Tuple[OrderedKey, ...]) -> Tuple[int, int]:
+        # A key prefix sorts before every entry extending it, and the prefix followed by the
+        # highest possible key after all of them.
+        return (
+            bisect_left(self._entries, (prefix,)),
+            bisect_left(self._entries, (prefix + (_HIGHEST,),)),
+        )
+
+    def _describe(self, key: Tuple[OrderedKey, ...]) -> str:
+        if len(key) == 1:
+            return f"value {key[0][1]!r} for unique index on field '{self.fields[0]}'"
+        return f"values {tuple(k[1] for k in key)!r} for unique index on fields {self.fields}"
+
+    def check(self, document: Mapping[str, Any], position: Optional[int] = None) -> None:
+        if not self.unique:
+            return
+        key = self._key(document)
+        if key is None:
+            return
+        lo, hi = self._bounds(key)
+        if any(p != position for _, p in self._entries[lo:hi]):
+            raise ValueError(f"Duplicate {self._describe(key)}")
+
+    def add(self, position: int, document: Mapping[str, Any]) -> None:
+        key = self._key(document)
+        if key is None:
+            self._omit(document, 1)
+            return
+        self.check(document, position)
+        insort(self._entries, (key, position))
+
+    def add_many(self, entries: Sequence[Tuple[int, Mapping[str, Any]]]) -> None:
+        # Sorting the new entries in with the existing ones beats inserting them one by one.
+        new: List[Tuple[Tuple[OrderedKey, ...], int]] = []
+        omitted: List[Mapping[str, Any]] = []
+        for position, document in entries:
+            key = self._key(document)
+            if key is None:
+                omitted.append(document)
+            else:
+                new.append((key, position))
+        if self.unique:
+            seen: set[Tuple[OrderedKey, ...]] = set()
+            for key, position in new:
+                lo, hi = self._bounds(key)
+                if key in seen or any(p != position for _, p in self._entries[lo:hi]):
+                    raise ValueError(f"Duplicate {self._describe(key)}")
+                seen.add(key)
+        for document in omitted:
+            self._omit(document, 1)
+        self._entries.extend(new)
+        self._entries.sort()
+
+    def remove(self, position: int, document: Mapping[str, Any]) -> None:
+        key = self._key(document)
+        if key is None:
+            self._omit(document, -1)
+            return
+        i = bisect_left(self._entries, (key, position))
+        if i < len(self._entries) and self._entries[i] == (key, position):
+            self._entries.pop(i)
+
+    def remove_many(self, entries: Sequence[Tuple[int, Mapping[str, Any]]]) -> None:
+        if len(entries) <= _BULK_REMOVE_THRESHOLD:
+            super().remove_many(entries)
+            return
+        # Removing many entries one by one shifts the tail of the list every time, filtering
+        # them out in a single pass does not.
+        removed = {position for position, _ in entries}
+        self._entries = [entry for entry in self._entries if entry[1] not in removed]
+        for _, document in entries:
+            if self._key(document) is None:
+                self._omit(document, -1)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._omitted = [0] * len(self.fields)
+
+    def lookup(self, value: LiteralValue) -> List[int]:
+        positions = self.seek([value])
+        # Past the first field, entries are ordered by the remaining fields, not by position.
+        return positions if len(self.fields) == 1 else sorted(positions)
+
+    def _slice(
+        self,
+        prefix: Sequence[LiteralValue],
+        lower: Optional[LiteralValue],
+        lower_inclusive: bool,
+        upper: Optional[LiteralValue],
+        upper_inclusive: bool,
+    ) -> Tuple[int, int]:
+        if len(prefix) > len(self.fields) or (
+            len(prefix) == len(self.fields) and (lower is not None or upper is not None)
+        ):
+            raise ValueError(f"Too many values to seek index on fields {self.fields}")
+        key_prefix = []
+        for value in prefix:
+            part = ordered_key(value)
+            if part is None:
+                return 0, 0
+            key_prefix.append(part)
+        head = tuple(key_prefix)
+
+        lower_key = ordered_key(lower) if lower is not None else None
+        upper_key = ordered_key(upper) if upper is not None else None
+        if (lower is not None and lower_key is None) or (upper is not None and upper_key is None):
+            return 0, 0
+        bound = lower_key or upper_key
+        if bound is None:
+            return self._bounds(head)
+
+        rank = bound[0]
+        if lower_key is None:
+            lo = bisect_left(self._entries, (head + ((rank,),),))
+        elif lower_inclusive:
+            lo = self._bounds(head + (lower_key,))[0]
+        else:
+            lo = self._bounds(head + (lower_key,))[1]
+        if upper_key is None:
+            hi = bisect_left(self._entries, (head + ((rank + 1,),),))
+        elif upper_inclusive:
+            hi = self._bounds(head + (upper_key,))[1]
+        else:
+            hi = self._bounds(head + (upper_key,))[0]
+        return lo, max(lo, hi)
+
+    def seek(
+        self,
+        prefix: Sequence[LiteralValue],
+        lower: Optional[LiteralValue] = None,
+        lower_inclusive: bool = True,
+        upper: Optional[LiteralValue] = None,
+        upper_inclusive: bool = True,
+    ) -> List[int]:
+        """
+        Return, in index order, the positions of the documents whose leading fields equal
+        `prefix` and whose next field lies between `lower` and `upper`.
+
+        An omitted bound extends to the end of the other bound's rank, so that a numeric range
+        never yields strings or datetimes. Without bounds, every document matching the prefix
+        is returned.
+        """
+        lo, hi = self._slice(prefix, lower, lower_inclusive, upper, upper_inclusive)
+        return [p for _, p in self._entries[lo:hi]]
+
+    def items(
+        self,
+        prefix: Sequence[LiteralValue],
+        lower: Optional[LiteralValue] = None,
+        lower_inclusive: bool = True,
+        upper: Optional[LiteralValue] = None,
+        upper_inclusive: bool = True,
+    ) -> List[Tuple[int, Tuple[Any, ...]]]:
+        """
+        Like `seek`, but return each position along with the values of the indexed fields, so
+        that queries reading nothing but these fields need not read the documents.
+        """
+        lo, hi = self._slice(prefix, lower, lower_inclusive, upper, upper_inclusive)
+        return [(p, tuple(part[1] for part in key)) for key, p in self._entries[lo:hi]]
+
+    def count(
+        self,
+        prefix: Sequence[LiteralValue],
+        lower: Optional[LiteralValue] = None,
+        lower_inclusive: bool = True,
+        upper: Optional[LiteralValue] = None,
+        upper_inclusive: bool = True,
+    ) -> int:
+        """
+        Return the number of positions `seek` would return, in O(log n).
+        """
+        lo, hi = self._slice(prefix, lower, lower_inclusive, upper, upper_inclusive)
+        return hi - lo
+
+    def groups(
+        self, width: int
+    ) -> Iterator[Tuple[Tuple[Any, ...], int, Optional[Tuple[OrderedKey, OrderedKey]]]]:
+        """
+        Iterate, in index order, over the distinct values of the first `width` fields, with the
+        number of documents holding each and the smallest and largest ordered key of the next
+        field among them (None past the last field). This takes O(log n) per group.
+        """
+        lo = 0
+        while lo < len(self._entries):
+            head = self._entries[lo][0][:width]
+            hi = bisect_left(self._entries, (head + (_HIGHEST,),), lo)
+            bounds = None
+            if width < len(self.fields):
+                bounds = self._entries[lo][0][width], self._entries[hi - 1][0][width]
+            yield tuple(part[1] for part in head), hi - lo, bounds
+            lo = hi
+
+    def scan(self, descending: bool = False) -> Iterator[int]:
+        """
+        Iterate over all indexed positions in index order.
+
+        Documents sharing a key keep their insertion order in both directions, just like a
+        stable sort would.
+        """
+        if not descending:
+            for _, position in self._entries:
+                yield position
+            return
+        i = len(self._entries)
+        while i > 0:
+            lo = bisect_left(self._entries, (self._entries[i - 1][0],), 0, i)
+            for _, position in self._entries[lo:i]:
+                yield position
+            i = lo
@@ -1,31 +1,368 @@
-from typing import Any, List, Mapping, Optional, Protocol, Sequence, Tuple, Type, cast
-
-import jsonpatch
+import asyncio
+import dataclasses
+import weakref
+from concurrent.futures import Executor
+from itertools import islice
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    MutableSequence,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+    cast,
+)
 
+from flux0_nanodb.aggregation import Aggregation
 from flux0_nanodb.api import DocumentCollection, DocumentDatabase
-from flux0_nanodb.common import convert_patch, validate_is_total
-from flux0_nanodb.projection import Projection, apply_projection
-from flux0_nanodb.query import QueryFilter, matches_query
+from flux0_nanodb.cache import CacheStats, ResultCache, query_key
+from flux0_nanodb.changes import BUFFER_SIZE, ChangeFeed, ChangeStream
+from flux0_nanodb.cooperative import SCAN_CHUNK, SCAN_THRESHOLD, Matches, collect, paginate
+from flux0_nanodb.index import HashIndex, Index, OrderedIndex
+from flux0_nanodb.mvcc import ReadView
+from flux0_nanodb.partition import PartitionedDocumentCollection
+from flux0_nanodb.patch import apply_patch
+from flux0_nanodb.planner import FullScan, IndexSeek, Items, Plan, QueryPlanner
+from flux0_nanodb.projection import Projection, Projector, compile_projection, projected_fields
+from flux0_nanodb.schema import compile_schema
+from flux0_nanodb.query import QueryFilter, compile_query
+from flux0_nanodb.sorting import sort_documents
+from flux0_nanodb.view import DocumentView
 from flux0_nanodb.types import (
+    Accumulator,
     DeleteResult,
     DocumentID,
+    ExplainResult,
+    InsertManyResult,
     InsertOneResult,
     JSONPatchOperation,
+    PlanStage,
+    QueryPlan,
     SortingOrder,
     TDocument,
+    UpdateManyResult,
     UpdateOneResult,
 )
 
 
-class Comparable(Protocol):
-    def __lt__(self, other: Any) -> bool: ...
+# Compaction only kicks in once this many documents have been deleted, and there are more of them
+# than live documents.
+COMPACTION_THRESHOLD = 64
 
 
 class MemoryDocumentCollection(DocumentCollection[TDocument]):
-    def __init__(self, name: str, schema: Type[TDocument]) -> None:
+    """
+    Documents are kept in insertion order in an array of slots, and indexes refer to them by
+    slot position. Deleting a document leaves a tombstone (None) in its slot, so that no other
+    position moves, and the array is compacted once tombstones outnumber live documents.
+
+    Reads return the stored documents themselves, unless the collection is `read_only`, in which
+    case they return read-only views of them (see `flux0_nanodb.view`): callers cannot modify
+    the store through what they read, and nothing is copied.
+
+    Reads never wait for writes. Small reads run to completion without yielding. Cursors, and
+    reads expected to examine more than `scan_threshold` documents, yield to the event loop every
+    `SCAN_CHUNK` documents examined and read through a view of the collection taken when they
+    start (see `flux0_nanodb.mvcc`); large sorts run on a worker thread. A large scan thus delays
+    other tasks by one chunk at a time rather than by its whole length. A `scan_threshold` of
+    None makes every `find` run to completion.
+
+    With a `cache_budget`, the results of `find` are cached until the next write, in at most
+    that many bytes (see `flux0_nanodb.cache`), so that repeating a query between writes costs
+    a lookup.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        schema: Type[TDocument],
+        read_only: bool = False,
+        scan_threshold: Optional[int] = SCAN_THRESHOLD,
+        cache_budget: Optional[int] = None,
+    ) -> None:
         self._name = name
-        self._schema = schema
-        self._documents: list[TDocument] = []
+        self._read_only = read_only
+        self._scan_threshold = scan_threshold
+        self._cache: Optional[ResultCache[TDocument]] = (
+            ResultCache(cache_budget) if cache_budget is not None else None
+        )
+        self._schema = compile_schema(schema)
+        self._slots: MutableSequence[Optional[TDocument]] = []
+        self._size = 0
+        self._indexes: dict[Tuple[str, ...], Index] = {}
+        self._changes: ChangeFeed[TDocument] = ChangeFeed()
+        # The views of open cursors, which writers hand the versions they overwrite.
+        self._views: weakref.WeakSet[ReadView[TDocument]] = weakref.WeakSet()
+
+    def _output(self, document: TDocument) -> TDocument:
+        return cast(TDocument, DocumentView(document)) if self._read_only else document
+
+    @property
+    def cache_stats(self) -> Optional[CacheStats]:
+        """
+        How well the result cache does, or None if the collection has none.
+        """
+        return self._cache.stats if self._cache is not None else None
+
+    def _plan(self, filters: Optional[QueryFilter]) -> Plan:
+        return QueryPlanner(self._indexes, self._size).plan(filters)
+
+    def _cooperative(self, plan: Plan) -> bool:
+        """
+        Whether a read following the plan is large enough to share the event loop as it goes.
+        """
+        return self._scan_threshold is not None and plan.rows > self._scan_threshold
+
+    def _document(self, position: int) -> TDocument:
+        # Indexes and matching positions never refer to tombstones.
+        return cast(TDocument, self._slots[position])
+
+    def _row(
+        self, slots: Sequence[Optional[TDocument]], position: int
+    ) -> Optional[Mapping[str, Any]]:
+        """
+        Return what filters and indexes read the fields of a slot from, or None for a tombstone.
+        This is the document itself, unless the slots can provide its fields more cheaply.
+        """
+        return slots[position]
+
+    def _documents(self) -> Iterator[Tuple[int, Mapping[str, Any]]]:
+        """
+        Iterate over the live slots, with the fields of their documents.
+        """
+        for position in range(len(self._slots)):
+            row = self._row(self._slots, position)
+            if row is not None:
+                yield position, row
+
+    def _matching_positions(
+        self, filters: QueryFilter, plan: Optional[Plan] = None
+    ) -> Iterator[int]:
+        match = compile_query(filters)
+        candidates = (plan or self._plan(filters)).positions()
+        positions: Iterable[int] = range(len(self._slots)) if candidates is None else candidates
+        for position in positions:
+            row = self._row(self._slots, position)
+            if row is not None and match(row):
+                yield position
+
+    def _preserve(self, positions: Iterable[int]) -> None:
+        """
+        Called before overwriting slots, so that open read views keep seeing what they saw.
+        """
+        for view in self._views:
+            view.preserve(self._slots, positions)
+
+    def _journal(self, record: Dict[str, Any]) -> None:
+        """
+        Called after every successful write with what it takes to replay it with `_apply`.
+        Cached results are dropped, and persistent collections write the record to their log.
+        """
+        if self._cache is not None:
+            self._cache.invalidate()
+
+    def _apply(self, record: Mapping[str, Any]) -> None:
+        """
+        Replay a write recorded by `_journal`. Documents are identified by slot position, so
+        the collection has to be in the state it was in when the write was recorded.
+        """
+        op = record["op"]
+        if op == "insert":
+            documents = record["documents"]
+            self._index_many(list(enumerate(documents, len(self._slots))))
+            self._slots.extend(documents)
+            self._size += len(documents)
+        elif op == "patch":
+            positions = record["positions"]
+            patched = [apply_patch(self._document(i), record["patch"]) for i in positions]
+            self._replace_many(positions, cast(List[TDocument], patched))
+        elif op == "delete":
+            self._delete(record["positions"])
+        elif op == "index":
+            self._create_index(tuple(record["fields"]), record["unique"], record["ordered"])
+        else:
+            raise ValueError(f"Unknown journal record '{op}'")
+
+    def _rebuild_indexes(self) -> None:
+        entries = list(self._documents())
+        for index in self._indexes.values():
+            index.clear()
+            index.add_many(entries)
+
+    async def create_index(
+        self, field: Union[str, Sequence[str]], unique: bool = False, ordered: bool = False
+    ) -> None:
+        fields = (field,) if isinstance(field, str) else tuple(field)
+        if not fields:
+            raise ValueError("An index requires at least one field")
+        # Compound indexes are always ordered.
+        ordered = ordered or len(fields) > 1
+        existing = self._indexes.get(fields)
+        if existing is not None:
+            if existing.unique != unique or isinstance(existing, OrderedIndex) != ordered:
+                raise ValueError(f"Index on {fields} already exists with different options")
+            return
+        self._create_index(fields, unique, ordered)
+        self._journal({"op": "index", "fields": list(fields), "unique": unique, "ordered": ordered})
+
+    def _create_index(self, fields: Tuple[str, ...], unique: bool, ordered: bool) -> None:
+        index: Index = (
+            OrderedIndex(fields, unique=unique) if ordered else HashIndex(fields[0], unique=unique)
+        )
+        index.add_many(list(self._documents()))
+        self._indexes[fields] = index
+
+    def _sort_index(
+        self, sort: Optional[Sequence[Tuple[str, SortingOrder]]]
+    ) -> Optional[Tuple[OrderedIndex, bool]]:
+        """
+        Return the ordered index able to produce the requested sort order, if any, and whether
+        it has to be walked in descending order.
+        """
+        if sort is None or len(sort) != 1:
+            return None
+        field, order = sort[0]
+        index = self._indexes.get((field,))
+        # Documents missing from the index would be missing from the result.
+        if not isinstance(index, OrderedIndex) or len(index) != self._size:
+            return None
+        return index, order == SortingOrder.DESC
+
+    def _check_page(self, limit: Optional[int], offset: Optional[int]) -> None:
+        if offset is not None and offset < 0:
+            raise ValueError("Offset must be non-negative")
+        if limit is not None and limit < 0:
+            raise ValueError("Limit must be non-negative")
+
+    def _access_path(
+        self,
+        filters: Optional[QueryFilter],
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]],
+    ) -> Tuple[QueryPlan, Iterable[int], Optional[Sequence[Tuple[str, SortingOrder]]]]:
+        """
+        Choose how to reach the candidates of a query, returning the plan used, the candidate
+        positions and the sort order still left to apply to the matching documents.
+        """
+        plan = self._plan(filters)
+        index_order = self._sort_index(sort) if isinstance(plan, FullScan) else None
+        if index_order is not None:
+            # Walking an ordered index yields the documents already sorted, which beats a full
+            # scan followed by a sort. Narrow index lookups are cheaper to sort afterwards.
+            index, descending = index_order
+            description = QueryPlan(stage=PlanStage.INDEX_SCAN, index=index.fields)
+            return description, index.scan(descending), None
+        candidates = plan.positions()
+        positions = range(len(self._slots)) if candidates is None else candidates
+        return plan.describe(), positions, sort
+
+    def _covered(
+        self,
+        filters: Optional[QueryFilter],
+        projection: Optional[Mapping[str, Projection]],
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]],
+    ) -> Optional[Tuple[QueryPlan, List[TDocument]]]:
+        """
+        Answer a query from an ordered index alone, when the index holds every projected field
+        (and every sort field) and tells on its own which documents match. Return the plan used
+        and the projected documents, sorted but not paginated, or None if no index covers it.
+        """
+        fields: Optional[FrozenSet[str]] = projected_fields(projection) if projection else None
+        # Indexes read top-level fields only, whereas projections read dotted paths as nested.
+        if fields is None or any("." in field for field in fields):
+            return None
+        if sort and not {field for field, _ in sort} <= fields:
+            return None
+        columns: Tuple[str, ...]
+        items: Optional[Items]
+        if filters is None:
+            # Walking the index only finds every document if it holds every document.
+            scanned = next(
+                (
+                    index
+                    for index in self._indexes.values()
+                    if isinstance(index, OrderedIndex)
+                    and len(index) == self._size
+                    and fields <= set(index.fields)
+                ),
+                None,
+            )
+            if scanned is None:
+                return None
+            columns = scanned.fields
+            description = QueryPlan(stage=PlanStage.INDEX_SCAN, index=columns, covered=True)
+            items = sorted(scanned.items(()))
+        else:
+            plan = self._plan(filters)
+            if not (
+                isinstance(plan, IndexSeek) and plan.exact and fields <= set(plan.index.fields)
+            ):
+                return None
+            items = plan.items()
+            if items is None:
+                return None
+            columns = plan.index.fields
+            description = dataclasses.replace(plan.describe(), covered=True)
+        # Projected fields come in the order the projection lists them, after _id. Like any
+        # other field, _id is only covered if it is indexed (or excluded by the projection).
+        layout = [field for field in dict.fromkeys(("_id", *(projection or ()))) if field in fields]
+        docs = [
+            cast(TDocument, {field: row[field] for field in layout})
+            for row in (dict(zip(columns, values)) for _, values in items)
+        ]
+        return description, sort_documents(docs, sort) if sort else docs
+
+    def _execute(
+        self,
+        filters: Optional[QueryFilter],
+        limit: Optional[int],
+        offset: Optional[int],
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]],
+        projection: Optional[Mapping[str, Projection]] = None,
+    ) -> Tuple[QueryPlan, list[TDocument], int]:
+        """
+        Run a query, returning the plan used, the resulting (projected) documents and the number
+        of documents examined along the way.
+        """
+        self._check_page(limit, offset)
+        start = offset or 0
+        stop = start + limit if limit is not None else None
+        covered = self._covered(filters, projection, sort)
+        if covered is not None:
+            return covered[0], covered[1][start:stop], 0
+
+        description, positions, sort = self._access_path(filters, sort)
+
+        match = compile_query(filters) if filters is not None else None
+        examined = 0
+
+        def matching() -> Iterator[TDocument]:
+            nonlocal examined
+            for position in positions:
+                row = self._row(self._slots, position)
+                if row is None:
+                    continue
+                examined += 1
+                if match is None or match(row):
+                    yield self._document(position)
+
+        if sort:
+            # Only the documents up to the end of the requested page need to be ordered.
+            docs = sort_documents(matching(), sort, k=stop)[start:]
+        else:
+            # Without sorting, stop as soon as the page is complete.
+            docs = list(islice(matching(), start, stop))
+        if projection:
+            project = compile_projection(projection)
+            docs = [cast(TDocument, project(doc)) for doc in docs]
+        return description, docs, examined
 
     async def find(
         self,
@@ -35,100 +372,494 @@ class MemoryDocumentCollection(DocumentCollection[TDocument]):
         offset: Optional[int] = None,
         sort: Optional[Sequence[Tuple[str, SortingOrder]]] = None,
     ) -> Sequence[TDocument]:
-        docs: Sequence[TDocument] = []
-        # Apply filters
-        if filters is None:
-            docs = self._documents
+        if self._cache is None:
+            docs = await self._find(filters, projection, limit, offset, sort)
         else:
-            docs = [doc for doc in self._documents if matches_query(filters, doc)]
-
-        # Sorting step: if sort is provided, sort docs on the specified fields.
-        if sort is not None:
-            # Process sort keys in reverse order (stable sort ensures correct overall order)
-            for field, order in reversed(sort):
-                docs.sort(
-                    key=lambda doc: cast(Comparable, doc.get(field, None)),
-                    reverse=(order == SortingOrder.DESC),
-                )
-
-        # Apply projection if given
-        if projection:
-            docs = [cast(TDocument, apply_projection(doc, projection)) for doc in docs]
+            # Projected documents are built by the query: callers get copies of their own, unless
+            # they are handed read-only views.
+            docs = await self._cache.fetch(
+                query_key(filters, projection, limit, offset, sort),
+                lambda: self._find(filters, projection, limit, offset, sort),
+                compile_projection(projection) if projection and not self._read_only else None,
+            )
+        if self._read_only:
+            docs = [self._output(doc) for doc in docs]
+        return docs
+
+    async def _find(
+        self,
+        filters: Optional[QueryFilter],
+        projection: Optional[Mapping[str, Projection]],
+        limit: Optional[int],
+        offset: Optional[int],
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]],
+    ) -> List[TDocument]:
+        if self._cooperative(self._plan(filters)):
+            return await self._find_cooperatively(filters, projection, limit, offset, sort)
+        _, docs, _ = self._execute(filters, limit, offset, sort, projection)
+        return docs
+
+    async def find_iter(
+        self,
+        filters: Optional[QueryFilter] = None,
+        projection: Optional[Mapping[str, Projection]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]] = None,
+        batch_size: int = 100,
+    ) -> AsyncIterator[TDocument]:
+        if batch_size <= 0:
+            raise ValueError("Batch size must be positive")
+        self._check_page(limit, offset)
+        start = offset or 0
+        stop = start + limit if limit is not None else None
+        project: Optional[Projector] = compile_projection(projection) if projection else None
+        results: Matches[TDocument]
 
-        # Validate and apply offset
-        if offset is not None:
-            if offset < 0:
-                raise ValueError("Offset must be non-negative")
-            docs = docs[offset:]
+        covered = self._covered(filters, projection, sort)
+        if covered is not None:
+            # The documents are already projected, and owned by the cursor.
+            project = None
+            results = iter(covered[1][start:stop])
+        else:
+            matches, sort = self._scan(filters, sort)
+            if sort:
+                # Sorting needs every match up front, the rest is still handed out in batches.
+                results = iter(await collect(matches, start, stop, sort, self._scan_threshold))
+            else:
+                results = paginate(matches, start, stop)
 
-        # Validate and apply limit
-        if limit is not None:
-            if limit < 0:
-                raise ValueError("Limit must be non-negative")
-            docs = docs[:limit]
+        pending = 0
+        for doc in results:
+            if doc is not None:
+                yield self._output(cast(TDocument, project(doc)) if project else doc)
+                pending += 1
+                if pending < batch_size:
+                    continue
+            # Let other tasks run between batches, and while looking for the next batch.
+            pending = 0
+            await asyncio.sleep(0)
 
+    async def _find_cooperatively(
+        self,
+        filters: Optional[QueryFilter],
+        projection: Optional[Mapping[str, Projection]],
+        limit: Optional[int],
+        offset: Optional[int],
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]],
+    ) -> List[TDocument]:
+        """
+        Run a large query like `_execute`, letting other tasks run while it does.
+        """
+        self._check_page(limit, offset)
+        start = offset or 0
+        stop = start + limit if limit is not None else None
+        covered = self._covered(filters, projection, sort)
+        if covered is not None:
+            return covered[1][start:stop]
+        matches, sort = self._scan(filters, sort)
+        docs = await collect(matches, start, stop, sort, self._scan_threshold)
+        if projection:
+            project = compile_projection(projection)
+            docs = [cast(TDocument, project(doc)) for doc in docs]
         return docs
 
+    def _scan(
+        self,
+        filters: Optional[QueryFilter],
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]],
+    ) -> Tuple[Matches[TDocument], Optional[Sequence[Tuple[str, SortingOrder]]]]:
+        """
+        Start reading the documents matching the filters, returning them lazily, with a None
+        after every `SCAN_CHUNK` documents examined, and the sort order still left to apply.
+        """
+        _, positions, sort = self._access_path(filters, sort)
+        # Other tasks may write to the collection while the reader is suspended. Take the
+        # candidates now, and read the documents through a view of the collection as it is now:
+        # the reader sees neither later writes nor later inserts.
+        view = ReadView(self._slots)
+        self._views.add(view)
+        if not isinstance(positions, range):
+            positions = list(positions)
+        match = compile_query(filters) if filters is not None else None
+
+        def matching() -> Matches[TDocument]:
+            try:
+                for examined, position in enumerate(positions, 1):
+                    row = view.row(position, self._row)
+                    if row is not None and (match is None or match(row)):
+                        yield cast(TDocument, view[position])
+                    if examined % SCAN_CHUNK == 0:
+                        yield None
+            finally:
+                self._views.discard(view)
+
+        return matching(), sort
+
+    async def find_one(
+        self,
+        filters: Optional[QueryFilter] = None,
+        projection: Optional[Mapping[str, Projection]] = None,
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]] = None,
+    ) -> Optional[TDocument]:
+        docs = await self.find(filters, projection=projection, limit=1, sort=sort)
+        return docs[0] if docs else None
+
+    async def count(self, filters: Optional[QueryFilter] = None) -> int:
+        return self._count(filters)
+
+    def _count(self, filters: Optional[QueryFilter]) -> int:
+        if filters is None:
+            return self._size
+        plan = self._plan(filters)
+        if plan.exact:
+            # Every candidate matches, so the index answers on its own.
+            if isinstance(plan, IndexSeek):
+                return int(plan.rows)
+            return len(plan.positions() or ())
+        return sum(1 for _ in self._matching_positions(filters, plan))
+
+    async def exists(self, filters: Optional[QueryFilter] = None) -> bool:
+        if filters is None:
+            return self._size > 0
+        plan = self._plan(filters)
+        if isinstance(plan, IndexSeek) and plan.exact:
+            return plan.rows > 0
+        return next(self._matching_positions(filters, plan), None) is not None
+
+    async def aggregate(
+        self,
+        filters: Optional[QueryFilter],
+        group_by: Sequence[str],
+        accumulators: Mapping[str, Accumulator],
+    ) -> Sequence[Dict[str, Any]]:
+        aggregation = Aggregation(group_by, accumulators)
+        matches = self._fold(filters, aggregation)
+        if matches is not None:
+            await aggregation.add_all(matches)
+        return aggregation.results()
+
+    def _fold(
+        self, filters: Optional[QueryFilter], aggregation: Aggregation
+    ) -> Optional[Matches[TDocument]]:
+        """
+        Fold the documents matching the filters into the aggregation, from the indexes alone
+        when they tell enough. Reads large enough to share the event loop are started instead,
+        and their matches returned for the caller to fold.
+        """
+        if not aggregation.group_by and aggregation.counts_only:
+            count = self._count(filters)
+            if count:
+                aggregation.add_group((), count, {})
+            return None
+        if filters is None and self._fold_index(aggregation):
+            return None
+        plan = self._plan(filters)
+        if self._cooperative(plan):
+            return self._scan(filters, None)[0]
+        if filters is None:
+            for _, row in self._documents():
+                aggregation.add(row)
+        else:
+            for position in self._matching_positions(filters, plan):
+                aggregation.add(cast(Mapping[str, Any], self._row(self._slots, position)))
+        return None
+
+    def _fold_index(self, aggregation: Aggregation) -> bool:
+        """
+        Fold every document into the aggregation from an index holding every document, whose
+        leading fields are the group fields and which holds every field the accumulators read.
+        Return whether there is such an index.
+        """
+        grouped = set(aggregation.group_by)
+        width = len(grouped)
+        for index in self._indexes.values():
+            if len(index) != self._size or set(index.fields[:width]) != grouped:
+                continue
+            if isinstance(index, HashIndex):
+                if width == 0 or not aggregation.covered_by(grouped):
+                    continue
+                for value, count in index.groups():
+                    aggregation.add_group((value,), count, {})
+                return True
+            if isinstance(index, OrderedIndex):
+                following = index.fields[width : width + 1]
+                if not aggregation.covered_by(grouped | set(following)):
+                    continue
+                for values, count, bounds in index.groups(width):
+                    fields = dict(zip(index.fields, values))
+                    key = tuple(fields[field] for field in aggregation.group_by)
+                    aggregation.add_group(
+                        key, count, {following[0]: bounds} if bounds is not None else {}
+                    )
+                return True
+        return False
+
+    async def explain(
+        self,
+        filters: Optional[QueryFilter] = None,
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        projection: Optional[Mapping[str, Projection]] = None,
+    ) -> ExplainResult:
+        plan, docs, examined = self._execute(filters, limit, offset, sort, projection)
+        return ExplainResult(plan=plan, documents_examined=examined, documents_returned=len(docs))
+
+    def _append(self, document: TDocument) -> None:
+        for index in self._indexes.values():
+            index.check(document)
+        position = len(self._slots)
+        self._slots.append(document)
+        self._size += 1
+        for index in self._indexes.values():
+            index.add(position, document)
+
+    def _replace(self, position: int, document: TDocument) -> None:
+        for index in self._indexes.values():
+            index.check(document, position)
+        previous = self._document(position)
+        for index in self._indexes.values():
+            index.remove(position, previous)
+            index.add(position, document)
+        self._preserve((position,))
+        self._slots[position] = document
+
+    def _index_many(self, entries: Sequence[Tuple[int, TDocument]]) -> None:
+        """
+        Add documents to every index, or to none of them if one rejects them.
+        """
+        indexed: List[Index] = []
+        try:
+            for index in self._indexes.values():
+                index.add_many(entries)
+                indexed.append(index)
+        except ValueError:
+            for index in indexed:
+                for position, doc in entries:
+                    index.remove(position, doc)
+            raise
+
+    def _replace_many(self, positions: Sequence[int], documents: Sequence[TDocument]) -> None:
+        previous = [(i, self._document(i)) for i in positions]
+        for index in self._indexes.values():
+            for i, doc in previous:
+                index.remove(i, doc)
+        try:
+            self._index_many(list(zip(positions, documents)))
+        except ValueError:
+            self._index_many(previous)
+            raise
+        self._preserve(positions)
+        for i, doc in zip(positions, documents):
+            self._slots[i] = doc
+
+    def _upsert(self, patch: List[JSONPatchOperation]) -> DocumentID:
+        new_doc = apply_patch({}, patch)
+        if "id" not in new_doc:
+            raise ValueError("Upserted document is missing an 'id' field")
+        self._schema.validate(new_doc)
+        self._append(cast(TDocument, new_doc))
+        self._journal({"op": "insert", "documents": [new_doc]})
+        self._changes.publish("insert", [self._output(cast(TDocument, new_doc))])
+        return cast(DocumentID, new_doc["id"])
+
     async def insert_one(self, document: TDocument) -> InsertOneResult:
-        self._documents.append(document)
-        validate_is_total(document, self._schema)
+        self._schema.validate(document)
         inserted_id: Optional[DocumentID] = document.get("id")  # type: ignore
         if inserted_id is None:
             raise ValueError("Document is missing an 'id' field")
+        self._append(document)
+        self._journal({"op": "insert", "documents": [document]})
+        self._changes.publish("insert", [self._output(document)])
         return InsertOneResult(acknowledged=True, inserted_id=inserted_id)
 
+    async def insert_many(self, documents: Sequence[TDocument]) -> InsertManyResult:
+        inserted_ids = self._validate_many(documents)
+        self._index_many(list(enumerate(documents, len(self._slots))))
+        self._extend(documents)
+        return InsertManyResult(acknowledged=True, inserted_ids=inserted_ids)
+
+    def _validate_many(self, documents: Sequence[TDocument]) -> List[DocumentID]:
+        """
+        Validate documents about to be inserted, returning their ids.
+        """
+        inserted_ids: List[DocumentID] = []
+        for document in documents:
+            self._schema.validate(document)
+            inserted_id: Optional[DocumentID] = document.get("id")  # type: ignore
+            if inserted_id is None:
+                raise ValueError("Document is missing an 'id' field")
+            inserted_ids.append(inserted_id)
+        return inserted_ids
+
+    def _extend(self, documents: Sequence[TDocument]) -> None:
+        """
+        Append documents already added to the indexes, at the positions they were indexed at.
+        """
+        self._slots.extend(documents)
+        self._size += len(documents)
+        self._journal({"op": "insert", "documents": list(documents)})
+        if self._changes.watched:
+            self._changes.publish("insert", [self._output(doc) for doc in documents])
+
     async def update_one(
         self, filters: QueryFilter, patch: List[JSONPatchOperation], upsert: bool = False
     ) -> UpdateOneResult:
-        standard_patch = convert_patch(patch)
         # Look for an existing document matching the filters.
-        for i, doc in enumerate(self._documents):
-            if matches_query(filters, doc):
-                try:
-                    updated_doc = jsonpatch.apply_patch(doc, standard_patch, in_place=False)
-                except jsonpatch.JsonPatchException as e:
-                    raise ValueError("Invalid JSON patch") from e
-                # validate_is_total(updated_doc, self._schema)
-                self._documents[i] = cast(TDocument, updated_doc)
-                return UpdateOneResult(
-                    acknowledged=True, matched_count=1, modified_count=1, upserted_id=None
-                )
+        for i in self._matching_positions(filters):
+            updated_doc = apply_patch(self._document(i), patch)
+            # self._schema.validate(updated_doc)
+            self._replace(i, cast(TDocument, updated_doc))
+            self._journal({"op": "patch", "positions": [i], "patch": patch})
+            self._changes.publish("update", [self._output(cast(TDocument, updated_doc))])
+            return UpdateOneResult(
+                acknowledged=True, matched_count=1, modified_count=1, upserted_id=None
+            )
         # No matching document found.
         if upsert:
-            try:
-                new_doc = jsonpatch.apply_patch({}, standard_patch, in_place=False)
-            except jsonpatch.JsonPatchException as e:
-                raise ValueError("Invalid JSON patch for upsert") from e
-            if "id" not in new_doc:
-                raise ValueError("Upserted document is missing an 'id' field")
-            validate_is_total(new_doc, self._schema)
-            self._documents.append(cast(TDocument, new_doc))
+            upserted_id = self._upsert(patch)
             return UpdateOneResult(
-                acknowledged=True, matched_count=0, modified_count=0, upserted_id=new_doc["id"]
+                acknowledged=True, matched_count=0, modified_count=0, upserted_id=upserted_id
             )
         return UpdateOneResult(
             acknowledged=True, matched_count=0, modified_count=0, upserted_id=None
         )
 
+    async def update_many(
+        self, filters: QueryFilter, patch: List[JSONPatchOperation], upsert: bool = False
+    ) -> UpdateManyResult:
+        positions, updated = self._patch_many(filters, patch)
+        if not positions:
+            upserted_id = self._upsert(patch) if upsert else None
+            return UpdateManyResult(
+                acknowledged=True, matched_count=0, modified_count=0, upserted_id=upserted_id
+            )
+        self._replace_many(positions, updated)
+        self._patched(positions, updated, patch)
+        return UpdateManyResult(
+            acknowledged=True,
+            matched_count=len(positions),
+            modified_count=len(positions),
+            upserted_id=None,
+        )
+
+    def _patch_many(
+        self, filters: QueryFilter, patch: List[JSONPatchOperation]
+    ) -> Tuple[List[int], List[TDocument]]:
+        """
+        Return the positions of the matching documents and the documents as patched, without
+        storing them. Every document is patched before any is stored, so that an invalid patch
+        changes nothing.
+        """
+        positions = list(self._matching_positions(filters))
+        updated = [cast(TDocument, apply_patch(self._document(i), patch)) for i in positions]
+        return positions, updated
+
+    def _patched(
+        self, positions: List[int], updated: List[TDocument], patch: List[JSONPatchOperation]
+    ) -> None:
+        """
+        Record a patch once the documents it produced are stored.
+        """
+        self._journal({"op": "patch", "positions": positions, "patch": patch})
+        if self._changes.watched:
+            self._changes.publish("update", [self._output(doc) for doc in updated])
+
+    def _delete(self, positions: Sequence[int]) -> int:
+        """
+        Leave a tombstone in the slots of the given documents, without moving any other
+        document, then compact the slots if tombstones have come to outnumber documents.
+        """
+        entries = [(position, self._document(position)) for position in positions]
+        for index in self._indexes.values():
+            index.remove_many(entries)
+        self._preserve(positions)
+        for position, _ in entries:
+            self._slots[position] = None
+        self._size -= len(entries)
+        tombstones = len(self._slots) - self._size
+        if tombstones >= COMPACTION_THRESHOLD and tombstones > self._size:
+            self._compact()
+        return len(entries)
+
+    def _compact(self) -> None:
+        # Build new slots rather than compacting in place, as open cursors may still be reading
+        # the current ones.
+        self._slots = [doc for doc in self._slots if doc is not None]
+        self._rebuild_indexes()
+
     async def delete_one(self, filters: QueryFilter) -> DeleteResult[TDocument]:
-        for i, doc in enumerate(self._documents):
-            if matches_query(filters, doc):
-                removed = self._documents.pop(i)
-                return DeleteResult(acknowledged=True, deleted_count=1, deleted_document=removed)
+        for i in self._matching_positions(filters):
+            removed = self._document(i)
+            self._delete([i])
+            self._journal({"op": "delete", "positions": [i]})
+            self._changes.publish("delete", [self._output(removed)])
+            return DeleteResult(
+                acknowledged=True, deleted_count=1, deleted_document=self._output(removed)
+            )
         return DeleteResult(acknowledged=True, deleted_count=0, deleted_document=None)
 
+    async def delete_many(self, filters: QueryFilter) -> DeleteResult[TDocument]:
+        positions = list(self._matching_positions(filters))
+        # Deleted documents are only worth holding on to if someone watches.
+        removed = [self._output(self._document(i)) for i in positions if self._changes.watched]
+        deleted = self._delete(positions)
+        if deleted:
+            self._journal({"op": "delete", "positions": positions})
+            self._changes.publish("delete", removed)
+        return DeleteResult(acknowledged=True, deleted_count=deleted, deleted_document=None)
+
+    def watch(
+        self,
+        filters: Optional[QueryFilter] = None,
+        resume_after: Optional[str] = None,
+        buffer_size: int = BUFFER_SIZE,
+    ) -> ChangeStream[TDocument]:
+        return self._changes.watch(filters, resume_after, buffer_size)
+
 
 class MemoryDocumentDatabase(DocumentDatabase):
-    def __init__(self) -> None:
+    def __init__(self, read_only: bool = False, executor: Optional[Executor] = None) -> None:
         # We store collections in a dict by name.
-        self._collections: dict[str, MemoryDocumentCollection[Any]] = {}
+        self._collections: dict[
+            str, Union[MemoryDocumentCollection[Any], PartitionedDocumentCollection[Any]]
+        ] = {}
+        # Whether collections return read-only views of their documents.
+        self._read_only = read_only
+        # Where partitioned collections scan their large partitions, see
+        # `PartitionedDocumentCollection`.
+        self._executor = executor
 
     async def create_collection(
-        self, name: str, schema: Type[TDocument]
+        self,
+        name: str,
+        schema: Type[TDocument],
+        partition_key: Optional[str] = None,
+        scan_threshold: Optional[int] = SCAN_THRESHOLD,
+        cache_budget: Optional[int] = None,
     ) -> DocumentCollection[TDocument]:
+        """
+        Reads of the collection expected to examine more than `scan_threshold` documents let
+        other tasks run as they go, and a `cache_budget` (in bytes) caches query results until
+        the next write, see `MemoryDocumentCollection`.
+        """
         if name in self._collections:
             raise ValueError(f"Collection '{name}' already exists")
-        collection: MemoryDocumentCollection[TDocument] = MemoryDocumentCollection(name, schema)
+        collection: DocumentCollection[TDocument]
+        if partition_key is None:
+            collection = MemoryDocumentCollection(
+                name, schema, self._read_only, scan_threshold, cache_budget
+            )
+        else:
+            collection = PartitionedDocumentCollection(
+                partition_key,
+                lambda: MemoryDocumentCollection(name, schema, self._read_only, scan_threshold),
+                self._read_only,
+                self._executor,
+                scan_threshold,
+                cache_budget,
+            )
         self._collections[name] = collection
         return collection
 
@@ -139,7 +870,7 @@ class MemoryDocumentDatabase(DocumentDatabase):
         if collection is None:
             raise ValueError(f"Collection '{name}' does not exist")
         # Optionally, you could verify that the stored collection's schema is compatible with `schema`.
-        return cast(MemoryDocumentCollection[TDocument], collection)
+        return cast(DocumentCollection[TDocument], collection)
 
     async def delete_collection(self, name: str) -> None:
         if name in self._collections:
@@ -0,0 +1,60 @@
+from typing import Any, Callable, Dict, Generic, Iterable, Iterator, Mapping, Optional, Sequence
+
+from flux0_nanodb.types import TDocument
+
+
+class ReadView(Generic[TDocument]):
+    """
+    A point-in-time view of the slots of a collection, for readers that span several turns of the
+    event loop (cursors), so that they see the collection as it was when they started without
+    holding writers back.
+
+    Writers never wait for views: they keep replacing documents in the live slots, only handing
+    each view the version of a slot it has to keep seeing before overwriting it (see
+    `preserve`). Documents are never modified in place, so the versions are shared rather than
+    copied. Documents appended later lie beyond the length of the view, and compaction replaces
+    the slots rather than modifying them, leaving the slots of the view as they were.
+    """
+
+    __slots__ = ("slots", "length", "versions", "__weakref__")
+
+    def __init__(self, slots: Sequence[Optional[TDocument]]) -> None:
+        self.slots = slots
+        self.length = len(slots)
+        # The versions of the slots replaced since the view was taken, tombstones included.
+        self.versions: Dict[int, Optional[TDocument]] = {}
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, position: int) -> Optional[TDocument]:
+        if position in self.versions:
+            return self.versions[position]
+        return self.slots[position]
+
+    def __iter__(self) -> Iterator[Optional[TDocument]]:
+        return (self[position] for position in range(self.length))
+
+    def row(
+        self,
+        position: int,
+        read: Callable[[Sequence[Optional[TDocument]], int], Optional[Mapping[str, Any]]],
+    ) -> Optional[Mapping[str, Any]]:
+        """
+        Return what filters read the fields of a slot from, as `read(slots, position)` does for
+        the live slots.
+        """
+        if position in self.versions:
+            return self.versions[position]
+        return read(self.slots, position)
+
+    def preserve(self, slots: Sequence[Optional[TDocument]], positions: Iterable[int]) -> None:
+        """
+        Called by writers before they overwrite slots, so that the view keeps the versions it
+        can see.
+        """
+        if slots is not self.slots:
+            return
+        for position in positions:
+            if position < self.length and position not in self.versions:
+                self.versions[position] = slots[position]
@@ -0,0 +1,678 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import Executor, Future
+from itertools import chain, islice
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+    cast,
+)
+
+from flux0_nanodb.aggregation import Aggregation
+from flux0_nanodb.api import DocumentCollection
+from flux0_nanodb.cache import CacheStats, ResultCache, query_key
+from flux0_nanodb.changes import BUFFER_SIZE, ChangeFeed, ChangeStream
+from flux0_nanodb.cooperative import SCAN_THRESHOLD, Matches, collect, paginate
+from flux0_nanodb.index import HashIndex, is_indexable
+from flux0_nanodb.patch import apply_patch
+from flux0_nanodb.projection import Projection, Projector, compile_projection
+from flux0_nanodb.query import And, Comparison, QueryFilter
+from flux0_nanodb.sorting import sort_documents
+from flux0_nanodb.view import DocumentView
+from flux0_nanodb.types import (
+    Accumulator,
+    DeleteResult,
+    DocumentID,
+    ExplainResult,
+    InsertManyResult,
+    InsertOneResult,
+    JSONPatchOperation,
+    PlanStage,
+    QueryPlan,
+    SortingOrder,
+    TDocument,
+    UpdateManyResult,
+    UpdateOneResult,
+)
+
+if TYPE_CHECKING:
+    from flux0_nanodb.memory import MemoryDocumentCollection
+
+T = TypeVar("T")
+
+# Partitions holding at least this many documents are scanned on the executor, when there is one.
+PARALLEL_THRESHOLD = 10_000
+
+
+def _writes(patch: Sequence[JSONPatchOperation], field: str) -> bool:
+    """
+    Whether a patch may change the value of a top-level field.
+    """
+    pointer = f"/{field}"
+    for operation in patch:
+        paths = [operation["path"]]
+        if operation["op"] == "move":
+            paths.append(operation["from_"])
+        if any(path == pointer or path.startswith(f"{pointer}/") for path in paths):
+            return True
+    return False
+
+
+class _OwnedHashIndex(HashIndex):
+    """
+    The hash index of a partition on a field whose values are unique across every partition.
+    The partitions share `owners`, mapping each value to the key of the partition holding it.
+    """
+
+    def __init__(self, field: str, owners: Dict[Any, Any], key: Any) -> None:
+        super().__init__(field, unique=True)
+        self._owners = owners
+        self._key = key
+
+    def check(self, document: Mapping[str, Any], position: Optional[int] = None) -> None:
+        super().check(document, position)
+        value = document.get(self.field)
+        if is_indexable(value) and self._owners.get(value, self._key) != self._key:
+            raise ValueError(f"Duplicate value {value!r} for unique index on field '{self.field}'")
+
+    def add(self, position: int, document: Mapping[str, Any]) -> None:
+        super().add(position, document)
+        value = document.get(self.field)
+        if is_indexable(value):
+            self._owners[value] = self._key
+
+    def remove(self, position: int, document: Mapping[str, Any]) -> None:
+        super().remove(position, document)
+        value = document.get(self.field)
+        if is_indexable(value) and value not in self._entries:
+            self._owners.pop(value, None)
+
+    def clear(self) -> None:
+        for value in self._entries:
+            self._owners.pop(value, None)
+        super().clear()
+
+
+class PartitionedDocumentCollection(DocumentCollection[TDocument]):
+    """
+    A collection split by the value of a partition key, each partition being a collection of its
+    own with its own indexes. Queries pinning the partition key (with `$eq` or `$in`, possibly
+    within an `And` or in every branch of an `Or`) only read the partitions it names; others
+    read every partition and merge their results.
+
+    Unsorted results come partition by partition, in the order the partitions were created.
+    Sorted results are merged, documents of different partitions that compare equal coming in
+    partition order.
+
+    With an `executor`, reading several partitions hands those holding at least
+    `PARALLEL_THRESHOLD` documents to the executor. The caller waits for them without yielding
+    to the event loop, so that the read still sees a single point in time. Without one, reads
+    expected to examine more than `scan_threshold` documents across partitions let other tasks
+    run as they go, as large reads of a single collection do. A `cache_budget` caches query
+    results until the next write to any partition, as with a single collection.
+
+    Partitions are created by their first document and dropped once emptied. A document keeps its
+    partition for life: updates cannot change its partition key. Unique indexes have to include
+    the partition key, so that each partition can enforce them on its own, unless they are hash
+    indexes on a single field: the collection then knows which partition holds each value of the
+    field, and routes queries pinning the field as if they pinned the partition key.
+    """
+
+    def __init__(
+        self,
+        partition_key: str,
+        factory: Callable[[], MemoryDocumentCollection[TDocument]],
+        read_only: bool = False,
+        executor: Optional[Executor] = None,
+        scan_threshold: Optional[int] = SCAN_THRESHOLD,
+        cache_budget: Optional[int] = None,
+    ) -> None:
+        self._key = partition_key
+        self._factory = factory
+        self._read_only = read_only
+        self._executor = executor
+        self._scan_threshold = scan_threshold
+        # A single cache, shared by the partitions, holds the results of every query.
+        self._cache: Optional[ResultCache[TDocument]] = (
+            ResultCache(cache_budget) if cache_budget is not None else None
+        )
+        self._partitions: Dict[Any, MemoryDocumentCollection[TDocument]] = {}
+        # The options of every index, by fields, for partitions created later.
+        self._specs: Dict[Tuple[str, ...], Tuple[bool, bool]] = {}
+        # The partition key of every value of the fields unique across partitions, by field.
+        self._owners: Dict[str, Dict[Any, Any]] = {}
+        self._changes: ChangeFeed[TDocument] = ChangeFeed()
+
+    def _output(self, document: TDocument) -> TDocument:
+        return cast(TDocument, DocumentView(document)) if self._read_only else document
+
+    @property
+    def cache_stats(self) -> Optional[CacheStats]:
+        """
+        How well the result cache does, or None if the collection has none.
+        """
+        return self._cache.stats if self._cache is not None else None
+
+    def _key_of(self, document: Mapping[str, Any]) -> Any:
+        if self._key not in document:
+            raise ValueError(f"Document is missing its partition key '{self._key}'")
+        return document[self._key]
+
+    def _route(self, filters: Optional[QueryFilter]) -> Optional[List[Any]]:
+        """
+        Return the partition keys the documents matching the filters may have, or None if they
+        may have any.
+        """
+        if filters is None:
+            return None
+        if isinstance(filters, Comparison):
+            if filters.path in self._owners:
+                return self._owned(self._owners[filters.path], filters)
+            if filters.path != self._key:
+                return None
+            if filters.op == "$eq":
+                return [filters.value]
+            if filters.op == "$in" and isinstance(filters.value, list):
+                return list(filters.value)
+            return None
+        routes = [self._route(expression) for expression in filters.expressions]
+        if isinstance(filters, And):
+            pinned = [route for route in routes if route is not None]
+            if not pinned:
+                return None
+            keys = pinned[0]
+            for route in pinned[1:]:
+                keys = [key for key in keys if key in route]
+            return keys
+        if any(route is None for route in routes):
+            return None
+        return [key for route in routes if route is not None for key in route]
+
+    def _owned(self, owners: Dict[Any, Any], comparison: Comparison) -> Optional[List[Any]]:
+        """
+        Return the keys of the partitions holding the values a comparison on a field unique
+        across partitions may match, or None if they may be anywhere.
+        """
+        values: List[Any]
+        if comparison.op == "$eq":
+            values = [comparison.value]
+        elif comparison.op == "$in" and isinstance(comparison.value, list):
+            values = comparison.value
+        else:
+            return None
+        # Values the index leaves out are not known to be in any partition in particular.
+        if not all(is_indexable(value) for value in values):
+            return None
+        return [owners[value] for value in values if value in owners]
+
+    def _select(
+        self, filters: Optional[QueryFilter]
+    ) -> List[Tuple[Any, MemoryDocumentCollection[TDocument]]]:
+        """
+        Return the partitions holding the documents matching the filters, with their keys.
+        """
+        keys = self._route(filters)
+        if keys is None:
+            return list(self._partitions.items())
+        return [
+            (key, self._partitions[key]) for key in dict.fromkeys(keys) if key in self._partitions
+        ]
+
+    def _partition(self, key: Any) -> MemoryDocumentCollection[TDocument]:
+        partition = self._partitions.get(key)
+        if partition is None:
+            partition = self._factory()
+            # Partitions publish their writes to the feed of the collection, in a single sequence,
+            # and invalidate its cache.
+            partition._changes = self._changes
+            partition._cache = self._cache
+            for fields, (unique, ordered) in self._specs.items():
+                if fields[0] in self._owners:
+                    partition._indexes[fields] = _OwnedHashIndex(
+                        fields[0], self._owners[fields[0]], key
+                    )
+                else:
+                    partition._create_index(fields, unique, ordered)
+            self._partitions[key] = partition
+        return partition
+
+    def _release(self, key: Any) -> None:
+        """
+        Drop a partition once it is empty, so that memory follows the live partitions.
+        """
+        partition = self._partitions.get(key)
+        if partition is not None and partition._size == 0:
+            del self._partitions[key]
+
+    def _map(
+        self,
+        function: Callable[[MemoryDocumentCollection[TDocument]], T],
+        partitions: Sequence[MemoryDocumentCollection[TDocument]],
+    ) -> List[T]:
+        """
+        Call a function on every partition, large partitions on the executor if there is one.
+        """
+        futures: List[Optional[Future[T]]] = [
+            self._executor.submit(function, partition)
+            if self._executor is not None and partition._size >= PARALLEL_THRESHOLD
+            else None
+            for partition in partitions
+        ]
+        # Small partitions are read in the meantime. Blocking on the executor rather than
+        # awaiting it keeps writers out until every partition is read.
+        return [
+            function(partition) if future is None else future.result()
+            for partition, future in zip(partitions, futures)
+        ]
+
+    def _check_page(self, limit: Optional[int], offset: Optional[int]) -> None:
+        if offset is not None and offset < 0:
+            raise ValueError("Offset must be non-negative")
+        if limit is not None and limit < 0:
+            raise ValueError("Limit must be non-negative")
+
+    def _execute(
+        self,
+        partitions: Sequence[MemoryDocumentCollection[TDocument]],
+        filters: Optional[QueryFilter],
+        limit: Optional[int],
+        offset: Optional[int],
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]],
+        projection: Optional[Mapping[str, Projection]],
+    ) -> Tuple[QueryPlan, List[TDocument], int]:
+        """
+        Run a query over several partitions, returning the plan of each, the merged (projected)
+        documents and the number of documents examined.
+        """
+        self._check_page(limit, offset)
+        start = offset or 0
+        stop = start + limit if limit is not None else None
+        # Each partition returns its share of the page, unprojected so that the merge can still
+        # read the sort fields.
+        results = self._map(
+            lambda partition: partition._execute(filters, stop, None, sort), partitions
+        )
+        merged = chain.from_iterable(docs for _, docs, _ in results)
+        if sort:
+            docs = sort_documents(merged, sort, k=stop)[start:]
+        else:
+            docs = list(islice(merged, start, stop))
+        if projection:
+            project = compile_projection(projection)
+            docs = [cast(TDocument, project(doc)) for doc in docs]
+        plan = QueryPlan(stage=PlanStage.PARTITIONS, children=[plan for plan, _, _ in results])
+        return plan, docs, sum(examined for _, _, examined in results)
+
+    async def find(
+        self,
+        filters: Optional[QueryFilter] = None,
+        projection: Optional[Mapping[str, Projection]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]] = None,
+    ) -> Sequence[TDocument]:
+        partitions = [partition for _, partition in self._select(filters)]
+        if len(partitions) == 1:
+            # The partition caches the result, in the cache of the collection.
+            return await partitions[0].find(filters, projection, limit, offset, sort)
+        if self._cache is None:
+            docs = await self._find(partitions, filters, projection, limit, offset, sort)
+        else:
+            # Projected documents are built by the query: callers get copies of their own, unless
+            # they are handed read-only views.
+            docs = await self._cache.fetch(
+                query_key(filters, projection, limit, offset, sort),
+                lambda: self._find(partitions, filters, projection, limit, offset, sort),
+                compile_projection(projection) if projection and not self._read_only else None,
+            )
+        if self._read_only:
+            docs = [self._output(doc) for doc in docs]
+        return docs
+
+    async def _find(
+        self,
+        partitions: Sequence[MemoryDocumentCollection[TDocument]],
+        filters: Optional[QueryFilter],
+        projection: Optional[Mapping[str, Projection]],
+        limit: Optional[int],
+        offset: Optional[int],
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]],
+    ) -> List[TDocument]:
+        if self._executor is None and self._cooperative(partitions, filters):
+            return await self._find_cooperatively(
+                partitions, filters, projection, limit, offset, sort
+            )
+        _, docs, _ = self._execute(partitions, filters, limit, offset, sort, projection)
+        return docs
+
+    def _cooperative(
+        self,
+        partitions: Sequence[MemoryDocumentCollection[TDocument]],
+        filters: Optional[QueryFilter],
+    ) -> bool:
+        """
+        Whether reading the partitions is large enough to share the event loop as it goes.
+        """
+        if self._scan_threshold is None:
+            return False
+        return sum(partition._plan(filters).rows for partition in partitions) > self._scan_threshold
+
+    def _scan(
+        self,
+        partitions: Sequence[MemoryDocumentCollection[TDocument]],
+        filters: Optional[QueryFilter],
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]],
+    ) -> Matches[TDocument]:
+        """
+        Start reading the matching documents of every partition, partition by partition.
+        """
+        # Start reading every partition at once, so that they all see the same point in time.
+        # The merge sorts every match again, whatever order each partition reads them in.
+        return chain.from_iterable([partition._scan(filters, sort)[0] for partition in partitions])
+
+    async def _find_cooperatively(
+        self,
+        partitions: Sequence[MemoryDocumentCollection[TDocument]],
+        filters: Optional[QueryFilter],
+        projection: Optional[Mapping[str, Projection]],
+        limit: Optional[int],
+        offset: Optional[int],
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]],
+    ) -> List[TDocument]:
+        """
+        Run a large query over several partitions like `_execute`, letting other tasks run while
+        it does.
+        """
+        self._check_page(limit, offset)
+        start = offset or 0
+        stop = start + limit if limit is not None else None
+        matches = self._scan(partitions, filters, sort)
+        docs = await collect(matches, start, stop, sort, self._scan_threshold)
+        if projection:
+            project = compile_projection(projection)
+            docs = [cast(TDocument, project(doc)) for doc in docs]
+        return docs
+
+    async def find_iter(
+        self,
+        filters: Optional[QueryFilter] = None,
+        projection: Optional[Mapping[str, Projection]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]] = None,
+        batch_size: int = 100,
+    ) -> AsyncIterator[TDocument]:
+        if batch_size <= 0:
+            raise ValueError("Batch size must be positive")
+        partitions = [partition for _, partition in self._select(filters)]
+        if len(partitions) == 1:
+            async for doc in partitions[0].find_iter(
+                filters, projection, limit, offset, sort, batch_size
+            ):
+                yield doc
+            return
+        self._check_page(limit, offset)
+        start = offset or 0
+        stop = start + limit if limit is not None else None
+        project: Optional[Projector] = compile_projection(projection) if projection else None
+
+        matches = self._scan(partitions, filters, sort)
+        results: Matches[TDocument]
+        if sort:
+            results = iter(await collect(matches, start, stop, sort, self._scan_threshold))
+        else:
+            results = paginate(matches, start, stop)
+
+        pending = 0
+        for match in results:
+            if match is not None:
+                yield self._output(cast(TDocument, project(match)) if project else match)
+                pending += 1
+                if pending < batch_size:
+                    continue
+            # Let other tasks run between batches, and while looking for the next batch.
+            pending = 0
+            await asyncio.sleep(0)
+
+    async def find_one(
+        self,
+        filters: Optional[QueryFilter] = None,
+        projection: Optional[Mapping[str, Projection]] = None,
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]] = None,
+    ) -> Optional[TDocument]:
+        docs = await self.find(filters, projection=projection, limit=1, sort=sort)
+        return docs[0] if docs else None
+
+    async def count(self, filters: Optional[QueryFilter] = None) -> int:
+        return sum([await partition.count(filters) for _, partition in self._select(filters)])
+
+    async def exists(self, filters: Optional[QueryFilter] = None) -> bool:
+        for _, partition in self._select(filters):
+            if await partition.exists(filters):
+                return True
+        return False
+
+    async def aggregate(
+        self,
+        filters: Optional[QueryFilter],
+        group_by: Sequence[str],
+        accumulators: Mapping[str, Accumulator],
+    ) -> Sequence[Dict[str, Any]]:
+        aggregation = Aggregation(group_by, accumulators)
+        # Fold or start reading every partition before letting other tasks run, so that they all
+        # see the same point in time.
+        folds = [partition._fold(filters, aggregation) for _, partition in self._select(filters)]
+        for matches in folds:
+            if matches is not None:
+                await aggregation.add_all(matches)
+        return aggregation.results()
+
+    async def explain(
+        self,
+        filters: Optional[QueryFilter] = None,
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        projection: Optional[Mapping[str, Projection]] = None,
+    ) -> ExplainResult:
+        partitions = [partition for _, partition in self._select(filters)]
+        if len(partitions) == 1:
+            result = await partitions[0].explain(filters, sort, limit, offset, projection)
+            plan = QueryPlan(stage=PlanStage.PARTITIONS, children=[result.plan])
+            return ExplainResult(
+                plan=plan,
+                documents_examined=result.documents_examined,
+                documents_returned=result.documents_returned,
+            )
+        plan, docs, examined = self._execute(partitions, filters, limit, offset, sort, projection)
+        return ExplainResult(plan=plan, documents_examined=examined, documents_returned=len(docs))
+
+    async def insert_one(self, document: TDocument) -> InsertOneResult:
+        key = self._key_of(document)
+        try:
+            return await self._partition(key).insert_one(document)
+        finally:
+            self._release(key)
+
+    async def insert_many(self, documents: Sequence[TDocument]) -> InsertManyResult:
+        groups: Dict[Any, List[TDocument]] = {}
+        for document in documents:
+            groups.setdefault(self._key_of(document), []).append(document)
+        try:
+            partitions = [(self._partition(key), docs) for key, docs in groups.items()]
+            for partition, docs in partitions:
+                partition._validate_many(docs)
+            # Index the documents of every partition before storing any, so that a document
+            # rejected by an index leaves every partition unchanged.
+            indexed: List[Tuple[MemoryDocumentCollection[TDocument], List[Tuple[int, Any]]]] = []
+            try:
+                for partition, docs in partitions:
+                    entries = list(enumerate(docs, len(partition._slots)))
+                    partition._index_many(entries)
+                    indexed.append((partition, entries))
+            except ValueError:
+                for partition, entries in indexed:
+                    for index in partition._indexes.values():
+                        index.remove_many(entries)
+                raise
+            for partition, docs in partitions:
+                partition._extend(docs)
+        finally:
+            for key in groups:
+                self._release(key)
+        inserted_ids: List[DocumentID] = [document["id"] for document in documents]
+        return InsertManyResult(acknowledged=True, inserted_ids=inserted_ids)
+
+    async def _reject_moves(
+        self,
+        partitions: Sequence[MemoryDocumentCollection[TDocument]],
+        filters: QueryFilter,
+        patch: List[JSONPatchOperation],
+    ) -> None:
+        if not _writes(patch, self._key):
+            return
+        for partition in partitions:
+            if await partition.exists(filters):
+                raise ValueError(f"Updates cannot change the partition key '{self._key}'")
+
+    def _upsert(self, patch: List[JSONPatchOperation]) -> DocumentID:
+        key = self._key_of(apply_patch({}, patch))
+        try:
+            return self._partition(key)._upsert(patch)
+        finally:
+            self._release(key)
+
+    async def update_one(
+        self, filters: QueryFilter, patch: List[JSONPatchOperation], upsert: bool = False
+    ) -> UpdateOneResult:
+        partitions = [partition for _, partition in self._select(filters)]
+        await self._reject_moves(partitions, filters, patch)
+        for partition in partitions:
+            result = await partition.update_one(filters, patch)
+            if result.matched_count:
+                return result
+        return UpdateOneResult(
+            acknowledged=True,
+            matched_count=0,
+            modified_count=0,
+            upserted_id=self._upsert(patch) if upsert else None,
+        )
+
+    async def update_many(
+        self, filters: QueryFilter, patch: List[JSONPatchOperation], upsert: bool = False
+    ) -> UpdateManyResult:
+        partitions = [partition for _, partition in self._select(filters)]
+        await self._reject_moves(partitions, filters, patch)
+        # Patch the documents of every partition before storing any, so that an invalid patch or
+        # a document rejected by an index leaves every partition unchanged.
+        staged = [(partition, *partition._patch_many(filters, patch)) for partition in partitions]
+        staged = [
+            (partition, positions, docs) for partition, positions, docs in staged if positions
+        ]
+        if not staged:
+            return UpdateManyResult(
+                acknowledged=True,
+                matched_count=0,
+                modified_count=0,
+                upserted_id=self._upsert(patch) if upsert else None,
+            )
+        replaced: List[Tuple[MemoryDocumentCollection[TDocument], List[int], List[TDocument]]] = []
+        try:
+            for partition, positions, updated in staged:
+                previous = [partition._document(i) for i in positions]
+                partition._replace_many(positions, updated)
+                replaced.append((partition, positions, previous))
+        except ValueError:
+            for partition, positions, previous in replaced:
+                partition._replace_many(positions, previous)
+            raise
+        for partition, positions, updated in staged:
+            partition._patched(positions, updated, patch)
+        matched = sum(len(positions) for _, positions, _ in staged)
+        return UpdateManyResult(
+            acknowledged=True, matched_count=matched, modified_count=matched, upserted_id=None
+        )
+
+    async def delete_one(self, filters: QueryFilter) -> DeleteResult[TDocument]:
+        for key, partition in self._select(filters):
+            result = await partition.delete_one(filters)
+            if result.deleted_count:
+                self._release(key)
+                return result
+        return DeleteResult(acknowledged=True, deleted_count=0, deleted_document=None)
+
+    async def delete_many(self, filters: QueryFilter) -> DeleteResult[TDocument]:
+        deleted = 0
+        for key, partition in self._select(filters):
+            deleted += (await partition.delete_many(filters)).deleted_count
+            self._release(key)
+        return DeleteResult(acknowledged=True, deleted_count=deleted, deleted_document=None)
+
+    def watch(
+        self,
+        filters: Optional[QueryFilter] = None,
+        resume_after: Optional[str] = None,
+        buffer_size: int = BUFFER_SIZE,
+    ) -> ChangeStream[TDocument]:
+        return self._changes.watch(filters, resume_after, buffer_size)
+
+    async def create_index(
+        self, field: Union[str, Sequence[str]], unique: bool = False, ordered: bool = False
+    ) -> None:
+        fields = (field,) if isinstance(field, str) else tuple(field)
+        if not fields:
+            raise ValueError("An index requires at least one field")
+        # Compound indexes are always ordered.
+        ordered = ordered or len(fields) > 1
+        owned = unique and self._key not in fields
+        if owned and ordered:
+            raise ValueError(
+                f"Unique indexes of a partitioned collection must include its partition key "
+                f"'{self._key}', or be hash indexes on a single field"
+            )
+        existing = self._specs.get(fields)
+        if existing is not None:
+            if existing != (unique, ordered):
+                raise ValueError(f"Index on {fields} already exists with different options")
+            return
+        if owned:
+            self._create_owned_index(fields[0])
+            return
+        indexed: List[MemoryDocumentCollection[TDocument]] = []
+        try:
+            for partition in self._partitions.values():
+                await partition.create_index(fields, unique, ordered)
+                indexed.append(partition)
+        except ValueError:
+            for partition in indexed:
+                del partition._indexes[fields]
+            raise
+        self._specs[fields] = (unique, ordered)
+
+    def _create_owned_index(self, field: str) -> None:
+        """
+        Create a hash index on a field unique across partitions.
+        """
+        owners: Dict[Any, Any] = {}
+        indexes = {
+            key: _OwnedHashIndex(field, owners, key) for key, partition in self._partitions.items()
+        }
+        # Index every partition before any of them, as a value found in two partitions leaves
+        # the collection without the index.
+        for key, index in indexes.items():
+            index.add_many(list(self._partitions[key]._documents()))
+        for key, index in indexes.items():
+            self._partitions[key]._indexes[(field,)] = index
+        self._owners[field] = owners
+        self._specs[(field,)] = (True, False)
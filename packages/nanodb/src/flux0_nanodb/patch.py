@@ -0,0 +1,160 @@
+from typing import Any, Dict, List, Mapping, Sequence, Union
+
+import jsonpatch
+
+from flux0_nanodb.common import convert_patch
+from flux0_nanodb.types import JSONPatchOperation
+
+Container = Union[Dict[str, Any], List[Any]]
+
+
+def _parse_pointer(path: str) -> List[str]:
+    if path == "":
+        return []
+    if not path.startswith("/"):
+        raise ValueError(f"Invalid JSON pointer {path!r}")
+    return [part.replace("~1", "/").replace("~0", "~") for part in path[1:].split("/")]
+
+
+def _list_index(part: str, size: int) -> int:
+    # Array indices are non-negative decimal numbers without leading zeros.
+    if not part.isdigit() or (len(part) > 1 and part[0] == "0"):
+        raise ValueError(f"Invalid array index {part!r}")
+    index = int(part)
+    if index >= size:
+        raise ValueError(f"Array index {index} out of range")
+    return index
+
+
+def _child(node: Any, part: str) -> Any:
+    if isinstance(node, dict):
+        if part not in node:
+            raise ValueError(f"Member {part!r} not found")
+        return node[part]
+    if isinstance(node, list):
+        return node[_list_index(part, len(node))]
+    raise ValueError(f"Cannot descend into {type(node).__name__} with {part!r}")
+
+
+class _Patcher:
+    """
+    Applies operations to a document copy-on-write: a container is shallowly copied the first
+    time it is modified, along with its ancestors, and everything else is shared with the
+    original document.
+    """
+
+    def __init__(self, document: Mapping[str, Any]) -> None:
+        self.root: Any = document
+        # Copies are kept alive so that their ids cannot be reused by other objects.
+        self._owned: Dict[int, Container] = {}
+
+    def _own(self, node: Any) -> Container:
+        if id(node) in self._owned:
+            return node  # type: ignore[no-any-return]
+        if isinstance(node, dict):
+            copy: Container = dict(node)
+        elif isinstance(node, list):
+            copy = list(node)
+        else:
+            raise ValueError(f"Cannot modify a {type(node).__name__}")
+        self._owned[id(copy)] = copy
+        return copy
+
+    def _parent(self, parts: List[str]) -> Container:
+        """
+        Return the container holding the target of `parts`, made safe to modify.
+        """
+        node = self._own(self.root)
+        self.root = node
+        for part in parts[:-1]:
+            child = _child(node, part)
+            owned = self._own(child)
+            if owned is not child:
+                if isinstance(node, dict):
+                    node[part] = owned
+                else:
+                    node[int(part)] = owned
+            node = owned
+        return node
+
+    def add(self, parts: List[str], value: Any) -> None:
+        if not parts:
+            self.root = value
+            return
+        parent, part = self._parent(parts), parts[-1]
+        if isinstance(parent, dict):
+            parent[part] = value
+        elif part == "-":
+            parent.append(value)
+        else:
+            parent.insert(_list_index(part, len(parent) + 1), value)
+
+    def remove(self, parts: List[str]) -> None:
+        if not parts:
+            raise ValueError("Cannot remove the whole document")
+        parent, part = self._parent(parts), parts[-1]
+        if isinstance(parent, dict):
+            if part not in parent:
+                raise ValueError(f"Member {part!r} not found")
+            del parent[part]
+        else:
+            del parent[_list_index(part, len(parent))]
+
+    def replace(self, parts: List[str], value: Any) -> None:
+        if not parts:
+            self.root = value
+            return
+        parent, part = self._parent(parts), parts[-1]
+        if isinstance(parent, dict):
+            if part not in parent:
+                raise ValueError(f"Member {part!r} not found")
+            parent[part] = value
+        else:
+            parent[_list_index(part, len(parent))] = value
+
+    def test(self, parts: List[str], value: Any) -> None:
+        node = self.root
+        for part in parts:
+            node = _child(node, part)
+        if node != value:
+            raise ValueError(f"Test failed: {node!r} is not {value!r}")
+
+
+def apply_patch(document: Mapping[str, Any], patch: Sequence[JSONPatchOperation]) -> Dict[str, Any]:
+    """
+    Apply a JSON Patch (RFC 6902) to a document and return the patched document, leaving the
+    original untouched.
+
+    Only the containers on the paths being modified are copied, the rest is shared with the
+    original, so patching a single field of a large document stays cheap. Patches with `move` or
+    `copy` operations are handed over to `jsonpatch`. Raises a ValueError if the patch cannot be
+    applied.
+    """
+    if any(op["op"] in ("move", "copy") for op in patch):
+        try:
+            patched: Dict[str, Any] = jsonpatch.apply_patch(
+                document, convert_patch(list(patch)), in_place=False
+            )
+        except (jsonpatch.JsonPatchException, jsonpatch.JsonPointerException) as e:
+            raise ValueError("Invalid JSON patch") from e
+        return patched
+
+    patcher = _Patcher(document)
+    for op in patch:
+        try:
+            parts = _parse_pointer(op["path"])
+            if op["op"] == "add":
+                patcher.add(parts, op["value"])
+            elif op["op"] == "remove":
+                patcher.remove(parts)
+            elif op["op"] == "replace":
+                patcher.replace(parts, op["value"])
+            elif op["op"] == "test":
+                patcher.test(parts, op["value"])
+            else:
+                raise ValueError(f"Unknown operation {op['op']!r}")
+        except (KeyError, ValueError) as e:
+            raise ValueError("Invalid JSON patch") from e
+    if not isinstance(patcher.root, dict):
+        raise ValueError("Invalid JSON patch: the result is not a document")
+    return patcher.root
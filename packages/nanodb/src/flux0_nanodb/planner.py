@@ -0,0 +1,346 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from typing import (
+    Any,
+    Callable,
+    FrozenSet,
+    List,
+    Literal,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    cast,
+)
+
+from flux0_nanodb.index import HashIndex, Index, OrderedIndex, is_indexable, ordered_key
+from flux0_nanodb.query import And, Comparison, LiteralValue, Or, QueryFilter, is_orderable
+from flux0_nanodb.types import PlanStage, QueryPlan
+
+# Relative costs of touching an index entry, of evaluating the filter against a document, and
+# the fixed overhead of intersecting one more input.
+ENTRY_COST = 0.1
+EXAMINE_COST = 1.0
+INTERSECT_COST = 1.0
+
+# A condition on a field that an index can enforce: an equality, a membership, or one side of a
+# range.
+Constraint = Tuple[Literal["eq", "in", "lower", "upper"], str]
+
+# Candidate positions along with the values of the indexed fields, in ascending position order.
+Items = List[Tuple[int, Tuple[Any, ...]]]
+
+
+class Plan(ABC):
+    """
+    A node of an execution plan. `rows` estimates how many positions the node yields and `cost`
+    how much work producing them takes, excluding the examination of the documents themselves.
+    """
+
+    rows: float
+    cost: float
+    # Whether every candidate is known to match the filter, so that counting the candidates
+    # answers the query without examining any document.
+    exact: bool = False
+
+    @property
+    def total_cost(self) -> float:
+        return self.cost + self.rows * EXAMINE_COST
+
+    @abstractmethod
+    def positions(self) -> Optional[List[int]]:
+        """
+        Return the ascending candidate positions, or None if every document is a candidate.
+        """
+        pass
+
+    @abstractmethod
+    def describe(self) -> QueryPlan:
+        pass
+
+
+class FullScan(Plan):
+    def __init__(self, size: int) -> None:
+        self.rows = size
+        self.cost = 0
+
+    def positions(self) -> Optional[List[int]]:
+        return None
+
+    def describe(self) -> QueryPlan:
+        return QueryPlan(stage=PlanStage.FULL_SCAN)
+
+
+class IndexSeek(Plan):
+    def __init__(
+        self,
+        index: Index,
+        rows: int,
+        seek: Callable[[], List[int]],
+        materialized: bool = False,
+        constraints: FrozenSet[Constraint] = frozenset(),
+        items: Optional[Callable[[], Items]] = None,
+    ) -> None:
+        self.index = index
+        self.rows = rows
+        # The constraints of the filter the seek enforces on its own.
+        self.constraints = constraints
+        # Reading positions the index already holds as a list costs nothing per entry.
+        self.cost = 0 if materialized else rows * ENTRY_COST
+        self._seek = seek
+        self._items = items
+
+    def positions(self) -> Optional[List[int]]:
+        return self._seek()
+
+    def items(self) -> Optional[Items]:
+        """
+        Return the candidates with the values of the indexed fields, or None if the seek cannot
+        provide them.
+        """
+        return self._items() if self._items is not None else None
+
+    def describe(self) -> QueryPlan:
+        return QueryPlan(stage=PlanStage.INDEX_SEEK, index=self.index.fields)
+
+
+class IndexIntersection(Plan):
+    def __init__(self, children: Sequence[Plan], size: int) -> None:
+        self.children = sorted(children, key=lambda c: c.rows)
+        # Assume the children select independently of each other.
+        rows = self.children[0].rows
+        for child in self.children[1:]:
+            rows *= child.rows / size if size else 0
+        self.rows = rows
+        # Every input is read in full to intersect it with the others.
+        self.cost = (
+            sum(c.cost + c.rows * ENTRY_COST for c in self.children)
+            + (len(self.children) - 1) * INTERSECT_COST
+        )
+
+    def positions(self) -> Optional[List[int]]:
+        result: Optional[set[int]] = None
+        for child in self.children:
+            positions = child.positions()
+            assert positions is not None
+            result = set(positions) if result is None else result.intersection(positions)
+            if not result:
+                return []
+        return sorted(result or ())
+
+    def describe(self) -> QueryPlan:
+        return QueryPlan(
+            stage=PlanStage.INDEX_INTERSECTION, children=[c.describe() for c in self.children]
+        )
+
+
+class IndexUnion(Plan):
+    def __init__(self, children: Sequence[Plan]) -> None:
+        self.children = list(children)
+        self.exact = all(c.exact for c in self.children)
+        self.rows = sum(c.rows for c in self.children)
+        self.cost = sum(c.cost for c in self.children)
+
+    def positions(self) -> Optional[List[int]]:
+        result: set[int] = set()
+        for child in self.children:
+            positions = child.positions()
+            assert positions is not None
+            result.update(positions)
+        return sorted(result)
+
+    def describe(self) -> QueryPlan:
+        return QueryPlan(
+            stage=PlanStage.INDEX_UNION, children=[c.describe() for c in self.children]
+        )
+
+
+class QueryPlanner:
+    """
+    Chooses how to find the candidates of a filter: a single index seek, the intersection of
+    several seeks (for `And`), the union of seeks (for `Or`), or a full scan, whichever is
+    estimated to be the cheapest.
+    """
+
+    def __init__(self, indexes: Mapping[Tuple[str, ...], Index], size: int) -> None:
+        self._indexes = indexes
+        self._size = size
+
+    def plan(self, filters: Optional[QueryFilter]) -> Plan:
+        full_scan = FullScan(self._size)
+        if filters is None:
+            return full_scan
+        plan = self._plan(filters)
+        if plan is None or plan.total_cost > full_scan.total_cost:
+            return full_scan
+        return plan
+
+    def _plan(self, filters: QueryFilter) -> Optional[Plan]:
+        if isinstance(filters, Comparison):
+            return self._plan_conjunction([filters], [])
+        elif isinstance(filters, And):
+            comparisons = [expr for expr in filters.expressions if isinstance(expr, Comparison)]
+            nested = [
+                self._plan(expr) for expr in filters.expressions if not isinstance(expr, Comparison)
+            ]
+            return self._plan_conjunction(comparisons, nested)
+        elif isinstance(filters, Or):
+            # Every branch has to be indexed, otherwise some matches could be missed.
+            children: List[Plan] = []
+            for expr in filters.expressions:
+                plan = self._plan(expr)
+                if plan is None:
+                    return None
+                children.append(plan)
+            return IndexUnion(children)
+        return None
+
+    def _plan_conjunction(
+        self, comparisons: Sequence[Comparison], nested: Sequence[Optional[Plan]]
+    ) -> Optional[Plan]:
+        equalities: dict[str, LiteralValue] = {}
+        memberships: dict[str, List[LiteralValue]] = {}
+        lowers: dict[str, Tuple[LiteralValue, bool]] = {}
+        uppers: dict[str, Tuple[LiteralValue, bool]] = {}
+        # The constraints every candidate has to satisfy, or None if some comparison cannot be
+        # enforced by an index at all.
+        required: Optional[set[Constraint]] = set()
+        for c in comparisons:
+            constraint: Optional[Constraint] = None
+            if c.op == "$eq" and is_indexable(c.value) and c.value == c.value:
+                constraint = ("eq", c.path)
+                equalities.setdefault(c.path, cast(LiteralValue, c.value))
+            elif c.op == "$in" and isinstance(c.value, list):
+                constraint = ("in", c.path)
+                memberships.setdefault(c.path, c.value)
+            elif c.op in ("$gt", "$gte") and is_orderable(c.value, c.value):
+                constraint = ("lower", c.path)
+                lowers.setdefault(c.path, (cast(LiteralValue, c.value), c.op == "$gte"))
+            elif c.op in ("$lt", "$lte") and is_orderable(c.value, c.value):
+                constraint = ("upper", c.path)
+                uppers.setdefault(c.path, (cast(LiteralValue, c.value), c.op == "$lte"))
+            # Only the first comparison of each kind on a field is used to seek.
+            if constraint is None or (required is not None and constraint in required):
+                required = None
+            elif required is not None:
+                required.add(constraint)
+
+        inputs: List[Plan] = [plan for plan in nested if plan is not None]
+        for index in self._indexes.values():
+            seek = self._plan_seek(index, equalities, memberships, lowers, uppers)
+            if seek is not None:
+                inputs.append(seek)
+        if not inputs:
+            return None
+
+        # Start from the most selective input and keep intersecting with the next one as long
+        # as the cost of reading its entries is repaid by fewer documents to examine.
+        inputs.sort(key=lambda p: p.rows)
+        best: Plan = inputs[0]
+        chosen = [best]
+        for candidate in inputs[1:]:
+            intersection = IndexIntersection([*chosen, candidate], self._size)
+            if intersection.total_cost >= best.total_cost:
+                break
+            best = intersection
+            chosen.append(candidate)
+
+        # The best plan may be a nested one, exact on its own: it is only exact here if every
+        # other branch is enforced too, so its exactness is set whatever the outcome.
+        exact = required is not None and all(
+            plan is not None and plan in chosen and plan.exact for plan in nested
+        )
+        if exact:
+            enforced: set[Constraint] = set()
+            for plan in chosen:
+                if isinstance(plan, IndexSeek):
+                    enforced |= plan.constraints
+            exact = required is not None and required <= enforced
+        best.exact = exact
+        return best
+
+    def _plan_seek(
+        self,
+        index: Index,
+        equalities: Mapping[str, LiteralValue],
+        memberships: Mapping[str, List[LiteralValue]],
+        lowers: Mapping[str, Tuple[LiteralValue, bool]],
+        uppers: Mapping[str, Tuple[LiteralValue, bool]],
+    ) -> Optional[Plan]:
+        if isinstance(index, HashIndex):
+            field = index.field
+            if field in equalities:
+                value = equalities[field]
+                return IndexSeek(
+                    index,
+                    len(index.lookup(value)),
+                    lambda: index.lookup(value),
+                    materialized=True,
+                    constraints=frozenset({("eq", field)}),
+                )
+            if field in memberships:
+                # Values the index holds as one, such as 1, 1.0 and True, seek the same entries.
+                values = list({v: v for v in memberships[field] if is_indexable(v)}.values())
+                return IndexSeek(
+                    index,
+                    sum(len(index.lookup(v)) for v in values),
+                    lambda: sorted({p for v in values for p in index.lookup(v)}),
+                    constraints=frozenset({("in", field)}),
+                )
+            return None
+
+        if isinstance(index, OrderedIndex):
+            # Use the longest run of leading fields compared for equality, then at most one
+            # range or membership on the field that follows.
+            prefix: List[LiteralValue] = []
+            constraints: set[Constraint] = set()
+            for field in index.fields:
+                if field not in equalities:
+                    break
+                prefix.append(equalities[field])
+                constraints.add(("eq", field))
+            next_field = index.fields[len(prefix)] if len(prefix) < len(index.fields) else None
+            ranged = next_field in lowers or next_field in uppers or next_field in memberships
+            width = len(prefix) + 1 if next_field is not None and ranged else len(prefix)
+            # Documents holding the fields sought but missing a later one would be missing from
+            # the result.
+            if width == 0 or not index.complete(width):
+                return None
+            if next_field is not None and (next_field in lowers or next_field in uppers):
+                lower, lower_inclusive = lowers.get(next_field, (None, True))
+                upper, upper_inclusive = uppers.get(next_field, (None, True))
+                # Bounds of different types select nothing, but the seek would not know that.
+                if lower is None or upper is None or is_orderable(lower, upper):
+                    constraints |= {("lower", next_field), ("upper", next_field)}
+                return IndexSeek(
+                    index,
+                    index.count(prefix, lower, lower_inclusive, upper, upper_inclusive),
+                    lambda: sorted(
+                        index.seek(prefix, lower, lower_inclusive, upper, upper_inclusive)
+                    ),
+                    constraints=frozenset(constraints),
+                    items=lambda: sorted(
+                        index.items(prefix, lower, lower_inclusive, upper, upper_inclusive)
+                    ),
+                )
+            if next_field is not None and next_field in memberships:
+                keyed = ((ordered_key(v), v) for v in memberships[next_field])
+                values = list({key: v for key, v in keyed if key is not None}.values())
+                return IndexSeek(
+                    index,
+                    sum(index.count([*prefix, v]) for v in values),
+                    lambda: sorted({p for v in values for p in index.seek([*prefix, v])}),
+                    constraints=frozenset(constraints | {("in", next_field)}),
+                )
+            if prefix:
+                # Entries sharing the whole key are already in position order.
+                seek = index.seek if next_field is None else (lambda p: sorted(index.seek(p)))
+                return IndexSeek(
+                    index,
+                    index.count(prefix),
+                    lambda: seek(prefix),
+                    constraints=frozenset(constraints),
+                    items=lambda: sorted(index.items(prefix)),
+                )
+        return None
@@ -1,6 +1,6 @@
 # projection.py
 from enum import Enum
-from typing import Any, Dict, Mapping
+from typing import Any, Callable, Dict, FrozenSet, List, Mapping, Optional, Tuple
 
 
 class Projection(Enum):
@@ -8,20 +8,15 @@ class Projection(Enum):
     EXCLUDE = 0
 
 
-def apply_projection(
-    document: Mapping[str, Any], projection: Mapping[str, Projection]
-) -> Dict[str, Any]:
-    """
-    Applies a projection on a document.
+# A compiled projection, building the projected form of a document.
+Projector = Callable[[Mapping[str, Any]], Dict[str, Any]]
 
-    - Inclusion: Only the specified fields are returned (plus _id by default).
-    - Exclusion: All fields are returned except the ones specified.
 
-    Deep selection (e.g. "address.city") is supported.
+def _split(projection: Mapping[str, Projection]) -> Tuple[bool, List[Tuple[str, ...]], bool]:
+    """
+    Return whether a projection is an inclusion, the paths it includes or excludes (split on
+    dots) and whether it keeps _id.
     """
-    if not projection:
-        return dict(document)
-
     # Determine inclusion or exclusion (ignoring _id)
     include_keys = [
         key for key, val in projection.items() if key != "_id" and val == Projection.INCLUDE
@@ -31,55 +26,102 @@ def apply_projection(
     ]
     if include_keys and exclude_keys:
         raise ValueError("Cannot mix inclusion and exclusion in projection (except for _id).")
+    keep_id = projection.get("_id", Projection.INCLUDE) != Projection.EXCLUDE
+    return (
+        bool(include_keys),
+        [tuple(key.split(".")) for key in include_keys or exclude_keys],
+        keep_id,
+    )
+
 
-    is_inclusion: bool = bool(include_keys)
+def compile_projection(projection: Mapping[str, Projection]) -> Projector:
+    """
+    Compile a projection into a function applying it to documents, so that a query reads the
+    projection once rather than once per document.
+
+    - Inclusion: Only the specified fields are returned (plus _id by default).
+    - Exclusion: All fields are returned except the ones specified.
+
+    Deep selection (e.g. "address.city") is supported.
+    """
+    if not projection:
+        return dict
+
+    is_inclusion, paths, keep_id = _split(projection)
 
     if is_inclusion:
-        result: Dict[str, Any] = {}
-        # Include _id by default unless explicitly excluded.
-        if projection.get("_id", Projection.INCLUDE) != Projection.EXCLUDE and "_id" in document:
-            result["_id"] = document["_id"]
 
-        for proj_key, proj_val in projection.items():
-            if proj_key == "_id" or proj_val != Projection.INCLUDE:
-                continue
-            parts = proj_key.split(".")
-            src: Any = document
-            valid = True
-            for part in parts:
-                if isinstance(src, dict) and part in src:
-                    src = src[part]
-                else:
-                    valid = False
-                    break
-            if valid:
-                current = result
-                for part in parts[:-1]:
-                    if part not in current or not isinstance(current[part], dict):
-                        current[part] = {}
-                    current = current[part]
-                current[parts[-1]] = src
-        return result
+        def include(document: Mapping[str, Any]) -> Dict[str, Any]:
+            result: Dict[str, Any] = {}
+            if keep_id and "_id" in document:
+                result["_id"] = document["_id"]
+            for parts in paths:
+                if len(parts) == 1:
+                    if parts[0] in document:
+                        result[parts[0]] = document[parts[0]]
+                    continue
+                src: Any = document
+                valid = True
+                for part in parts:
+                    if isinstance(src, Mapping) and part in src:
+                        src = src[part]
+                    else:
+                        valid = False
+                        break
+                if valid:
+                    current = result
+                    for part in parts[:-1]:
+                        if part not in current or not isinstance(current[part], dict):
+                            current[part] = {}
+                        current = current[part]
+                    current[parts[-1]] = src
+            return result
 
-    else:
+        return include
+
+    def exclude(document: Mapping[str, Any]) -> Dict[str, Any]:
         # Exclusion: start with a copy of the document and remove specified keys.
         result = dict(document)
-        if projection.get("_id", Projection.INCLUDE) == Projection.EXCLUDE:
+        if not keep_id:
             result.pop("_id", None)
-        for proj_key, proj_val in projection.items():
-            if proj_key == "_id" or proj_val != Projection.EXCLUDE:
-                continue
-            parts = proj_key.split(".")
+        for parts in paths:
             if len(parts) == 1:
-                result.pop(proj_key, None)
-            else:
-                current_result: Any = result
-                for part in parts[:-1]:
-                    if part in current_result and isinstance(current_result[part], dict):
-                        current_result = current_result[part]
-                    else:
-                        current_result = None
-                        break
-                if current_result is not None:
-                    current_result.pop(parts[-1], None)
+                result.pop(parts[0], None)
+                continue
+            current_result: Any = result
+            for part in parts[:-1]:
+                if part in current_result and isinstance(current_result[part], dict):
+                    # Copy the nested documents on the way, leaving the original untouched.
+                    current_result[part] = dict(current_result[part])
+                    current_result = current_result[part]
+                else:
+                    current_result = None
+                    break
+            if current_result is not None:
+                current_result.pop(parts[-1], None)
         return result
+
+    return exclude
+
+
+def projected_fields(projection: Mapping[str, Projection]) -> Optional[FrozenSet[str]]:
+    """
+    Return the fields kept by an inclusion projection, _id included unless it is excluded, or
+    None for an exclusion projection.
+    """
+    if not projection:
+        return None
+    is_inclusion, paths, keep_id = _split(projection)
+    if not is_inclusion:
+        return None
+    fields = frozenset(".".join(parts) for parts in paths)
+    return fields | {"_id"} if keep_id else fields
+
+
+def apply_projection(
+    document: Mapping[str, Any], projection: Mapping[str, Projection]
+) -> Dict[str, Any]:
+    """
+    Applies a projection on a document, see `compile_projection`.
+    """
+    return compile_projection(projection)(document)
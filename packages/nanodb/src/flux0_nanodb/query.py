@@ -1,10 +1,13 @@
 from __future__ import annotations
 
+import operator
 from dataclasses import dataclass
-from typing import Any, List, Literal, Mapping, Union
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Collection, Hashable, List, Literal, Mapping, Union
 
 # Basic literal types that can be used in comparisons.
-LiteralValue = Union[str, int, float, bool]
+LiteralValue = Union[str, int, float, bool, datetime]
 
 # Supported operators, now including "$in".
 Operator = Literal["$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in"]
@@ -44,42 +47,187 @@ class Or:
 QueryFilter = Union[Comparison, And, Or]
 
 
-def matches_query(query: QueryFilter, candidate: Mapping[str, Any]) -> bool:
-    if isinstance(query, Comparison):
-        path_value = candidate.get(query.path)
-
-        # Ensure path_value is one of the allowed types.
-        if not isinstance(path_value, (str, int, float, bool)):
-            return False  # Reject invalid types
-
-        if query.op == "$eq":
-            return path_value == query.value
-        elif query.op == "$ne":
-            return path_value != query.value
-        elif query.op == "$in":
-            # Ensure that query.value is a list before checking containment
-            if isinstance(query.value, list):
-                return path_value in query.value
-            else:
-                raise TypeError("$in operator requires a list as the value.")
-
-        # Ensure ordered comparisons are done only for int and float.
-        if isinstance(path_value, (int, float)) and isinstance(query.value, (int, float)):
-            if query.op == "$gt":
-                return path_value > query.value
-            elif query.op == "$gte":
-                return path_value >= query.value
-            elif query.op == "$lt":
-                return path_value < query.value
-            elif query.op == "$lte":
-                return path_value <= query.value
-
-        # If comparison is invalid (e.g., str compared with int), return False.
-        return False
+def is_orderable(left: Any, right: Any) -> bool:
+    """
+    Whether two values can take part in an ordered comparison ($gt, $gte, $lt, $lte).
+    Naive and timezone-aware datetimes cannot be compared with each other.
+    """
+    if isinstance(left, (int, float)) and isinstance(right, (int, float)):
+        return True
+    if isinstance(left, datetime) and isinstance(right, datetime):
+        return (left.tzinfo is None) == (right.tzinfo is None)
+    return False
+
+
+# Compiled form of a query filter: a predicate over candidate documents.
+Matcher = Callable[[Mapping[str, Any]], bool]
+
+_ALLOWED_TYPES = (str, int, float, bool, datetime)
+
+
+class _Opaque:
+    """
+    Wraps an unhashable operand so that it can be part of a canonical form, compared by identity.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any) -> None:
+        self.value = value
+
 
+def _freeze(value: Any) -> Hashable:
+    # Tag values with their type so that e.g. 1, 1.0 and True get their own cache entries.
+    if isinstance(value, list):
+        return (list, tuple(_freeze(v) for v in value))
+    try:
+        hash(value)
+    except TypeError:
+        return (_Opaque, _Opaque(value))
+    return (type(value), value)
+
+
+def _thaw(frozen: Any) -> Any:
+    kind, value = frozen
+    if kind is list:
+        return [_thaw(v) for v in value]
+    if kind is _Opaque:
+        return value.value
+    return value
+
+
+def canonical_form(query: QueryFilter) -> Hashable:
+    """
+    Return a hashable representation of a query filter; equal filters have equal forms.
+    """
+    if isinstance(query, Comparison):
+        return ("$cmp", query.path, query.op, _freeze(query.value))
     elif isinstance(query, And):
-        return all(matches_query(expr, candidate) for expr in query.expressions)
+        return ("$and", tuple(canonical_form(expr) for expr in query.expressions))
     elif isinstance(query, Or):
-        return any(matches_query(expr, candidate) for expr in query.expressions)
+        return ("$or", tuple(canonical_form(expr) for expr in query.expressions))
     else:
         raise TypeError("Invalid query filter type.")
+
+
+def _compile_comparison(path: str, op: str, value: Any) -> Matcher:
+    if op == "$eq":
+
+        def match_eq(candidate: Mapping[str, Any]) -> bool:
+            v = candidate.get(path)
+            return isinstance(v, _ALLOWED_TYPES) and v == value
+
+        return match_eq
+
+    elif op == "$ne":
+
+        def match_ne(candidate: Mapping[str, Any]) -> bool:
+            v = candidate.get(path)
+            return isinstance(v, _ALLOWED_TYPES) and v != value
+
+        return match_ne
+
+    elif op == "$in":
+        # Ensure that value is a list before checking containment
+        if not isinstance(value, list):
+            raise TypeError("$in operator requires a list as the value.")
+        values: Collection[Any]
+        try:
+            values = frozenset(value)
+        except TypeError:  # unhashable members can only be searched linearly
+            values = tuple(value)
+
+        def match_in(candidate: Mapping[str, Any]) -> bool:
+            v = candidate.get(path)
+            return isinstance(v, _ALLOWED_TYPES) and v in values
+
+        return match_in
+
+    elif op in ("$gt", "$gte", "$lt", "$lte"):
+        compare: Callable[[Any, Any], bool] = _ORDERED_OPERATORS[op]
+        # Ensure ordered comparisons are done only between numbers or between datetimes.
+        if isinstance(value, (int, float)):
+
+            def match_number(candidate: Mapping[str, Any]) -> bool:
+                v = candidate.get(path)
+                return isinstance(v, (int, float)) and compare(v, value)
+
+            return match_number
+
+        elif isinstance(value, datetime):
+            aware = value.tzinfo is not None
+
+            def match_datetime(candidate: Mapping[str, Any]) -> bool:
+                v = candidate.get(path)
+                return (
+                    isinstance(v, datetime)
+                    and (v.tzinfo is not None) == aware
+                    and compare(v, value)
+                )
+
+            return match_datetime
+
+    # If comparison is invalid (e.g., str compared with int), nothing matches.
+    return _match_nothing
+
+
+def _match_nothing(candidate: Mapping[str, Any]) -> bool:
+    return False
+
+
+_ORDERED_OPERATORS: Mapping[str, Callable[[Any, Any], bool]] = {
+    "$gt": operator.gt,
+    "$gte": operator.ge,
+    "$lt": operator.lt,
+    "$lte": operator.le,
+}
+
+
+@lru_cache(maxsize=1024)
+def _compile(form: Any) -> Matcher:
+    kind = form[0]
+    if kind == "$cmp":
+        _, path, op, value = form
+        return _compile_comparison(path, op, _thaw(value))
+
+    matchers = tuple(_compile(child) for child in form[1])
+    if kind == "$and":
+        if len(matchers) == 1:
+            return matchers[0]
+        if len(matchers) == 2:
+            first, second = matchers
+            return lambda candidate: first(candidate) and second(candidate)
+
+        def match_all(candidate: Mapping[str, Any]) -> bool:
+            for m in matchers:
+                if not m(candidate):
+                    return False
+            return True
+
+        return match_all
+
+    if len(matchers) == 1:
+        return matchers[0]
+
+    def match_any(candidate: Mapping[str, Any]) -> bool:
+        for m in matchers:
+            if m(candidate):
+                return True
+        return False
+
+    return match_any
+
+
+def compile_query(query: QueryFilter) -> Matcher:
+    """
+    Compile a query filter into a single predicate over candidate documents.
+
+    Operator dispatch, operand type checks and `$in` list-to-set conversion happen once, at
+    compile time, instead of for every candidate. Compiled matchers are cached by the
+    canonical form of the filter, so repeated queries skip compilation too.
+    """
+    return _compile(canonical_form(query))
+
+
+def matches_query(query: QueryFilter, candidate: Mapping[str, Any]) -> bool:
+    return compile_query(query)(candidate)
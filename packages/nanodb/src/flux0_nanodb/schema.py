@@ -0,0 +1,133 @@
+import dataclasses
+import keyword
+import types
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Mapping,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+    cast,
+    get_args,
+    get_origin,
+    get_type_hints,
+)
+
+from flux0_nanodb.types import TDocument
+
+T = TypeVar("T")
+
+
+@dataclasses.dataclass(frozen=True)
+class CompiledSchema:
+    """
+    The layout of a document schema (a TypedDict), worked out once so that validating a document
+    costs a single set comparison.
+    """
+
+    schema: Type[Any]
+    # Every field of the schema, in declaration order.
+    fields: Tuple[str, ...]
+    required: FrozenSet[str]
+    # The fields that may hold None.
+    nullable: FrozenSet[str]
+
+    def validate(self, document: Mapping[str, Any]) -> None:
+        """
+        Raise a TypeError if the document lacks a required field of the schema.
+        """
+        if self.required and not document.keys() >= self.required:
+            missing_keys = [key for key in self.fields if key in self.required - document.keys()]
+            raise TypeError(
+                f"TypedDict '{self.schema.__qualname__}' is missing required keys: "
+                f"{missing_keys}. Expected at least the keys: {list(self.required)}."
+            )
+
+
+def _is_nullable(hint: Any) -> bool:
+    return get_origin(hint) in (Union, types.UnionType) and type(None) in get_args(hint)
+
+
+_compiled: Dict[type, CompiledSchema] = {}
+
+
+def compile_schema(schema: Type[Any]) -> CompiledSchema:
+    """
+    Compile a document schema. Schemas are compiled once, and the result is shared.
+    """
+    compiled = _compiled.get(schema)
+    if compiled is not None:
+        return compiled
+    try:
+        hints: Dict[str, Any] = get_type_hints(schema)
+    except NameError:
+        # Annotations referring to names that cannot be resolved still give the layout.
+        hints = dict(getattr(schema, "__annotations__", {}))
+    fields = tuple(hints)
+    required = frozenset(getattr(schema, "__required_keys__", fields))
+    nullable = frozenset(field for field, hint in hints.items() if _is_nullable(hint))
+    compiled = CompiledSchema(schema, fields, required, nullable)
+    _compiled[schema] = compiled
+    return compiled
+
+
+def _compile(name: str, source: str, namespace: Dict[str, Any]) -> Callable[..., Any]:
+    exec(source, namespace)
+    return cast(Callable[..., Any], namespace[name])
+
+
+def compile_serializer(schema: Type[TDocument], source: type) -> Callable[..., TDocument]:
+    """
+    Generate a function building a document of `schema` from an instance of `source` (usually a
+    dataclass), copying each field of the schema from the attribute of the same name.
+
+    Fields of the schema that `source` has no attribute for become keyword-only arguments of the
+    function, e.g. the document version. The document is built by a single dict display, rather
+    than by inspecting the schema for every document.
+    """
+    attributes = (
+        {field.name for field in dataclasses.fields(source)}
+        if dataclasses.is_dataclass(source)
+        else set(get_type_hints(source))
+    )
+    layout = compile_schema(schema).fields
+    extra = [field for field in layout if field not in attributes]
+    for field in extra:
+        if not field.isidentifier() or keyword.iskeyword(field) or field == "_source":
+            raise ValueError(f"Field '{field}' cannot be passed as an argument")
+    items = ", ".join(
+        f"{field!r}: {field}" if field in extra else f"{field!r}: _source.{field}"
+        for field in layout
+    )
+    parameters = f", *, {', '.join(extra)}" if extra else ""
+    return _compile(
+        "serialize", f"def serialize(_source{parameters}):\n    return {{{items}}}\n", {}
+    )
+
+
+def compile_deserializer(schema: Type[Any], target: Type[T]) -> Callable[[Mapping[str, Any]], T]:
+    """
+    Generate a function building an instance of the dataclass `target` from a document of
+    `schema`, passing each field of `target` the field of the same name. Nullable fields may be
+    missing from documents.
+    """
+    compiled = compile_schema(schema)
+    arguments = []
+    for field in dataclasses.fields(cast(Any, target)):
+        if not field.init:
+            continue
+        if field.name not in compiled.fields:
+            raise ValueError(f"Field '{field.name}' is not part of {schema.__qualname__}")
+        if field.name in compiled.nullable:
+            arguments.append(f"{field.name}=document.get({field.name!r})")
+        else:
+            arguments.append(f"{field.name}=document[{field.name!r}]")
+    return _compile(
+        "deserialize",
+        f"def deserialize(document):\n    return _target({', '.join(arguments)})\n",
+        {"_target": target},
+    )
@@ -0,0 +1,696 @@
+import asyncio
+import io
+import os
+import pickle
+import struct
+from functools import lru_cache
+from itertools import count, islice
+from pathlib import Path
+from typing import (
+    Any,
+    AsyncIterator,
+    Coroutine,
+    Dict,
+    FrozenSet,
+    List,
+    Mapping,
+    NotRequired,
+    Optional,
+    Self,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    TypedDict,
+    Union,
+    cast,
+)
+
+from flux0_nanodb.api import DocumentCollection, DocumentDatabase
+from flux0_nanodb.changes import BUFFER_SIZE, ChangeFeed, ChangeStream
+from flux0_nanodb.projection import Projection
+from flux0_nanodb.query import And, Comparison, Or, QueryFilter
+from flux0_nanodb.schema import compile_schema
+from flux0_nanodb.types import (
+    Accumulator,
+    ChangeEvent,
+    DeleteResult,
+    ExplainResult,
+    InsertManyResult,
+    InsertOneResult,
+    JSONPatchOperation,
+    PlanStage,
+    QueryPlan,
+    SortingOrder,
+    TDocument,
+    UpdateManyResult,
+    UpdateOneResult,
+)
+
+# Every message is a pickle, preceded by its length and by the id of the request it belongs to,
+# so that a message that cannot be decoded fails that request alone.
+_HEADER = struct.Struct("!IQ")
+
+# What messages may be made of besides plain values: documents, queries, results and errors.
+# Classes are allowed by exact module and name, as a dotted name would reach whatever their
+# module imports.
+_CLASSES = frozenset(
+    {
+        (cls.__module__, cls.__qualname__)
+        for cls in (
+            Comparison,
+            And,
+            Or,
+            Projection,
+            SortingOrder,
+            Accumulator,
+            InsertOneResult,
+            InsertManyResult,
+            UpdateOneResult,
+            UpdateManyResult,
+            DeleteResult,
+            ChangeEvent,
+            PlanStage,
+            QueryPlan,
+            ExplainResult,
+        )
+    }
+    | {
+        ("builtins", "ValueError"),
+        ("builtins", "TypeError"),
+        ("builtins", "RuntimeError"),
+        ("builtins", "set"),
+        ("builtins", "frozenset"),
+        ("datetime", "datetime"),
+        ("datetime", "date"),
+        ("datetime", "time"),
+        ("datetime", "timedelta"),
+        ("datetime", "timezone"),
+    }
+)
+
+# The collection methods served, besides change streams.
+_METHODS = frozenset(
+    {
+        "find",
+        "find_one",
+        "count",
+        "exists",
+        "aggregate",
+        "explain",
+        "insert_one",
+        "insert_many",
+        "update_one",
+        "update_many",
+        "delete_one",
+        "delete_many",
+        "create_index",
+    }
+)
+
+# The requests a client's later requests wait for: writes, declarations and change streams.
+_ORDERED = frozenset(
+    {
+        "insert_one",
+        "insert_many",
+        "update_one",
+        "update_many",
+        "delete_one",
+        "delete_many",
+        "create_index",
+        "create_collection",
+        "get_collection",
+        "delete_collection",
+        "watch",
+    }
+)
+
+# A document schema as sent over the socket: its name, fields and required fields.
+SchemaLayout = Tuple[str, Tuple[str, ...], FrozenSet[str]]
+
+
+class _Unpickler(pickle.Unpickler):
+    def find_class(self, module: str, name: str) -> Any:
+        if (module, name) in _CLASSES:
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError(f"'{module}.{name}' is not allowed in nanodb messages")
+
+
+def _frame(request_id: int, message: Any) -> bytes:
+    body = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    return _HEADER.pack(len(body), request_id) + body
+
+
+async def _receive(reader: asyncio.StreamReader) -> Optional[Tuple[int, bytes]]:
+    """
+    Read the next message, undecoded, along with the id of its request, or return None once the
+    peer is gone.
+    """
+    try:
+        size, request_id = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+        body = await reader.readexactly(size)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    return request_id, body
+
+
+def _decode(body: bytes) -> Any:
+    return _Unpickler(io.BytesIO(body)).load()
+
+
+def _layout(schema: Type[Any]) -> SchemaLayout:
+    compiled = compile_schema(schema)
+    return compiled.schema.__qualname__, compiled.fields, compiled.required
+
+
+@lru_cache(maxsize=None)
+def _schema(layout: SchemaLayout) -> Type[Any]:
+    """
+    Rebuild a schema validating documents as the one it was taken from does.
+    """
+    name, fields, required = layout
+    hints = {field: Any if field in required else NotRequired[Any] for field in fields}
+    return cast(Type[Any], cast(Any, TypedDict)(name, hints))
+
+
+def _portable(error: Exception) -> Exception:
+    """
+    Return an error the client is able to rebuild: ValueError and TypeError as they are, any
+    other as a RuntimeError.
+    """
+    if type(error) in (ValueError, TypeError):
+        return error
+    return RuntimeError(f"{type(error).__name__}: {error}")
+
+
+class DatabaseServer:
+    """
+    Serves a database to the other processes of the host over a Unix domain socket, for them to
+    use through `RemoteDocumentDatabase`, e.g. the workers of a web server sharing the database
+    of their parent.
+
+    Each request is handled by a task of its own, so that a slow scan or sort holds up no other
+    request. Requests wait for the writes their client sent before them, so that a client always
+    reads its own writes, and writes of a client apply in the order they were sent. Declaring a
+    collection that already exists returns it, as each client declares the collections it uses.
+
+    The socket is only accessible to the user running the server: clients are trusted, as they
+    are given the whole database. Messages are pickles, restricted to plain values and to the
+    classes the protocol carries: requests holding anything else are refused.
+    """
+
+    def __init__(self, db: DocumentDatabase, path: Path) -> None:
+        self._db = db
+        self._path = path
+        self._collections: Dict[str, DocumentCollection[Any]] = {}
+        self._server: Optional[asyncio.Server] = None
+        self._connections: Set[asyncio.StreamWriter] = set()
+
+    async def __aenter__(self) -> Self:
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        # A socket left behind by a server that did not exit cleanly would prevent binding.
+        self._path.unlink(missing_ok=True)
+        self._server = await asyncio.start_unix_server(self._serve, path=self._path)
+        os.chmod(self._path, 0o600)
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc_value: Optional[BaseException],
+        exec_tb: Optional[object],
+    ) -> None:
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._connections):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+            self._path.unlink(missing_ok=True)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections.add(writer)
+        # The change streams opened by the client, by the id of the request that opened them.
+        streams: Dict[int, ChangeStream[Any]] = {}
+        # The requests under way, and the tasks forwarding change streams.
+        requests: Set[asyncio.Task[None]] = set()
+        forwarding: Set[asyncio.Task[None]] = set()
+        # The latest request the later ones wait for.
+        barrier: Optional[asyncio.Task[None]] = None
+
+        def spawn(
+            tasks: Set[asyncio.Task[None]], coroutine: Coroutine[Any, Any, None]
+        ) -> asyncio.Task[None]:
+            task = asyncio.create_task(coroutine)
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            return task
+
+        async def handle(
+            request_id: int,
+            target: Optional[str],
+            method: str,
+            arguments: Dict[str, Any],
+            after: Optional[asyncio.Task[None]],
+        ) -> None:
+            if after is not None:
+                # Unlike awaiting it, waiting for it does not cancel it along with this request.
+                await asyncio.wait({after})
+            if method == "unwatch":
+                stream = streams.pop(request_id, None)
+                if stream is not None:
+                    stream.close()
+                return
+            try:
+                if method == "watch":
+                    stream = self._collection(cast(str, target)).watch(**arguments)
+                    streams[request_id] = stream
+                    spawn(forwarding, self._forward(request_id, stream, writer))
+                    result = None
+                else:
+                    result = await self._call(target, method, arguments)
+                response = _frame(request_id, ("result", result))
+            except Exception as error:
+                response = _frame(request_id, ("error", _portable(error)))
+            # Hand out the events of a write before its result, as an in-process change stream
+            # would have them by the time the write returns.
+            for stream_id, stream in list(streams.items()):
+                for event in stream._take():
+                    writer.write(_frame(stream_id, ("event", event)))
+            writer.write(response)
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+        try:
+            while (received := await _receive(reader)) is not None:
+                request_id, body = received
+                try:
+                    target, method, arguments = _decode(body)
+                except Exception as error:
+                    # Refuse the request, e.g. for holding a class messages may not carry.
+                    writer.write(_frame(request_id, ("error", _portable(error))))
+                    continue
+                task = spawn(requests, handle(request_id, target, method, arguments, barrier))
+                if method in _ORDERED:
+                    barrier = task
+        except ConnectionError:
+            # Drop clients gone mid-write.
+            pass
+        finally:
+            # Requests under way are seen through, even if nobody is left to answer.
+            await asyncio.gather(*requests, return_exceptions=True)
+            for stream in streams.values():
+                stream.close()
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _forward(
+        self, request_id: int, stream: ChangeStream[Any], writer: asyncio.StreamWriter
+    ) -> None:
+        """
+        Hand out the events of the writes made by other clients as they come.
+        """
+        try:
+            async for event in stream:
+                writer.write(_frame(request_id, ("event", event)))
+        except Exception as error:
+            writer.write(_frame(request_id, ("end", _portable(error))))
+
+    def _collection(self, name: str) -> DocumentCollection[Any]:
+        collection = self._collections.get(name)
+        if collection is None:
+            raise ValueError(f"Collection '{name}' does not exist")
+        return collection
+
+    async def _call(self, target: Optional[str], method: str, arguments: Dict[str, Any]) -> Any:
+        if target is not None:
+            if method not in _METHODS:
+                raise ValueError(f"Unknown collection method '{method}'")
+            return await getattr(self._collection(target), method)(**arguments)
+        name: str = arguments["name"]
+        if method == "create_collection":
+            if name not in self._collections:
+                self._collections[name] = await self._db.create_collection(
+                    name, _schema(arguments["schema"]), arguments["partition_key"]
+                )
+            return None
+        if method == "get_collection":
+            if name not in self._collections:
+                self._collections[name] = await self._db.get_collection(
+                    name, _schema(arguments["schema"])
+                )
+            return None
+        if method == "delete_collection":
+            await self._db.delete_collection(name)
+            self._collections.pop(name, None)
+            return None
+        raise ValueError(f"Unknown database method '{method}'")
+
+
+class _RemoteChangeStream(ChangeStream[TDocument]):
+    def __init__(
+        self, db: "RemoteDocumentDatabase", request_id: int, feed: ChangeFeed[TDocument], size: int
+    ) -> None:
+        super().__init__(feed, None, size)
+        self._db = db
+        self._request_id = request_id
+
+    def _push(self, event: ChangeEvent[TDocument]) -> None:
+        super()._push(event)
+        if self._overflowed:
+            self._db._unwatch(self._request_id)
+
+    def _fail(self, error: Exception) -> None:
+        super()._fail(error)
+        self._db._streams.pop(self._request_id, None)
+
+    def close(self) -> None:
+        super().close()
+        self._db._unwatch(self._request_id)
+
+
+class RemoteDocumentDatabase(DocumentDatabase):
+    """
+    A database served by a `DatabaseServer` of another process on the same host, reached over
+    its Unix domain socket. The database has to be entered as an async context manager.
+
+    Requests are pipelined: concurrent tasks send theirs without waiting for the answers to the
+    others, which come back tagged with the request they answer. Errors raised by the served
+    database are raised again as they are if they are ValueErrors or TypeErrors, and as
+    RuntimeErrors otherwise, as are errors decoding an answer, which fail the request (or the
+    change stream) it belongs to alone. Losing the connection fails pending and later requests,
+    and change streams, with a ConnectionError.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._receiving: Optional[asyncio.Task[None]] = None
+        self._request_ids = count(1)
+        self._pending: Dict[int, asyncio.Future[Any]] = {}
+        self._streams: Dict[int, _RemoteChangeStream[Any]] = {}
+        # Local streams are not fed by it, but need one to detach from.
+        self._feed: ChangeFeed[Any] = ChangeFeed()
+        self._collections: Dict[str, RemoteDocumentCollection[Any]] = {}
+
+    async def __aenter__(self) -> Self:
+        self._reader, self._writer = await asyncio.open_unix_connection(self._path)
+        self._receiving = asyncio.create_task(self._dispatch(self._reader))
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc_value: Optional[BaseException],
+        exec_tb: Optional[object],
+    ) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._receiving is not None:
+            await asyncio.gather(self._receiving, return_exceptions=True)
+            self._receiving = None
+
+    async def _dispatch(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while (received := await _receive(reader)) is not None:
+                request_id, body = received
+                stream = self._streams.get(request_id)
+                try:
+                    kind, value = _decode(body)
+                except Exception as error:
+                    # Fail the request the message answers, rather than the whole connection.
+                    kind, value = "error", _portable(error)
+                    if stream is not None:
+                        self._unwatch(request_id)
+                if stream is not None:
+                    # Change streams get their events, and the error that failed them if any.
+                    if kind == "event":
+                        stream._push(value)
+                    elif kind in ("error", "end"):
+                        stream._fail(value)
+                    continue
+                future = self._pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                if kind == "error":
+                    future.set_exception(value)
+                else:
+                    future.set_result(value)
+        finally:
+            lost = ConnectionError("Lost the connection to the database server")
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(lost)
+            self._pending.clear()
+            for stream in list(self._streams.values()):
+                stream._fail(lost)
+
+    def _send(self, request_id: int, target: Optional[str], method: str, **arguments: Any) -> None:
+        if self._writer is None or self._receiving is None or self._receiving.done():
+            raise ConnectionError("Not connected to the database server")
+        self._writer.write(_frame(request_id, (target, method, arguments)))
+
+    async def _request(self, target: Optional[str], method: str, **arguments: Any) -> Any:
+        request_id = next(self._request_ids)
+        future: asyncio.Future[Any] = asyncio.get_running_loop().create_future()
+        self._send(request_id, target, method, **arguments)
+        self._pending[request_id] = future
+        assert self._writer is not None
+        await self._writer.drain()
+        return await future
+
+    def _watch(
+        self,
+        target: str,
+        filters: Optional[QueryFilter],
+        resume_after: Optional[str],
+        buffer_size: int,
+    ) -> ChangeStream[Any]:
+        if buffer_size <= 0:
+            raise ValueError("Buffer size must be positive")
+        request_id = next(self._request_ids)
+        # The stream is held to its buffer size here, where it is read. The server only buffers
+        # what is in flight.
+        self._send(
+            request_id,
+            target,
+            "watch",
+            filters=filters,
+            resume_after=resume_after,
+            buffer_size=max(buffer_size, BUFFER_SIZE),
+        )
+        stream: _RemoteChangeStream[Any] = _RemoteChangeStream(
+            self, request_id, self._feed, buffer_size
+        )
+        self._streams[request_id] = stream
+        return stream
+
+    def _unwatch(self, request_id: int) -> None:
+        if self._streams.pop(request_id, None) is not None and self._writer is not None:
+            self._writer.write(_frame(request_id, (None, "unwatch", {})))
+
+    async def create_collection(
+        self, name: str, schema: Type[TDocument], partition_key: Optional[str] = None
+    ) -> DocumentCollection[TDocument]:
+        await self._request(
+            None,
+            "create_collection",
+            name=name,
+            schema=_layout(schema),
+            partition_key=partition_key,
+        )
+        return self._collection(name)
+
+    async def get_collection(
+        self, name: str, schema: Type[TDocument]
+    ) -> DocumentCollection[TDocument]:
+        await self._request(None, "get_collection", name=name, schema=_layout(schema))
+        return self._collection(name)
+
+    async def delete_collection(self, name: str) -> None:
+        await self._request(None, "delete_collection", name=name)
+        self._collections.pop(name, None)
+
+    def _collection(self, name: str) -> "RemoteDocumentCollection[Any]":
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = RemoteDocumentCollection(self, name)
+            self._collections[name] = collection
+        return collection
+
+
+class RemoteDocumentCollection(DocumentCollection[TDocument]):
+    """
+    A collection of a `RemoteDocumentDatabase`. Cursors (`find_iter`) read their whole page in a
+    single request, then hand it out in batches. Errors opening a change stream, such as an
+    invalid resume token, are raised by its first read.
+    """
+
+    def __init__(self, db: RemoteDocumentDatabase, name: str) -> None:
+        self._db = db
+        self._name = name
+
+    async def find(
+        self,
+        filters: Optional[QueryFilter] = None,
+        projection: Optional[Mapping[str, Projection]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]] = None,
+    ) -> Sequence[TDocument]:
+        return cast(
+            Sequence[TDocument],
+            await self._db._request(
+                self._name,
+                "find",
+                filters=filters,
+                projection=projection,
+                limit=limit,
+                offset=offset,
+                sort=sort,
+            ),
+        )
+
+    async def find_iter(
+        self,
+        filters: Optional[QueryFilter] = None,
+        projection: Optional[Mapping[str, Projection]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]] = None,
+        batch_size: int = 100,
+    ) -> AsyncIterator[TDocument]:
+        if batch_size <= 0:
+            raise ValueError("Batch size must be positive")
+        results = iter(await self.find(filters, projection, limit, offset, sort))
+        while True:
+            batch: List[TDocument] = list(islice(results, batch_size))
+            if not batch:
+                return
+            for doc in batch:
+                yield doc
+            # Let other tasks run between batches.
+            await asyncio.sleep(0)
+
+    async def find_one(
+        self,
+        filters: Optional[QueryFilter] = None,
+        projection: Optional[Mapping[str, Projection]] = None,
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]] = None,
+    ) -> Optional[TDocument]:
+        return cast(
+            Optional[TDocument],
+            await self._db._request(
+                self._name, "find_one", filters=filters, projection=projection, sort=sort
+            ),
+        )
+
+    async def count(self, filters: Optional[QueryFilter] = None) -> int:
+        return cast(int, await self._db._request(self._name, "count", filters=filters))
+
+    async def exists(self, filters: Optional[QueryFilter] = None) -> bool:
+        return cast(bool, await self._db._request(self._name, "exists", filters=filters))
+
+    async def aggregate(
+        self,
+        filters: Optional[QueryFilter],
+        group_by: Sequence[str],
+        accumulators: Mapping[str, Accumulator],
+    ) -> Sequence[Dict[str, Any]]:
+        return cast(
+            Sequence[Dict[str, Any]],
+            await self._db._request(
+                self._name,
+                "aggregate",
+                filters=filters,
+                group_by=group_by,
+                accumulators=accumulators,
+            ),
+        )
+
+    async def explain(
+        self,
+        filters: Optional[QueryFilter] = None,
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        projection: Optional[Mapping[str, Projection]] = None,
+    ) -> ExplainResult:
+        return cast(
+            ExplainResult,
+            await self._db._request(
+                self._name,
+                "explain",
+                filters=filters,
+                sort=sort,
+                limit=limit,
+                offset=offset,
+                projection=projection,
+            ),
+        )
+
+    async def insert_one(self, document: TDocument) -> InsertOneResult:
+        return cast(
+            InsertOneResult, await self._db._request(self._name, "insert_one", document=document)
+        )
+
+    async def insert_many(self, documents: Sequence[TDocument]) -> InsertManyResult:
+        return cast(
+            InsertManyResult,
+            await self._db._request(self._name, "insert_many", documents=list(documents)),
+        )
+
+    async def update_one(
+        self, filters: QueryFilter, patch: List[JSONPatchOperation], upsert: bool = False
+    ) -> UpdateOneResult:
+        return cast(
+            UpdateOneResult,
+            await self._db._request(
+                self._name, "update_one", filters=filters, patch=patch, upsert=upsert
+            ),
+        )
+
+    async def update_many(
+        self, filters: QueryFilter, patch: List[JSONPatchOperation], upsert: bool = False
+    ) -> UpdateManyResult:
+        return cast(
+            UpdateManyResult,
+            await self._db._request(
+                self._name, "update_many", filters=filters, patch=patch, upsert=upsert
+            ),
+        )
+
+    async def delete_one(self, filters: QueryFilter) -> DeleteResult[TDocument]:
+        return cast(
+            DeleteResult[TDocument],
+            await self._db._request(self._name, "delete_one", filters=filters),
+        )
+
+    async def delete_many(self, filters: QueryFilter) -> DeleteResult[TDocument]:
+        return cast(
+            DeleteResult[TDocument],
+            await self._db._request(self._name, "delete_many", filters=filters),
+        )
+
+    def watch(
+        self,
+        filters: Optional[QueryFilter] = None,
+        resume_after: Optional[str] = None,
+        buffer_size: int = BUFFER_SIZE,
+    ) -> ChangeStream[TDocument]:
+        return self._db._watch(self._name, filters, resume_after, buffer_size)
+
+    async def create_index(
+        self, field: Union[str, Sequence[str]], unique: bool = False, ordered: bool = False
+    ) -> None:
+        await self._db._request(
+            self._name,
+            "create_index",
+            field=field if isinstance(field, str) else list(field),
+            unique=unique,
+            ordered=ordered,
+        )
@@ -0,0 +1,71 @@
+import heapq
+from typing import Any, Callable, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from flux0_nanodb.types import SortingOrder, TDocument
+
+
+class _MixedKey:
+    """
+    A composite sort key whose components are compared in their own direction.
+    """
+
+    __slots__ = ("values", "descending")
+
+    def __init__(self, values: Tuple[Any, ...], descending: Tuple[bool, ...]) -> None:
+        self.values = values
+        self.descending = descending
+
+    # Equal keys must compare equal, so that a bounded heap breaks ties on input order like a
+    # stable sort does.
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _MixedKey) and all(
+            a == b for a, b in zip(self.values, other.values)
+        )
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __lt__(self, other: "_MixedKey") -> bool:
+        for a, b, descending in zip(self.values, other.values, self.descending):
+            if a == b:
+                continue
+            return bool(b < a) if descending else bool(a < b)
+        return False
+
+
+def sort_documents(
+    documents: Iterable[TDocument],
+    sort: Sequence[Tuple[str, SortingOrder]],
+    k: Optional[int] = None,
+) -> List[TDocument]:
+    """
+    Sort documents on several fields in a single pass, keeping the original order of documents
+    that compare equal. If `k` is given, only the first `k` documents are returned, selected
+    with a bounded heap in O(n log k) instead of sorting everything.
+    """
+    fields = tuple(field for field, _ in sort)
+    descending = tuple(order == SortingOrder.DESC for _, order in sort)
+
+    key: Callable[[Mapping[str, Any]], Any]
+    if len(fields) == 1:
+        field = fields[0]
+
+        def key(doc: Mapping[str, Any]) -> Any:
+            return doc.get(field)
+
+    elif all(descending) or not any(descending):
+
+        def key(doc: Mapping[str, Any]) -> Any:
+            return tuple(doc.get(f) for f in fields)
+
+    else:
+
+        def key(doc: Mapping[str, Any]) -> Any:
+            return _MixedKey(tuple(doc.get(f) for f in fields), descending)
+
+    # Mixed directions are handled by the key, a uniform descending order by reversing.
+    reverse = all(descending)
+    if k is None:
+        return sorted(documents, key=key, reverse=reverse)
+    if reverse:
+        return heapq.nlargest(k, documents, key=key)
+    return heapq.nsmallest(k, documents, key=key)
@@ -0,0 +1,865 @@
+import asyncio
+import dataclasses
+import hashlib
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from itertools import islice
+from pathlib import Path
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Self,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+    cast,
+)
+
+from flux0_nanodb.aggregation import Aggregation
+from flux0_nanodb.api import DocumentCollection, DocumentDatabase
+from flux0_nanodb.changes import BUFFER_SIZE, ChangeFeed, ChangeStream
+from flux0_nanodb.codec import decode, encode
+from flux0_nanodb.patch import apply_patch
+from flux0_nanodb.projection import Projection, compile_projection
+from flux0_nanodb.schema import compile_schema
+from flux0_nanodb.query import And, Comparison, Or, QueryFilter, compile_query
+from flux0_nanodb.sorting import sort_documents
+from flux0_nanodb.types import (
+    Accumulator,
+    DeleteResult,
+    DocumentID,
+    ExplainResult,
+    InsertManyResult,
+    InsertOneResult,
+    JSONPatchOperation,
+    PlanStage,
+    QueryPlan,
+    SortingOrder,
+    TDocument,
+    UpdateManyResult,
+    UpdateOneResult,
+)
+
+T = TypeVar("T")
+
+# A fragment of SQL along with the parameters it binds.
+Fragment = Tuple[str, List[Any]]
+
+# JSON types of the values a comparison can match: numbers (booleans included, as in Python) and
+# strings. Datetimes are encoded as objects, see `flux0_nanodb.codec`.
+_NUMERIC_TYPES = "('integer', 'real', 'true', 'false')"
+_TEXT_TYPES = "('text')"
+_LITERAL_TYPES = "('integer', 'real', 'true', 'false', 'text')"
+
+_SQL_OPERATORS = {"$eq": "=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+# Stands for a filter, or part of one, that SQL cannot express exactly: every row is a
+# candidate, and the documents are filtered again in Python.
+_ANY: Fragment = ("1", [])
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _json_path(*fields: str) -> Optional[str]:
+    """
+    Return the JSON path of a top-level field (or of nested fields), or None if a field name
+    cannot be written as a path.
+    """
+    if any('"' in field or "\\" in field for field in fields):
+        return None
+    return "$" + "".join(f'."{field}"' for field in fields)
+
+
+class _FilterCompiler:
+    """
+    Translates query filters to SQL conditions over the JSON documents.
+
+    The translation is exact wherever SQL can reproduce the semantics of `compile_query`
+    (comparisons against numbers, booleans and strings), and falls back to a condition that
+    every row satisfies otherwise (datetimes, NaN, unusual field names), in which case the
+    candidates have to be filtered again in Python.
+    """
+
+    def __init__(self, columns: Mapping[str, str]) -> None:
+        # Fields held by a generated column, which may be indexed.
+        self._columns = columns
+
+    def compile(self, query: QueryFilter) -> Tuple[Fragment, bool]:
+        if isinstance(query, Comparison):
+            return self._comparison(query)
+        parts = [self.compile(expr) for expr in query.expressions]
+        exact = all(part_exact for _, part_exact in parts)
+        if isinstance(query, And):
+            if not parts:
+                return ("1", []), True
+            joiner = " AND "
+        elif isinstance(query, Or):
+            if not parts:
+                return ("0", []), True
+            joiner = " OR "
+        else:
+            raise TypeError("Invalid query filter type.")
+        sql = joiner.join(f"({fragment[0]})" for fragment, _ in parts)
+        params = [param for fragment, _ in parts for param in fragment[1]]
+        return (sql, params), exact
+
+    def value(self, field: str) -> Optional[Fragment]:
+        if field in self._columns:
+            return _quote(self._columns[field]), []
+        path = _json_path(field)
+        return None if path is None else ("json_extract(doc, ?)", [path])
+
+    def _comparison(self, c: Comparison) -> Tuple[Fragment, bool]:
+        path = _json_path(c.path)
+        value_expr = self.value(c.path)
+        if path is None or value_expr is None:
+            return _ANY, False
+
+        def typed(types: str, operator: str, value: Any) -> Fragment:
+            expr, expr_params = value_expr
+            return (
+                f"json_type(doc, ?) IN {types} AND {expr} {operator} ?",
+                [path, *expr_params, value],
+            )
+
+        def literal() -> Fragment:
+            # Whether the field holds a value a comparison can match at all.
+            return (
+                f"json_type(doc, ?) IN {_LITERAL_TYPES} OR json_type(doc, ?) = 'text'",
+                [path, _json_path(c.path, "$datetime")],
+            )
+
+        def differs(equal: Fragment) -> Fragment:
+            lit, lit_params = literal()
+            return f"({lit}) AND NOT ({equal[0]})", [*lit_params, *equal[1]]
+
+        value = c.value
+        if c.op == "$in":
+            assert isinstance(value, list)
+            members = [self._comparison(Comparison(c.path, "$eq", v)) for v in value]
+            if not members:
+                return ("0", []), True
+            sql = " OR ".join(f"({fragment[0]})" for fragment, _ in members)
+            params = [param for fragment, _ in members for param in fragment[1]]
+            return (sql, params), all(exact for _, exact in members)
+
+        if isinstance(value, datetime) or (isinstance(value, float) and value != value):
+            return _ANY, False
+        if isinstance(value, (bool, int, float)):
+            if c.op == "$ne":
+                return differs(typed(_NUMERIC_TYPES, "=", value)), True
+            return typed(_NUMERIC_TYPES, _SQL_OPERATORS[c.op], value), True
+        if isinstance(value, str):
+            if c.op == "$eq":
+                return typed(_TEXT_TYPES, "=", value), True
+            if c.op == "$ne":
+                return differs(typed(_TEXT_TYPES, "=", value)), True
+            return ("0", []), True  # strings are not ordered
+        # No literal equals any other value, and every literal differs from it.
+        return (literal() if c.op == "$ne" else ("0", [])), True
+
+
+def _projection(projection: Mapping[str, Projection]) -> Optional[Fragment]:
+    """
+    Translate a projection to the expression selecting what it keeps of each document, or
+    return None if SQL cannot express it.
+
+    Inclusions select the JSON of each included field (`doc -> path`), exclusions remove the
+    excluded fields with `json_remove`.
+    """
+    include = [k for k, v in projection.items() if k != "_id" and v == Projection.INCLUDE]
+    exclude = [k for k, v in projection.items() if k != "_id" and v == Projection.EXCLUDE]
+    if include and exclude:
+        raise ValueError("Cannot mix inclusion and exclusion in projection (except for _id).")
+    paths = [_json_path(*key.split(".")) for key in include or exclude]
+    if any(path is None for path in paths):
+        return None
+    if include:
+        if projection.get("_id", Projection.INCLUDE) != Projection.EXCLUDE:
+            paths.insert(0, _json_path("_id"))
+        return ", ".join("doc -> ?" for _ in paths), paths
+    if projection.get("_id", Projection.INCLUDE) == Projection.EXCLUDE:
+        paths.append(_json_path("_id"))
+    if not paths:
+        return "doc", []
+    return f"json_remove(doc, {', '.join('?' for _ in paths)})", paths
+
+
+def _included(projection: Mapping[str, Projection], row: Sequence[Optional[str]]) -> Dict[str, Any]:
+    """
+    Build a projected document from the JSON of its included fields, as selected by
+    `_projection`.
+    """
+    keys = [k for k, v in projection.items() if k != "_id" and v == Projection.INCLUDE]
+    if projection.get("_id", Projection.INCLUDE) != Projection.EXCLUDE:
+        keys.insert(0, "_id")
+    result: Dict[str, Any] = {}
+    for key, value in zip(keys, row):
+        if value is None:
+            continue  # missing from the document
+        parts = key.split(".")
+        current = result
+        for part in parts[:-1]:
+            if not isinstance(current.get(part), dict):
+                current[part] = {}
+            current = current[part]
+        current[parts[-1]] = decode(value)
+    return result
+
+
+class SQLiteDocumentCollection(DocumentCollection[TDocument]):
+    """
+    A collection stored in its own SQLite table, one JSON document per row, in insertion order.
+
+    Filters, sorting, pagination and projections run in SQL whenever they can be translated
+    exactly; otherwise SQL narrows down the candidates and the rest happens in Python. Indexed
+    fields are extracted into generated columns, which SQLite indexes like any other column.
+    Documents must be valid JSON: NaN and infinite numbers are rejected with a ValueError.
+
+    Unsorted `find_iter` reads each batch in a query of its own, so it only sees a single point
+    in time batch by batch, not across batches.
+    """
+
+    def __init__(
+        self,
+        database: "SQLiteDocumentDatabase",
+        name: str,
+        schema: Type[TDocument],
+        columns: Dict[str, str],
+    ) -> None:
+        self._database = database
+        self._name = name
+        self._schema = compile_schema(schema)
+        self._table = _quote(f"c_{name}")
+        self._columns = columns
+        # Changes made through this database, as other connections are not heard of.
+        self._changes: ChangeFeed[TDocument] = ChangeFeed()
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        return self._database._connection
+
+    def _where(self, filters: Optional[QueryFilter]) -> Tuple[Fragment, bool]:
+        if filters is None:
+            return ("1", []), True
+        compile_query(filters)  # reject invalid filters like the memory implementation does
+        return _FilterCompiler(self._columns).compile(filters)
+
+    def _order_by(self, sort: Sequence[Tuple[str, SortingOrder]]) -> Optional[Fragment]:
+        compiler = _FilterCompiler(self._columns)
+        terms: List[str] = []
+        params: List[Any] = []
+        for field, order in sort:
+            value = compiler.value(field)
+            if value is None:
+                return None
+            terms.append(f"{value[0]} {'DESC' if order == SortingOrder.DESC else 'ASC'}")
+            params.extend(value[1])
+        # Documents that compare equal keep their insertion order, as with a stable sort.
+        terms.append("seq")
+        return ", ".join(terms), params
+
+    def _candidates(
+        self, where: Fragment, after: int = 0, limit: int = -1
+    ) -> Iterator[Tuple[int, TDocument]]:
+        cursor = self._connection.execute(
+            f"SELECT seq, doc FROM {self._table} WHERE ({where[0]}) AND seq > ? "
+            "ORDER BY seq LIMIT ?",
+            [*where[1], after, limit],
+        )
+        for seq, doc in cursor:
+            yield seq, cast(TDocument, decode(doc))
+
+    def _matching(
+        self, filters: Optional[QueryFilter], limit: int = -1
+    ) -> Iterator[Tuple[int, TDocument]]:
+        """
+        Iterate over the rows matching the filters, in insertion order.
+        """
+        where, exact = self._where(filters)
+        if exact or filters is None:
+            yield from self._candidates(where, limit=limit)
+            return
+        match = compile_query(filters)
+        found = 0
+        for seq, doc in self._candidates(where):
+            if match(doc):
+                yield seq, doc
+                found += 1
+                if found == limit:
+                    return
+
+    def _query(
+        self,
+        filters: Optional[QueryFilter],
+        projection: Optional[Mapping[str, Projection]],
+        limit: Optional[int],
+        offset: Optional[int],
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]],
+    ) -> Tuple[List[TDocument], int, Fragment]:
+        """
+        Run a query, returning the resulting documents, the number of rows read from SQLite and
+        the SQL statement used to read them.
+        """
+        if offset is not None and offset < 0:
+            raise ValueError("Offset must be non-negative")
+        if limit is not None and limit < 0:
+            raise ValueError("Limit must be non-negative")
+        where, exact = self._where(filters)
+        order_by = self._order_by(sort) if sort else ("seq", [])
+        select = _projection(projection) if projection else ("doc", [])
+
+        if exact and order_by is not None and select is not None:
+            statement: Fragment = (
+                f"SELECT {select[0]} FROM {self._table} WHERE {where[0]} "
+                f"ORDER BY {order_by[0]} LIMIT ? OFFSET ?",
+                [*select[1], *where[1], *order_by[1], -1 if limit is None else limit, offset or 0],
+            )
+            rows = self._connection.execute(*statement).fetchall()
+            if projection and any(
+                k != "_id" and v == Projection.INCLUDE for k, v in projection.items()
+            ):
+                docs = [cast(TDocument, _included(projection, row)) for row in rows]
+            else:
+                docs = [cast(TDocument, decode(row[0])) for row in rows]
+            return docs, len(rows), statement
+
+        # Filter, sort and paginate in Python what SQL narrowed down.
+        statement = (
+            f"SELECT seq, doc FROM {self._table} WHERE ({where[0]}) AND seq > ? "
+            "ORDER BY seq LIMIT ?",
+            [*where[1], 0, -1],
+        )
+        match = compile_query(filters) if filters is not None else None
+        examined = 0
+
+        def matching() -> Iterator[TDocument]:
+            nonlocal examined
+            for _, doc in self._candidates(where):
+                examined += 1
+                if match is None or match(doc):
+                    yield doc
+
+        start = offset or 0
+        stop = start + limit if limit is not None else None
+        if sort:
+            docs = sort_documents(matching(), sort, k=stop)[start:]
+        else:
+            docs = list(islice(matching(), start, stop))
+        if projection:
+            project = compile_projection(projection)
+            docs = [cast(TDocument, project(doc)) for doc in docs]
+        return docs, examined, statement
+
+    async def find(
+        self,
+        filters: Optional[QueryFilter] = None,
+        projection: Optional[Mapping[str, Projection]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]] = None,
+    ) -> Sequence[TDocument]:
+        docs, _, _ = await self._database._run(
+            self._query, filters, projection, limit, offset, sort
+        )
+        return docs
+
+    async def find_iter(
+        self,
+        filters: Optional[QueryFilter] = None,
+        projection: Optional[Mapping[str, Projection]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]] = None,
+        batch_size: int = 100,
+    ) -> AsyncIterator[TDocument]:
+        if batch_size <= 0:
+            raise ValueError("Batch size must be positive")
+        if sort:
+            # Sorted results are read at once, then handed out in batches.
+            docs = await self.find(filters, projection, limit, offset, sort)
+            for doc in docs:
+                yield doc
+            return
+        if offset is not None and offset < 0:
+            raise ValueError("Offset must be non-negative")
+        if limit is not None and limit < 0:
+            raise ValueError("Limit must be non-negative")
+
+        where, _ = self._where(filters)
+        match = compile_query(filters) if filters is not None else None
+        project = compile_projection(projection) if projection else None
+        skip = offset or 0
+        remaining = limit
+        last = 0
+        # Each batch is a query of its own, resuming after the last row read, so that no
+        # statement stays open while the caller processes a batch.
+        while remaining is None or remaining > 0:
+            rows = await self._database._run(
+                lambda after: list(self._candidates(where, after, batch_size)), last
+            )
+            if not rows:
+                return
+            last = rows[-1][0]
+            for _, doc in rows:
+                if match is not None and not match(doc):
+                    continue
+                if skip:
+                    skip -= 1
+                    continue
+                yield cast(TDocument, project(doc)) if project else doc
+                if remaining is not None:
+                    remaining -= 1
+                    if remaining == 0:
+                        return
+
+    async def find_one(
+        self,
+        filters: Optional[QueryFilter] = None,
+        projection: Optional[Mapping[str, Projection]] = None,
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]] = None,
+    ) -> Optional[TDocument]:
+        docs = await self.find(filters, projection=projection, limit=1, sort=sort)
+        return docs[0] if docs else None
+
+    def _count(self, filters: Optional[QueryFilter], limit: int = -1) -> int:
+        where, exact = self._where(filters)
+        if exact:
+            (count,) = self._connection.execute(
+                f"SELECT COUNT(*) FROM (SELECT 1 FROM {self._table} WHERE {where[0]} LIMIT ?)",
+                [*where[1], limit],
+            ).fetchone()
+            return int(count)
+        return sum(1 for _ in self._matching(filters, limit))
+
+    async def count(self, filters: Optional[QueryFilter] = None) -> int:
+        return await self._database._run(self._count, filters)
+
+    async def exists(self, filters: Optional[QueryFilter] = None) -> bool:
+        return await self._database._run(self._count, filters, 1) > 0
+
+    def _aggregate(
+        self,
+        filters: Optional[QueryFilter],
+        group_by: Sequence[str],
+        accumulators: Mapping[str, Accumulator],
+    ) -> List[Dict[str, Any]]:
+        aggregation = Aggregation(group_by, accumulators)
+        if not group_by and aggregation.counts_only:
+            count = self._count(filters)
+            if count:
+                aggregation.add_group((), count, {})
+        else:
+            # Grouping happens in Python, as SQLite neither groups nor orders the values of
+            # different types (datetimes, booleans) the way nanodb does. Rows are folded as
+            # they are read.
+            for _, doc in self._matching(filters):
+                aggregation.add(doc)
+        return aggregation.results()
+
+    async def aggregate(
+        self,
+        filters: Optional[QueryFilter],
+        group_by: Sequence[str],
+        accumulators: Mapping[str, Accumulator],
+    ) -> Sequence[Dict[str, Any]]:
+        return await self._database._run(self._aggregate, filters, group_by, accumulators)
+
+    def _explain(
+        self,
+        filters: Optional[QueryFilter],
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]],
+        limit: Optional[int],
+        offset: Optional[int],
+        projection: Optional[Mapping[str, Projection]],
+    ) -> ExplainResult:
+        docs, examined, statement = self._query(filters, projection, limit, offset, sort)
+        details = [
+            row[3]
+            for row in self._connection.execute(f"EXPLAIN QUERY PLAN {statement[0]}", statement[1])
+        ]
+        indexes = {index: fields for fields, index in self._database._index_names(self._name)}
+        seeks: List[QueryPlan] = []
+        plan = QueryPlan(stage=PlanStage.FULL_SCAN)
+        for detail in details:
+            used = next((name for name in indexes if f"INDEX {name}" in detail), None)
+            if used is None:
+                continue
+            if detail.startswith("SCAN"):
+                plan = QueryPlan(stage=PlanStage.INDEX_SCAN, index=indexes[used])
+            else:
+                seeks.append(QueryPlan(stage=PlanStage.INDEX_SEEK, index=indexes[used]))
+        if len(seeks) == 1:
+            plan = seeks[0]
+        elif seeks:
+            plan = QueryPlan(stage=PlanStage.INDEX_UNION, children=seeks)
+        if any("COVERING INDEX" in detail for detail in details):
+            plan = dataclasses.replace(plan, covered=True)
+        return ExplainResult(plan=plan, documents_examined=examined, documents_returned=len(docs))
+
+    async def explain(
+        self,
+        filters: Optional[QueryFilter] = None,
+        sort: Optional[Sequence[Tuple[str, SortingOrder]]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        projection: Optional[Mapping[str, Projection]] = None,
+    ) -> ExplainResult:
+        return await self._database._run(self._explain, filters, sort, limit, offset, projection)
+
+    def _insert(self, documents: Sequence[Mapping[str, Any]]) -> None:
+        try:
+            with self._database._transaction():
+                self._connection.executemany(
+                    f"INSERT INTO {self._table} (doc) VALUES (?)",
+                    [(encode(doc, allow_nan=False),) for doc in documents],
+                )
+        except sqlite3.IntegrityError as e:
+            raise ValueError(f"Duplicate value for unique index: {e}") from e
+
+    def _validate(self, document: Mapping[str, Any]) -> DocumentID:
+        self._schema.validate(document)
+        inserted_id: Optional[DocumentID] = document.get("id")
+        if inserted_id is None:
+            raise ValueError("Document is missing an 'id' field")
+        return inserted_id
+
+    async def insert_one(self, document: TDocument) -> InsertOneResult:
+        inserted_id = self._validate(document)
+        await self._database._run(self._insert, [document])
+        self._changes.publish("insert", [document])
+        return InsertOneResult(acknowledged=True, inserted_id=inserted_id)
+
+    async def insert_many(self, documents: Sequence[TDocument]) -> InsertManyResult:
+        inserted_ids = [self._validate(document) for document in documents]
+        await self._database._run(self._insert, documents)
+        self._changes.publish("insert", documents)
+        return InsertManyResult(acknowledged=True, inserted_ids=inserted_ids)
+
+    def _update(
+        self,
+        filters: QueryFilter,
+        patch: List[JSONPatchOperation],
+        upsert: bool,
+        limit: int,
+    ) -> Tuple[List[TDocument], Optional[TDocument]]:
+        """
+        Patch up to `limit` matching documents (all of them if -1) in a single transaction,
+        returning the patched documents and the upserted document, if any.
+        """
+        try:
+            with self._database._transaction():
+                rows = list(self._matching(filters, limit))
+                if not rows and upsert:
+                    new_doc = apply_patch({}, patch)
+                    if "id" not in new_doc:
+                        raise ValueError("Upserted document is missing an 'id' field")
+                    self._schema.validate(new_doc)
+                    self._connection.execute(
+                        f"INSERT INTO {self._table} (doc) VALUES (?)",
+                        (encode(new_doc, allow_nan=False),),
+                    )
+                    return [], cast(TDocument, new_doc)
+                # Patch every document before touching any, so that an invalid patch changes
+                # nothing.
+                updated = [cast(TDocument, apply_patch(doc, patch)) for _, doc in rows]
+                self._connection.executemany(
+                    f"UPDATE {self._table} SET doc = ? WHERE seq = ?",
+                    [(encode(doc, allow_nan=False), seq) for doc, (seq, _) in zip(updated, rows)],
+                )
+                return updated, None
+        except sqlite3.IntegrityError as e:
+            raise ValueError(f"Duplicate value for unique index: {e}") from e
+
+    async def update_one(
+        self, filters: QueryFilter, patch: List[JSONPatchOperation], upsert: bool = False
+    ) -> UpdateOneResult:
+        updated, upserted = await self._database._run(self._update, filters, patch, upsert, 1)
+        self._publish_update(updated, upserted)
+        return UpdateOneResult(
+            acknowledged=True,
+            matched_count=len(updated),
+            modified_count=len(updated),
+            upserted_id=None if upserted is None else upserted["id"],
+        )
+
+    async def update_many(
+        self, filters: QueryFilter, patch: List[JSONPatchOperation], upsert: bool = False
+    ) -> UpdateManyResult:
+        updated, upserted = await self._database._run(self._update, filters, patch, upsert, -1)
+        self._publish_update(updated, upserted)
+        return UpdateManyResult(
+            acknowledged=True,
+            matched_count=len(updated),
+            modified_count=len(updated),
+            upserted_id=None if upserted is None else upserted["id"],
+        )
+
+    def _publish_update(self, updated: List[TDocument], upserted: Optional[TDocument]) -> None:
+        if upserted is not None:
+            self._changes.publish("insert", [upserted])
+        elif updated:
+            self._changes.publish("update", updated)
+
+    def _delete_one(self, filters: QueryFilter) -> Optional[TDocument]:
+        with self._database._transaction():
+            for seq, doc in self._matching(filters, 1):
+                self._connection.execute(f"DELETE FROM {self._table} WHERE seq = ?", (seq,))
+                return doc
+        return None
+
+    def _delete_many(self, filters: QueryFilter, returning: bool) -> Tuple[int, List[TDocument]]:
+        """
+        Delete every matching document, returning how many were deleted and, if `returning` is
+        set, the deleted documents.
+        """
+        with self._database._transaction():
+            where, exact = self._where(filters)
+            if exact and not returning:
+                cursor = self._connection.execute(
+                    f"DELETE FROM {self._table} WHERE {where[0]}", where[1]
+                )
+                return cursor.rowcount, []
+            if exact:
+                rows = self._connection.execute(
+                    f"DELETE FROM {self._table} WHERE {where[0]} RETURNING doc", where[1]
+                ).fetchall()
+                removed = [cast(TDocument, decode(row[0])) for row in rows]
+                return len(removed), removed
+            matching = list(self._matching(filters))
+            self._connection.executemany(
+                f"DELETE FROM {self._table} WHERE seq = ?", [(seq,) for seq, _ in matching]
+            )
+            return len(matching), [doc for _, doc in matching] if returning else []
+
+    async def delete_one(self, filters: QueryFilter) -> DeleteResult[TDocument]:
+        removed = await self._database._run(self._delete_one, filters)
+        if removed is not None:
+            self._changes.publish("delete", [removed])
+        return DeleteResult(
+            acknowledged=True, deleted_count=0 if removed is None else 1, deleted_document=removed
+        )
+
+    async def delete_many(self, filters: QueryFilter) -> DeleteResult[TDocument]:
+        deleted, removed = await self._database._run(
+            self._delete_many, filters, self._changes.watched
+        )
+        self._changes.publish("delete", removed)
+        return DeleteResult(acknowledged=True, deleted_count=deleted, deleted_document=None)
+
+    def watch(
+        self,
+        filters: Optional[QueryFilter] = None,
+        resume_after: Optional[str] = None,
+        buffer_size: int = BUFFER_SIZE,
+    ) -> ChangeStream[TDocument]:
+        return self._changes.watch(filters, resume_after, buffer_size)
+
+    def _create_index(self, fields: Tuple[str, ...], unique: bool, ordered: bool) -> None:
+        existing = self._connection.execute(
+            "SELECT is_unique, is_ordered FROM nanodb_indexes WHERE collection = ? AND fields = ?",
+            (self._name, encode(fields)),
+        ).fetchone()
+        if existing is not None:
+            if tuple(existing) != (unique, ordered):
+                raise ValueError(f"Index on {fields} already exists with different options")
+            return
+        try:
+            with self._database._transaction():
+                for field in fields:
+                    if field in self._columns:
+                        continue
+                    path = _json_path(field)
+                    if path is None:
+                        raise ValueError(f"Cannot index field '{field}'")
+                    column = f"f_{field}"
+                    literal = path.replace("'", "''")
+                    self._connection.execute(
+                        f"ALTER TABLE {self._table} ADD COLUMN {_quote(column)} GENERATED ALWAYS "
+                        f"AS (json_extract(doc, '{literal}')) VIRTUAL"
+                    )
+                    self._columns[field] = column
+                columns = ", ".join(_quote(self._columns[field]) for field in fields)
+                self._connection.execute(
+                    f"CREATE {'UNIQUE ' if unique else ''}INDEX "
+                    f"{_quote(self._database._index_name(self._name, fields))} "
+                    f"ON {self._table} ({columns})"
+                )
+                self._connection.execute(
+                    "INSERT INTO nanodb_indexes (collection, fields, is_unique, is_ordered) "
+                    "VALUES (?, ?, ?, ?)",
+                    (self._name, encode(fields), unique, ordered),
+                )
+        except sqlite3.IntegrityError as e:
+            self._columns.clear()
+            self._columns.update(self._database._columns(self._name))
+            raise ValueError(f"Duplicate values for unique index on {fields}") from e
+
+    async def create_index(
+        self, field: Union[str, Sequence[str]], unique: bool = False, ordered: bool = False
+    ) -> None:
+        fields = (field,) if isinstance(field, str) else tuple(field)
+        if not fields:
+            raise ValueError("An index requires at least one field")
+        # Compound indexes are always ordered, as are all SQLite indexes.
+        ordered = ordered or len(fields) > 1
+        await self._database._run(self._create_index, fields, unique, ordered)
+
+
+class _Transaction:
+    def __init__(self, connection: sqlite3.Connection) -> None:
+        self._connection = connection
+
+    def __enter__(self) -> None:
+        self._connection.execute("BEGIN")
+
+    def __exit__(self, exc_type: Optional[type[BaseException]], *_: object) -> None:
+        self._connection.execute("COMMIT" if exc_type is None else "ROLLBACK")
+
+
+class SQLiteDocumentDatabase(DocumentDatabase):
+    """
+    A document database stored in a SQLite file, using the JSON functions built into SQLite.
+
+    Every statement runs on a single worker thread, so the event loop never blocks on SQLite
+    and the connection is never used by two threads at once. The database has to be entered as
+    an async context manager, which opens and closes the connection. Collections are durable:
+    `create_collection` returns an existing collection instead of raising, so that applications
+    can declare their collections and indexes on every start.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self._path = str(path)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._connection: sqlite3.Connection
+        self._collections: dict[str, SQLiteDocumentCollection[Any]] = {}
+
+    async def _run(self, function: Callable[..., T], *args: Any) -> T:
+        assert self._executor is not None, "The database is not open"
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, partial(function, *args)
+        )
+
+    def _transaction(self) -> _Transaction:
+        return _Transaction(self._connection)
+
+    def _open(self) -> None:
+        if self._path != ":memory:":
+            Path(self._path).parent.mkdir(parents=True, exist_ok=True)
+        # Statements are issued in autocommit mode, with explicit transactions where needed.
+        self._connection = sqlite3.connect(
+            self._path, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS nanodb_collections (name TEXT PRIMARY KEY)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS nanodb_indexes ("
+            "collection TEXT, fields TEXT, is_unique INTEGER, is_ordered INTEGER, "
+            "PRIMARY KEY (collection, fields))"
+        )
+
+    async def __aenter__(self) -> Self:
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="nanodb-sqlite")
+        await self._run(self._open)
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc_value: Optional[BaseException],
+        exec_tb: Optional[object],
+    ) -> None:
+        await self._run(self._connection.close)
+        assert self._executor is not None
+        self._executor.shutdown()
+        self._executor = None
+
+    def _index_name(self, collection: str, fields: Sequence[str]) -> str:
+        # Field names are hashed, as joining them would give fields ("a_b",) and ("a", "b") the
+        # same name, and one name could be found in another when explaining queries.
+        digest = hashlib.sha256(encode([collection, *fields]).encode()).hexdigest()
+        return f"ix_{collection}_{digest[:16]}"
+
+    def _index_names(self, collection: str) -> List[Tuple[Tuple[str, ...], str]]:
+        return [
+            (tuple(decode(fields)), self._index_name(collection, decode(fields)))
+            for (fields,) in self._connection.execute(
+                "SELECT fields FROM nanodb_indexes WHERE collection = ?", (collection,)
+            )
+        ]
+
+    def _columns(self, collection: str) -> Dict[str, str]:
+        rows = self._connection.execute(
+            f"SELECT name, hidden FROM pragma_table_xinfo({_quote(f'c_{collection}')})"
+        )
+        # Generated columns are reported as hidden.
+        return {name[2:]: name for name, hidden in rows if hidden and name.startswith("f_")}
+
+    def _exists(self, name: str) -> bool:
+        row = self._connection.execute(
+            "SELECT 1 FROM nanodb_collections WHERE name = ?", (name,)
+        ).fetchone()
+        return row is not None
+
+    def _create(self, name: str) -> Dict[str, str]:
+        if self._exists(name):
+            return self._columns(name)
+        with self._transaction():
+            self._connection.execute(
+                f"CREATE TABLE {_quote(f'c_{name}')} ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, doc TEXT NOT NULL)"
+            )
+            self._connection.execute("INSERT INTO nanodb_collections (name) VALUES (?)", (name,))
+        return {}
+
+    async def create_collection(
+        self, name: str, schema: Type[TDocument], partition_key: Optional[str] = None
+    ) -> DocumentCollection[TDocument]:
+        columns = await self._run(self._create, name)
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = SQLiteDocumentCollection(self, name, schema, columns)
+            self._collections[name] = collection
+        else:
+            collection._schema = compile_schema(schema)
+        if partition_key is not None:
+            # The partition key is indexed instead, which serves pinned queries just as well.
+            await collection.create_index(partition_key)
+        return cast(DocumentCollection[TDocument], collection)
+
+    async def get_collection(
+        self, name: str, schema: Type[TDocument]
+    ) -> DocumentCollection[TDocument]:
+        collection = self._collections.get(name)
+        if collection is None:
+            if not await self._run(self._exists, name):
+                raise ValueError(f"Collection '{name}' does not exist")
+            return await self.create_collection(name, schema)
+        return cast(DocumentCollection[TDocument], collection)
+
+    def _drop(self, name: str) -> None:
+        if not self._exists(name):
+            raise ValueError(f"Collection '{name}' does not exist")
+        with self._transaction():
+            self._connection.execute(f"DROP TABLE {_quote(f'c_{name}')}")
+            self._connection.execute("DELETE FROM nanodb_collections WHERE name = ?", (name,))
+            self._connection.execute("DELETE FROM nanodb_indexes WHERE collection = ?", (name,))
+
+    async def delete_collection(self, name: str) -> None:
+        await self._run(self._drop, name)
+        self._collections.pop(name, None)
@@ -0,0 +1,125 @@
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Self, Sequence
+
+from flux0_nanodb.api import DocumentCollection
+from flux0_nanodb.projection import Projection
+from flux0_nanodb.query import And, Comparison, QueryFilter
+
+
+@dataclass(frozen=True)
+class Cascade:
+    """
+    Declares that the documents of `collection` whose `field` holds the `key` of an expired
+    document expire along with it, e.g. the events of a session.
+    """
+
+    collection: DocumentCollection[Any]
+    field: str
+    key: str = "id"
+
+
+@dataclass(frozen=True)
+class TTLIndex:
+    """
+    Declares that the documents of `collection` expire once the (timezone-aware) datetime in
+    their `field` is older than `expire_after`. Only documents matching `filters` expire, if
+    given.
+    """
+
+    collection: DocumentCollection[Any]
+    field: str
+    expire_after: timedelta
+    filters: Optional[QueryFilter] = None
+    cascade: Sequence[Cascade] = ()
+
+
+class ExpirySweeper:
+    """
+    Deletes expired documents in the background, every `interval` seconds.
+
+    A sweep works in slices of at most `batch_size` expired documents, deleting each slice (then
+    what cascades from it) before yielding to the event loop, so that it never holds the loop for
+    long whatever the number of expired documents. The expired documents are found through an
+    ordered index on the field, created when the sweeper starts; the related field of a cascade
+    should be indexed by its owner.
+    """
+
+    def __init__(
+        self,
+        indexes: Sequence[TTLIndex],
+        interval: float = 60.0,
+        batch_size: int = 100,
+        clock: Callable[[], datetime] = lambda: datetime.now(timezone.utc),
+    ) -> None:
+        if batch_size <= 0:
+            raise ValueError("Batch size must be positive")
+        self._indexes = list(indexes)
+        self._interval = interval
+        self._batch_size = batch_size
+        self._clock = clock
+        self._task: Optional[asyncio.Task[None]] = None
+
+    async def __aenter__(self) -> Self:
+        for index in self._indexes:
+            await index.collection.create_index(index.field, ordered=True)
+        self._task = asyncio.create_task(self._sweep_periodically())
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc_value: Optional[BaseException],
+        exec_tb: Optional[object],
+    ) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _sweep_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            await self.sweep()
+
+    async def sweep(self) -> int:
+        """
+        Delete every document expired by now, returning how many were deleted, cascades
+        included.
+        """
+        deleted = 0
+        for index in self._indexes:
+            deleted += await self._sweep(index)
+        return deleted
+
+    async def _sweep(self, index: TTLIndex) -> int:
+        expired: QueryFilter = Comparison(
+            path=index.field, op="$lt", value=self._clock() - index.expire_after
+        )
+        if index.filters is not None:
+            expired = And(expressions=[expired, index.filters])
+        keys = {"id", *(cascade.key for cascade in index.cascade)}
+        projection: Dict[str, Projection] = {"_id": Projection.EXCLUDE}
+        projection.update((key, Projection.INCLUDE) for key in keys)
+
+        deleted = 0
+        while True:
+            batch = await index.collection.find(expired, projection, limit=self._batch_size)
+            if not batch:
+                return deleted
+            ids: List[Any] = [doc["id"] for doc in batch]
+            result = await index.collection.delete_many(Comparison(path="id", op="$in", value=ids))
+            deleted += result.deleted_count
+            # Related documents go after the documents they relate to, so that none can be added
+            # in between for a document about to expire.
+            for cascade in index.cascade:
+                values = [doc[cascade.key] for doc in batch if cascade.key in doc]
+                result = await cascade.collection.delete_many(
+                    Comparison(path=cascade.field, op="$in", value=values)
+                )
+                deleted += result.deleted_count
+            if len(batch) < self._batch_size:
+                return deleted
+            # Let other tasks run between slices.
+            await asyncio.sleep(0)
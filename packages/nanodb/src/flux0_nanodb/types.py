@@ -1,6 +1,18 @@
 from dataclasses import dataclass
 from enum import Enum
-from typing import Any, Generic, Literal, NewType, Optional, TypedDict, TypeVar, Union
+from typing import (
+    Any,
+    Generic,
+    List,
+    Literal,
+    NewType,
+    Optional,
+    Sequence,
+    Tuple,
+    TypedDict,
+    TypeVar,
+    Union,
+)
 
 DocumentID = NewType("DocumentID", str)
 DocumentVersion = NewType("DocumentVersion", str)
@@ -26,6 +38,12 @@ class InsertOneResult:
     inserted_id: DocumentID  # Mimicking MongoDB’s inserted_id field.
 
 
+@dataclass(frozen=True)
+class InsertManyResult:
+    acknowledged: bool
+    inserted_ids: List[DocumentID]
+
+
 @dataclass(frozen=True)
 class UpdateOneResult:
     acknowledged: bool
@@ -34,6 +52,14 @@ class UpdateOneResult:
     upserted_id: Optional[DocumentID]
 
 
+@dataclass(frozen=True)
+class UpdateManyResult:
+    acknowledged: bool
+    matched_count: int
+    modified_count: int
+    upserted_id: Optional[DocumentID]
+
+
 # MongoDB-like result structure for delete operations.
 @dataclass(frozen=True)
 class DeleteResult(Generic[TDocument]):
@@ -42,6 +68,63 @@ class DeleteResult(Generic[TDocument]):
     deleted_document: Optional[TDocument]
 
 
+ChangeOperation = Literal["insert", "update", "delete"]
+
+
+# A write to a collection, as seen by change streams.
+@dataclass(frozen=True)
+class ChangeEvent(Generic[TDocument]):
+    operation: ChangeOperation
+    # Increases with every document written to the collection.
+    sequence: int
+    # Resumes a change stream right after this event, see `DocumentCollection.watch`.
+    resume_token: str
+    document_id: DocumentID
+    # The document as inserted or updated, or as it was before being deleted.
+    document: TDocument
+
+
+class PlanStage(Enum):
+    FULL_SCAN = "full_scan"  # every document is examined
+    INDEX_SCAN = "index_scan"  # every document is examined, walked in the order of an index
+    INDEX_SEEK = "index_seek"  # a single index lookup
+    INDEX_INTERSECTION = "index_intersection"  # documents found by all children
+    INDEX_UNION = "index_union"  # documents found by any child
+    PARTITIONS = "partitions"  # documents found in each child partition, merged
+
+
+@dataclass(frozen=True)
+class QueryPlan:
+    stage: PlanStage
+    # The indexed fields, for INDEX_SCAN and INDEX_SEEK stages.
+    index: Optional[Tuple[str, ...]] = None
+    # The plans of the children stages, or of the partitions read for a PARTITIONS stage.
+    children: Sequence["QueryPlan"] = ()
+    # Whether the query is answered from the index alone, without reading any document.
+    covered: bool = False
+
+
+@dataclass(frozen=True)
+class ExplainResult:
+    plan: QueryPlan
+    documents_examined: int
+    documents_returned: int
+
+
+AccumulatorOperator = Literal["$count", "$min", "$max"]
+
+
+@dataclass(frozen=True)
+class Accumulator:
+    """
+    Reduces the documents of a group to a single value, see `DocumentCollection.aggregate`.
+    """
+
+    op: AccumulatorOperator
+    # The top-level field read by $min and $max ($count reads none).
+    path: Optional[str] = None
+
+
 # Define a type-safe JSON Patch operation
 class AddOp(TypedDict):
     op: Literal["add"]
@@ -0,0 +1,119 @@
+from typing import Any, Dict, Hashable, Iterator, List, Mapping, Optional, Sequence, Union, overload
+
+
+def freeze(value: Any) -> Any:
+    """
+    Return a read-only view of a value if it is a dict or a list, the value itself otherwise.
+    """
+    if isinstance(value, dict):
+        return DocumentView(value)
+    if isinstance(value, list):
+        return ListView(value)
+    return value
+
+
+class _View:
+    # Views of nested values are kept by their parent once created, so that reading them again
+    # allocates nothing. The values a view wraps never change, so neither do their views.
+    __slots__ = ("_views",)
+
+    def __init__(self) -> None:
+        self._views: Optional[Dict[Hashable, Any]] = None
+
+    def _child(self, key: Hashable, value: Any) -> Any:
+        if not isinstance(value, (dict, list)):
+            return value
+        if self._views is None:
+            self._views = {}
+        view = self._views.get(key)
+        if view is None:
+            view = self._views[key] = freeze(value)
+        return view
+
+
+class DocumentView(_View, Mapping[str, Any]):
+    """
+    A read-only view of a document, sharing its structure instead of copying it.
+
+    Nested dicts and lists are wrapped in views of their own the first time they are accessed,
+    so that the document cannot be modified through the view at any depth, and kept for later
+    accesses. Stored documents are never modified in place (updates replace them, see
+    `flux0_nanodb.patch`), so a view keeps showing the document as it was when it was read.
+    """
+
+    __slots__ = ("_data",)
+
+    def __init__(self, data: Mapping[str, Any]) -> None:
+        super().__init__()
+        self._data = data
+
+    def __getitem__(self, key: str) -> Any:
+        return self._child(key, self._data[key])
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key not in self._data:
+            return freeze(default)
+        return self._child(key, self._data[key])
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._data
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, DocumentView):
+            other = other._data
+        return self._data == other
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"DocumentView({self._data!r})"
+
+    def copy(self) -> dict[str, Any]:
+        """
+        Return a shallow, mutable copy of the document. Nested values are still shared.
+        """
+        return dict(self._data)
+
+
+class ListView(_View, Sequence[Any]):
+    """
+    A read-only view of a list held by a document, see `DocumentView`.
+    """
+
+    __slots__ = ("_data",)
+
+    def __init__(self, data: List[Any]) -> None:
+        super().__init__()
+        self._data = data
+
+    @overload
+    def __getitem__(self, index: int) -> Any: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "ListView": ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            return ListView(self._data[index])
+        if index < 0:
+            index += len(self._data)
+        return self._child(index, self._data[index])
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, ListView):
+            other = other._data
+        return self._data == other
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"ListView({self._data!r})"
@@ -0,0 +1,176 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Mapping, Optional, Sequence, TypedDict
+
+import pytest
+from flux0_nanodb import memory
+from flux0_nanodb.aggregation import Aggregation
+from flux0_nanodb.api import DocumentCollection
+from flux0_nanodb.index import ordered_key
+from flux0_nanodb.memory import MemoryDocumentDatabase
+from flux0_nanodb.query import Comparison, QueryFilter, compile_query
+from flux0_nanodb.sqlite import SQLiteDocumentDatabase
+from flux0_nanodb.types import Accumulator, DocumentID, DocumentVersion
+
+
+class Event(TypedDict, total=False):
+    id: DocumentID
+    version: DocumentVersion
+    session_id: str
+    agent: str
+    created_at: datetime
+    offset: Any
+
+
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def make_events() -> List[Event]:
+    events = []
+    for i in range(60):
+        event = Event(
+            id=DocumentID(f"e{i}"),
+            version=DocumentVersion("1"),
+            session_id=f"s{i % 7}",
+            created_at=START + timedelta(minutes=(i * 13) % 60),
+            offset=i // 7 if i % 11 else "n/a",
+        )
+        if i % 5:
+            event["agent"] = f"a{i % 3}"
+        events.append(event)
+    return events
+
+
+EVENTS = make_events()
+
+ACCUMULATORS = {
+    "events": Accumulator("$count"),
+    "first": Accumulator("$min", "created_at"),
+    "latest": Accumulator("$max", "created_at"),
+    "top": Accumulator("$max", "offset"),
+}
+
+
+def expected(
+    group_by: Sequence[str], filters: Optional[QueryFilter] = None
+) -> List[Dict[str, Any]]:
+    groups: Dict[Any, List[Event]] = {}
+    for event in EVENTS:
+        if filters is None or compile_query(filters)(event):
+            groups.setdefault(tuple(event.get(f) for f in group_by), []).append(event)
+    return [
+        {
+            **dict(zip(group_by, key)),
+            "events": len(events),
+            "first": min(e["created_at"] for e in events),
+            "latest": max(e["created_at"] for e in events),
+            # Strings order after numbers.
+            "top": max((e["offset"] for e in events), key=lambda value: ordered_key(value) or ()),
+        }
+        for key, events in groups.items()
+    ]
+
+
+def ordered(results: Sequence[Mapping[str, Any]]) -> List[Mapping[str, Any]]:
+    return sorted(results, key=lambda result: repr(sorted(result.items())))
+
+
+@pytest.fixture(params=["memory", "cooperative", "partitioned", "sqlite"])
+async def events(
+    request: pytest.FixtureRequest, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> AsyncIterator[DocumentCollection[Event]]:
+    if request.param == "sqlite":
+        async with SQLiteDocumentDatabase(tmp_path / "db.sqlite3") as db:
+            collection = await db.create_collection("events", Event)
+            await collection.insert_many(EVENTS)
+            yield collection
+        return
+    monkeypatch.setattr(memory, "SCAN_CHUNK", 4)
+    memory_db = MemoryDocumentDatabase()
+    if request.param == "cooperative":
+        collection = await memory_db.create_collection("events", Event, scan_threshold=10)
+    elif request.param == "partitioned":
+        collection = await memory_db.create_collection("events", Event, "session_id")
+    else:
+        collection = await memory_db.create_collection("events", Event)
+    await collection.insert_many(EVENTS)
+    yield collection
+
+
+@pytest.mark.parametrize(
+    "group_by, filters",
+    [
+        ((), None),
+        (("session_id",), None),
+        (("agent",), None),
+        (("agent", "session_id"), Comparison(path="offset", op="$gte", value=3)),
+        (("session_id",), Comparison(path="session_id", op="$in", value=["s1", "s4"])),
+    ],
+)
+async def test_aggregate(
+    events: DocumentCollection[Event], group_by: Sequence[str], filters: Optional[QueryFilter]
+) -> None:
+    results = await events.aggregate(filters, group_by, ACCUMULATORS)
+    assert ordered(results) == ordered(expected(group_by, filters))
+
+
+async def test_aggregate_nothing(events: DocumentCollection[Event]) -> None:
+    nothing = Comparison(path="session_id", op="$eq", value="none")
+    assert await events.aggregate(nothing, (), {"events": Accumulator("$count")}) == []
+    assert await events.aggregate(nothing, ("agent",), ACCUMULATORS) == []
+    # Without accumulators, aggregating lists the distinct groups.
+    sessions = await events.aggregate(None, ("session_id",), {})
+    assert sorted(s["session_id"] for s in sessions) == [f"s{i}" for i in range(7)]
+
+
+@pytest.mark.parametrize("partition_key", [None, "session_id"])
+async def test_aggregate_from_indexes(
+    partition_key: Optional[str], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    db = MemoryDocumentDatabase()
+    events = await db.create_collection("events", Event, partition_key)
+    await events.insert_many(EVENTS)
+    await events.create_index(("session_id", "created_at"), ordered=True)
+    await events.create_index("created_at", ordered=True)
+    await events.create_index("id")
+    indexed = {
+        "events": Accumulator("$count"),
+        "first": Accumulator("$min", "created_at"),
+        "latest": Accumulator("$max", "created_at"),
+    }
+    want = {
+        group_by: ordered(
+            [{k: v for k, v in result.items() if k != "top"} for result in expected(group_by)]
+        )
+        for group_by in [("session_id",), ()]
+    }
+
+    # Indexes holding every document answer without a single document being read.
+    def add(self: Aggregation, document: Mapping[str, Any]) -> None:
+        raise AssertionError("Read a document")
+
+    monkeypatch.setattr(Aggregation, "add", add)
+    for group_by, results in want.items():
+        assert ordered(await events.aggregate(None, group_by, indexed)) == results
+    by_time = await events.aggregate(None, ("created_at",), {"n": Accumulator("$count")})
+    assert sum(result["n"] for result in by_time) == len(EVENTS)
+    by_id = await events.aggregate(None, ("id",), {"n": Accumulator("$count")})
+    assert ordered(by_id) == ordered([{"id": e["id"], "n": 1} for e in EVENTS])
+    # Other aggregations read the documents.
+    with pytest.raises(AssertionError):
+        await events.aggregate(None, ("agent",), indexed)
+
+
+def test_invalid_accumulators() -> None:
+    with pytest.raises(ValueError, match="twice"):
+        Aggregation(("a", "a"), {})
+    with pytest.raises(ValueError, match="clashes"):
+        Aggregation(("a",), {"a": Accumulator("$count")})
+    with pytest.raises(ValueError, match="no path"):
+        Aggregation((), {"n": Accumulator("$count", "a")})
+    with pytest.raises(ValueError, match="path"):
+        Aggregation((), {"n": Accumulator("$max")})
+    with pytest.raises(ValueError, match="Unknown"):
+        Aggregation((), {"n": Accumulator("$sum", "a")})  # type: ignore[arg-type]
+    with pytest.raises(TypeError, match="unhashable"):
+        Aggregation(("a",), {}).add({"a": ["x"]})
@@ -0,0 +1,179 @@
+import asyncio
+from pathlib import Path
+from typing import Any, List, Optional, TypedDict
+
+import pytest
+from flux0_nanodb import memory
+from flux0_nanodb.cache import CacheStats, ResultCache, query_key
+from flux0_nanodb.file import FileDocumentDatabase
+from flux0_nanodb.memory import MemoryDocumentCollection, MemoryDocumentDatabase
+from flux0_nanodb.partition import PartitionedDocumentCollection
+from flux0_nanodb.projection import Projection
+from flux0_nanodb.query import And, Comparison
+from flux0_nanodb.types import DocumentID, DocumentVersion, SortingOrder
+
+
+class Session(TypedDict, total=False):
+    id: DocumentID
+    version: DocumentVersion
+    user_id: str
+    agent_id: str
+    title: str
+
+
+def make_session(i: int) -> Session:
+    return Session(
+        id=DocumentID(f"s{i}"),
+        version=DocumentVersion("1"),
+        user_id=f"u{i % 2}",
+        agent_id=f"a{i % 3}",
+        title=f"session {i}",
+    )
+
+
+USER_AND_AGENT = And(
+    expressions=[
+        Comparison(path="user_id", op="$eq", value="u1"),
+        Comparison(path="agent_id", op="$eq", value="a0"),
+    ]
+)
+
+
+def test_query_keys() -> None:
+    sort = [("title", SortingOrder.ASC)]
+    key = query_key(USER_AND_AGENT, None, 10, None, sort)
+    same = And(expressions=list(USER_AND_AGENT.expressions))
+    assert query_key(same, None, 10, 0, [("title", SortingOrder.ASC)]) == key
+    assert query_key(USER_AND_AGENT, None, 10, 1, sort) != key
+    assert query_key(USER_AND_AGENT, None, 10, None, None) != key
+    assert query_key(USER_AND_AGENT, {"title": Projection.INCLUDE}, 10, None, sort) != key
+    assert query_key(
+        Comparison(path="user_id", op="$eq", value=1), None, None, None, None
+    ) != query_key(Comparison(path="user_id", op="$eq", value="1"), None, None, None, None)
+    # Queries comparing to unhashable values have no key.
+    unhashable: Any = {"id": "u1"}
+    opaque = Comparison(path="user_id", op="$in", value=["u1", unhashable])
+    assert query_key(And(expressions=[opaque]), None, None, None, None) is None
+
+
+async def test_budget_evicts_least_recently_used() -> None:
+    sessions = [make_session(i) for i in range(4)]
+
+    async def read(i: int) -> List[Session]:
+        return [sessions[i]]
+
+    probe: ResultCache[Session] = ResultCache(budget=1 << 20)
+    await probe.fetch(0, lambda: read(0))
+    size = probe.stats.size
+
+    cache: ResultCache[Session] = ResultCache(budget=3 * size)
+    for i in range(3):
+        assert await cache.fetch(i, lambda: read(i)) == [sessions[i]]
+    assert await cache.fetch(0, lambda: read(0)) == [sessions[0]]
+    # Going over the budget evicts the result used least recently.
+    await cache.fetch(3, lambda: read(3))
+    assert cache.stats == CacheStats(hits=1, misses=4, entries=3, size=3 * size)
+    await cache.fetch(0, lambda: read(0))
+    await cache.fetch(1, lambda: read(1))
+    assert (cache.stats.hits, cache.stats.misses) == (2, 5)
+
+    # Results larger than the budget are not cached.
+    async def read_all() -> List[Session]:
+        return sessions
+
+    await cache.fetch("all", read_all)
+    assert cache.stats.entries == 3
+
+    with pytest.raises(ValueError, match="positive"):
+        ResultCache(0)
+
+
+@pytest.mark.parametrize("partition_key", [None, "user_id"])
+async def test_results_are_cached_until_the_next_write(partition_key: Optional[str]) -> None:
+    db = MemoryDocumentDatabase()
+    sessions = await db.create_collection("sessions", Session, partition_key, cache_budget=1 << 20)
+    assert isinstance(sessions, (MemoryDocumentCollection, PartitionedDocumentCollection))
+    await sessions.insert_many([make_session(i) for i in range(12)])
+    sort = [("title", SortingOrder.DESC)]
+
+    first = await sessions.find(USER_AND_AGENT, sort=sort)
+    assert [s["id"] for s in first] == ["s9", "s3"]
+    # Callers own the lists they are handed.
+    first.clear()  # type: ignore[attr-defined]
+    assert await sessions.find(USER_AND_AGENT, sort=sort) == [make_session(9), make_session(3)]
+    await sessions.find(None, limit=2)
+    stats = sessions.cache_stats
+    assert stats is not None and (stats.hits, stats.misses, stats.entries) == (1, 2, 2)
+
+    await sessions.update_one(
+        Comparison(path="id", op="$eq", value="s3"),
+        [{"op": "replace", "path": "/title", "value": "renamed"}],
+    )
+    assert sessions.cache_stats is not None and sessions.cache_stats.entries == 0
+    assert [s["title"] for s in await sessions.find(USER_AND_AGENT, sort=sort)] == [
+        "session 9",
+        "renamed",
+    ]
+    await sessions.insert_one(make_session(15))
+    assert [s["id"] for s in await sessions.find(USER_AND_AGENT, sort=sort)] == ["s9", "s15", "s3"]
+    await sessions.delete_one(Comparison(path="id", op="$eq", value="s9"))
+    assert len(await sessions.find(USER_AND_AGENT, sort=sort)) == 2
+    assert sessions.cache_stats is not None and sessions.cache_stats.hits == 1
+
+
+@pytest.mark.parametrize("partition_key", [None, "user_id"])
+async def test_cached_results_are_handed_out_as_copies(partition_key: Optional[str]) -> None:
+    db = MemoryDocumentDatabase()
+    sessions = await db.create_collection("sessions", Session, partition_key, cache_budget=1 << 20)
+    assert isinstance(sessions, (MemoryDocumentCollection, PartitionedDocumentCollection))
+    await sessions.insert_many([make_session(i) for i in range(6)])
+    projection = {"title": Projection.INCLUDE}
+
+    for _ in range(2):
+        # Projected documents belong to the caller, whether the result was cached or not.
+        projected = await sessions.find(USER_AND_AGENT, projection=projection)
+        assert projected == [{"title": "session 3"}]
+        projected[0]["title"] = "changed"
+    assert await sessions.find(USER_AND_AGENT, projection=projection) == [{"title": "session 3"}]
+    assert sessions.cache_stats is not None and sessions.cache_stats.hits == 2
+
+    # Queries that cannot be cached take no room in the cache.
+    unhashable: Any = {"title": "session 2"}
+    opaque = Comparison(path="title", op="$in", value=["session 1", unhashable])
+    assert len(await sessions.find(opaque)) == 1
+    assert len(await sessions.find(opaque)) == 1
+    assert sessions.cache_stats == CacheStats(
+        hits=2, misses=1, entries=1, size=sessions.cache_stats.size
+    )
+
+
+async def test_reads_overtaken_by_writes_are_not_cached(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(memory, "SCAN_CHUNK", 2)
+    db = MemoryDocumentDatabase()
+    sessions = await db.create_collection(
+        "sessions", Session, scan_threshold=4, cache_budget=1 << 20
+    )
+    assert isinstance(sessions, MemoryDocumentCollection)
+    await sessions.insert_many([make_session(i) for i in range(12)])
+    read = asyncio.ensure_future(sessions.find(None))
+    await asyncio.sleep(0)
+    await sessions.delete_one(Comparison(path="id", op="$eq", value="s0"))
+    # The read sees the collection as it was when it started, but does not cache it.
+    assert len(await read) == 12
+    assert len(await sessions.find(None)) == 11
+
+
+async def test_file_collections(tmp_path: Path) -> None:
+    async with FileDocumentDatabase(tmp_path) as db:
+        sessions = await db.create_collection("sessions", Session, cache_budget=1 << 20)
+        await sessions.insert_many([make_session(i) for i in range(6)])
+        assert len(await sessions.find(USER_AND_AGENT)) == 1
+        await sessions.insert_one(make_session(9))
+        assert len(await sessions.find(USER_AND_AGENT)) == 2
+    # Restored collections get their cache once declared.
+    async with FileDocumentDatabase(tmp_path) as db:
+        restored = await db.create_collection("sessions", Session, cache_budget=1 << 20)
+        assert isinstance(restored, MemoryDocumentCollection)
+        await restored.find(USER_AND_AGENT)
+        await restored.find(USER_AND_AGENT)
+        assert restored.cache_stats is not None and restored.cache_stats.hits == 1
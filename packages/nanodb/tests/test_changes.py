@@ -0,0 +1,104 @@
+import asyncio
+from pathlib import Path
+from typing import AsyncIterator, List, Tuple, TypedDict
+
+import pytest
+from flux0_nanodb.api import DocumentCollection, DocumentDatabase
+from flux0_nanodb.memory import MemoryDocumentDatabase
+from flux0_nanodb.query import Comparison
+from flux0_nanodb.sqlite import SQLiteDocumentDatabase
+from flux0_nanodb.types import ChangeEvent, DocumentID, DocumentVersion
+
+
+class Doc(TypedDict, total=False):
+    id: DocumentID
+    version: DocumentVersion
+    session_id: str
+    n: int
+
+
+def make_doc(i: int, session_id: str = "s1") -> Doc:
+    return Doc(id=DocumentID(f"d{i}"), version=DocumentVersion("1"), session_id=session_id, n=i)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+async def collection(
+    request: pytest.FixtureRequest, tmp_path: Path
+) -> AsyncIterator[DocumentCollection[Doc]]:
+    db: DocumentDatabase
+    if request.param == "memory":
+        db = MemoryDocumentDatabase()
+        yield await db.create_collection("docs", Doc)
+    else:
+        async with SQLiteDocumentDatabase(tmp_path / "db.sqlite3") as db:
+            yield await db.create_collection("docs", Doc)
+
+
+def summary(events: List[ChangeEvent[Doc]]) -> List[Tuple[str, str, int]]:
+    return [(event.operation, event.document_id, event.document["n"]) for event in events]
+
+
+async def test_watch(collection: DocumentCollection[Doc]) -> None:
+    await collection.insert_one(make_doc(0))  # before the stream is opened
+    stream = collection.watch()
+    await collection.insert_many([make_doc(1), make_doc(2, "s2")])
+    await collection.update_one(
+        Comparison(path="id", op="$eq", value="d1"), [{"op": "replace", "path": "/n", "value": 10}]
+    )
+    await collection.update_many(
+        Comparison(path="id", op="$eq", value="d3"),
+        [{"op": "add", "path": "/id", "value": "d3"}, {"op": "add", "path": "/n", "value": 3}],
+        upsert=True,
+    )
+    await collection.delete_one(Comparison(path="id", op="$eq", value="d0"))
+    await collection.delete_many(Comparison(path="n", op="$gte", value=2))
+
+    events = [await anext(stream) for _ in range(8)]
+    assert summary(events) == [
+        ("insert", "d1", 1),
+        ("insert", "d2", 2),
+        ("update", "d1", 10),
+        ("insert", "d3", 3),
+        ("delete", "d0", 0),
+        ("delete", "d1", 10),
+        ("delete", "d2", 2),
+        ("delete", "d3", 3),
+    ]
+    sequences = [event.sequence for event in events]
+    assert sequences == sorted(set(sequences))
+
+    # A stream resumes right after the event its token comes from.
+    resumed = collection.watch(resume_after=events[4].resume_token)
+    assert summary([await anext(resumed) for _ in range(3)]) == summary(events[5:])
+    with pytest.raises(ValueError):
+        collection.watch(resume_after="unknown:1")
+
+    stream.close()
+    with pytest.raises(StopAsyncIteration):
+        await anext(stream)
+
+
+async def test_watch_wakes_up_readers(collection: DocumentCollection[Doc]) -> None:
+    async with collection.watch(Comparison(path="session_id", op="$eq", value="s2")) as stream:
+        reader = asyncio.create_task(anext(stream))
+        await asyncio.sleep(0)
+        await collection.insert_one(make_doc(1, "s1"))
+        await asyncio.sleep(0)
+        assert not reader.done()
+        await collection.insert_one(make_doc(2, "s2"))
+        event = await asyncio.wait_for(reader, 1)
+        assert event.document_id == "d2"
+
+
+async def test_slow_watchers_are_closed(collection: DocumentCollection[Doc]) -> None:
+    stream = collection.watch(buffer_size=2)
+    await collection.insert_many([make_doc(i) for i in range(2)])
+    first = await anext(stream)
+    await collection.insert_many([make_doc(i) for i in range(2, 5)])
+    with pytest.raises(ValueError, match="fell more than 2 events behind"):
+        await anext(stream)
+
+    # Nothing was lost for a stream resumed where the slow one stopped.
+    assert stream.resume_token == first.resume_token
+    resumed = collection.watch(resume_after=stream.resume_token)
+    assert [(await anext(resumed)).document_id for _ in range(4)] == ["d1", "d2", "d3", "d4"]
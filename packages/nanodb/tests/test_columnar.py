@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, TypedDict
+
+from flux0_nanodb.columnar import ColumnarSnapshot, SnapshotSlots, write_snapshot
+from flux0_nanodb.file import FileDocumentDatabase
+from flux0_nanodb.query import And, Comparison
+from flux0_nanodb.types import DocumentID, DocumentVersion
+
+
+class Event(TypedDict, total=False):
+    id: DocumentID
+    version: DocumentVersion
+    session_id: str
+    offset: int
+    deleted: bool
+    data: Dict[str, Any]
+
+
+FIELDS = ["id", "value", "created_at", "missing"]
+
+
+def make_slots() -> List[Optional[Mapping[str, Any]]]:
+    values: List[Any] = [
+        0,
+        -(2**63),
+        2**70,
+        1.5,
+        float("inf"),
+        True,
+        False,
+        None,
+        "",
+        "héllo",
+        {"nested": [1]},
+        [1, 2],
+    ]
+    created: List[Any] = [
+        datetime(2025, 1, 1, 12, 30, 15, 123456),
+        datetime(1900, 1, 1, tzinfo=timezone.utc),
+        datetime(2025, 1, 1, tzinfo=timezone(timedelta(hours=2))),
+    ]
+    slots: List[Optional[Mapping[str, Any]]] = []
+    for i, value in enumerate(values):
+        slots.append({"id": f"d{i}", "value": value, "created_at": created[i % len(created)]})
+        if i % 4 == 0:
+            slots.append(None)
+    return slots
+
+
+def test_round_trip(tmp_path: Path) -> None:
+    slots = make_slots()
+    write_snapshot(tmp_path / "a.cols", slots, FIELDS)
+    snapshot = ColumnarSnapshot(tmp_path / "a.cols")
+    try:
+        assert len(snapshot) == len(slots)
+        assert snapshot.live == sum(1 for doc in slots if doc is not None)
+        restored: SnapshotSlots[Any] = SnapshotSlots(snapshot)
+        for position, doc in enumerate(slots):
+            row = restored.row(position)
+            if doc is None:
+                assert row is None
+                continue
+            assert row is not None
+            for field in FIELDS:
+                assert repr(row.get(field, "default")) == repr(doc.get(field, "default"))
+            assert restored[position] == doc
+
+        # Snapshots can be written from restored slots, pending documents included.
+        restored[1] = None
+        restored.append({"id": "new"})
+        write_snapshot(tmp_path / "b.cols", SnapshotSlots(snapshot), ["value"])
+        copied = ColumnarSnapshot(tmp_path / "b.cols")
+        assert list(SnapshotSlots(copied)) == slots
+        copied.close()
+
+        compacted = restored.compacted()
+        assert list(compacted) == [doc for doc in restored if doc is not None]
+    finally:
+        snapshot.close()
+
+
+async def test_documents_are_decoded_on_demand(tmp_path: Path) -> None:
+    path = tmp_path / "db"
+    async with FileDocumentDatabase(path) as db:
+        events = await db.create_collection("events", Event)
+        await events.create_index("id", unique=True)
+        await events.create_index(("session_id", "offset"))
+        await events.insert_many(
+            [
+                {
+                    "id": DocumentID(f"e{i}"),
+                    "version": DocumentVersion("1"),
+                    "session_id": f"s{i % 10}",
+                    "offset": i,
+                    "deleted": i % 7 == 0,
+                    "data": {"text": "x" * 100},
+                }
+                for i in range(1000)
+            ]
+        )
+
+    async with FileDocumentDatabase(path) as db:
+        events = await db.create_collection("events", Event)
+        slots = events._slots  # type: ignore[attr-defined]
+        assert isinstance(slots, SnapshotSlots)
+
+        def decoded() -> int:
+            return sum(1 for position in range(len(slots)) if slots.raw(position) is None)
+
+        # Indexes were rebuilt from the columns.
+        assert decoded() == 0
+        found = await events.find(
+            And(
+                expressions=[
+                    Comparison(path="session_id", op="$eq", value="s3"),
+                    Comparison(path="offset", op="$lt", value=100),
+                ]
+            )
+        )
+        assert [doc["id"] for doc in found] == [f"e{i}" for i in range(3, 100, 10)]
+        assert decoded() == 10
+        # Filters on fields without a column decode documents only for as long as they match.
+        assert await events.count(Comparison(path="deleted", op="$eq", value=True)) == 143
+        assert decoded() == 10
+
+        await events.delete_many(Comparison(path="offset", op="$gte", value=10))
+        await events.update_one(
+            Comparison(path="id", op="$eq", value="e1"),
+            [{"op": "replace", "path": "/offset", "value": -1}],
+        )
+
+    async with FileDocumentDatabase(path) as db:
+        events = await db.create_collection("events", Event)
+        assert [doc["offset"] for doc in await events.find(None)] == [0, -1, *range(2, 10)]
+        assert len(list(path.glob("*.cols"))) == 1
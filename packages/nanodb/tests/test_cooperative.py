@@ -0,0 +1,117 @@
+import asyncio
+import threading
+from typing import Any, Iterable, List, Optional, Sequence, Tuple, TypedDict
+
+import pytest
+from flux0_nanodb import cooperative, memory, sorting
+from flux0_nanodb.api import DocumentCollection
+from flux0_nanodb.cooperative import paginate
+from flux0_nanodb.memory import MemoryDocumentDatabase
+from flux0_nanodb.query import Comparison
+from flux0_nanodb.types import DocumentID, DocumentVersion, SortingOrder
+
+
+class Doc(TypedDict, total=False):
+    id: DocumentID
+    version: DocumentVersion
+    group: str
+    n: int
+
+
+DOCS = [
+    Doc(id=DocumentID(f"d{i}"), version=DocumentVersion("1"), group=f"g{i % 3}", n=(i * 7) % 50)
+    for i in range(50)
+]
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(memory, "SCAN_CHUNK", 5)
+
+
+async def make_collections(
+    partition_key: Optional[str] = None,
+) -> Tuple[DocumentCollection[Doc], DocumentCollection[Doc]]:
+    """
+    Return a collection reading cooperatively past 10 documents, and one never doing so.
+    """
+    db = MemoryDocumentDatabase()
+    shared = await db.create_collection("shared", Doc, partition_key, scan_threshold=10)
+    blocking = await db.create_collection("blocking", Doc, partition_key, scan_threshold=None)
+    for collection in (shared, blocking):
+        await collection.insert_many(DOCS)
+    return shared, blocking
+
+
+async def count_turns(read: "asyncio.Future[Any]") -> int:
+    """
+    Count the turns of the event loop other tasks get while a read runs.
+    """
+    turns = 0
+    while not read.done():
+        turns += 1
+        await asyncio.sleep(0)
+    return turns
+
+
+def test_paginate() -> None:
+    matches: List[Optional[Doc]] = [None, DOCS[1], DOCS[2], None, DOCS[3], DOCS[4], None, DOCS[5]]
+    assert list(paginate(iter(matches), 1, 4)) == [None, DOCS[2], None, DOCS[3], DOCS[4]]
+    assert list(paginate(iter(matches), 3, None)) == [None, None, DOCS[4], None, DOCS[5]]
+    assert list(paginate(iter(matches), 2, 2)) == []
+
+
+@pytest.mark.parametrize("partition_key", [None, "group"])
+async def test_large_reads_share_the_event_loop(partition_key: Optional[str]) -> None:
+    shared, blocking = await make_collections(partition_key)
+    queries: List[Any] = [
+        dict(filters=None),
+        dict(filters=Comparison(path="n", op="$gte", value=10), limit=7, offset=3),
+        dict(
+            filters=None,
+            sort=[("n", SortingOrder.DESC), ("id", SortingOrder.ASC)],
+            limit=12,
+            offset=4,
+        ),
+        dict(filters=None, projection={"n": 1}, sort=[("n", SortingOrder.ASC)]),
+    ]
+    for query in queries:
+        read = asyncio.ensure_future(shared.find(**query))
+        assert await count_turns(read) > 1
+        assert await read == await blocking.find(**query)
+        assert [doc async for doc in shared.find_iter(**query, batch_size=4)] == await read
+
+    # Reads expected to examine few documents run in one go.
+    await shared.create_index("n")
+    read = asyncio.ensure_future(shared.find(Comparison(path="n", op="$eq", value=7)))
+    assert await count_turns(read) <= 1
+    assert [doc["id"] for doc in await read] == ["d1"]
+
+
+async def test_large_reads_see_a_point_in_time() -> None:
+    collection, _ = await make_collections()
+    read = asyncio.ensure_future(collection.find(None, sort=[("n", SortingOrder.ASC)]))
+    await asyncio.sleep(0)
+    # Writers go ahead while the read is under way, without it seeing their writes.
+    await collection.delete_many(Comparison(path="n", op="$lt", value=25))
+    await collection.update_many(
+        Comparison(path="n", op="$gte", value=0), [{"op": "replace", "path": "/n", "value": -1}]
+    )
+    await collection.insert_one(Doc(id=DocumentID("late"), version=DocumentVersion("1"), n=-2))
+    assert [doc["n"] for doc in await read] == sorted(doc["n"] for doc in DOCS)
+
+
+async def test_large_sorts_run_on_a_worker_thread(monkeypatch: pytest.MonkeyPatch) -> None:
+    threads: List[threading.Thread] = []
+
+    def recording(docs: Iterable[Doc], sort: Sequence[Any], k: Optional[int] = None) -> List[Doc]:
+        threads.append(threading.current_thread())
+        return sorting.sort_documents(docs, sort, k)
+
+    monkeypatch.setattr(cooperative, "sort_documents", recording)
+    collection, _ = await make_collections()
+    sort = [("n", SortingOrder.ASC)]
+    await collection.find(Comparison(path="n", op="$lt", value=20), sort=sort)
+    await collection.find(Comparison(path="n", op="$lt", value=2), sort=sort)
+    assert threads[0] is not threading.main_thread()
+    assert threads[1] is threading.main_thread()
@@ -1,4 +1,5 @@
 import uuid
+from datetime import datetime, timedelta, timezone
 from typing import Any, List, NotRequired, TypedDict
 
 import pytest
@@ -10,13 +11,15 @@ from flux0_nanodb.api import (
 )
 from flux0_nanodb.memory import MemoryDocumentDatabase
 from flux0_nanodb.projection import Projection
-from flux0_nanodb.query import Comparison, QueryFilter
+from flux0_nanodb.query import And, Comparison, Or, QueryFilter
 from flux0_nanodb.types import (
     DeleteResult,
     DocumentID,
     DocumentVersion,
     InsertOneResult,
     JSONPatchOperation,
+    PlanStage,
+    QueryPlan,
     SortingOrder,
 )
 
@@ -353,3 +356,608 @@ async def test_update_invalid_patch(collection: DocumentCollection[SimpleDocumen
         )
     docs = await collection.find(Comparison(path="id", op="$eq", value=doc_id))
     assert doc == docs[0]
+
+
+@pytest.mark.asyncio
+async def test_find_with_index(collection: DocumentCollection[SimpleDocument]) -> None:
+    await collection.create_index("name")
+    docs = [
+        SimpleDocument(
+            id=DocumentID(str(uuid.uuid4())), version=DocumentVersion("1.0"), name=n, value=i
+        )
+        for i, n in enumerate(["Alice", "Bob", "Alice", "Carol"])
+    ]
+    for doc in docs:
+        await collection.insert_one(doc)
+
+    # Equality lookups keep insertion order.
+    found = await collection.find(Comparison(path="name", op="$eq", value="Alice"))
+    assert found == [docs[0], docs[2]]
+
+    # $in lookups merge several index entries.
+    found = await collection.find(Comparison(path="name", op="$in", value=["Carol", "Bob"]))
+    assert found == [docs[1], docs[3]]
+
+    # Non-indexed clauses are still applied to the index candidates.
+    found = await collection.find(
+        And(
+            expressions=[
+                Comparison(path="name", op="$eq", value="Alice"),
+                Comparison(path="value", op="$gt", value=0),
+            ]
+        )
+    )
+    assert found == [docs[2]]
+
+    # The index follows updates and deletes.
+    await collection.update_one(
+        Comparison(path="id", op="$eq", value=docs[0]["id"]),
+        [{"op": "replace", "path": "/name", "value": "Bob"}],
+    )
+    found = await collection.find(Comparison(path="name", op="$eq", value="Bob"))
+    assert [d["id"] for d in found] == [docs[0]["id"], docs[1]["id"]]
+
+    await collection.delete_one(Comparison(path="name", op="$eq", value="Bob"))
+    found = await collection.find(Comparison(path="name", op="$in", value=["Alice", "Bob"]))
+    assert found == [docs[1], docs[2]]
+
+
+@pytest.mark.asyncio
+async def test_unique_index(collection: DocumentCollection[SimpleDocument]) -> None:
+    doc = SimpleDocument(id=DocumentID("d1"), version=DocumentVersion("1.0"), name="Alice", value=1)
+    await collection.insert_one(doc)
+    await collection.create_index("id", unique=True)
+    # Creating the same index again is a no-op, changing its options is not.
+    await collection.create_index("id", unique=True)
+    with pytest.raises(ValueError):
+        await collection.create_index("id")
+
+    with pytest.raises(ValueError):
+        await collection.insert_one(
+            SimpleDocument(id=DocumentID("d1"), version=DocumentVersion("1.0"), name="Bob", value=2)
+        )
+    assert await collection.find(filters=None) == [doc]
+
+    # An update may keep its own value but not take another document's.
+    other = SimpleDocument(id=DocumentID("d2"), version=DocumentVersion("1.0"), name="Bob", value=2)
+    await collection.insert_one(other)
+    result = await collection.update_one(
+        Comparison(path="id", op="$eq", value="d1"),
+        [{"op": "replace", "path": "/value", "value": 3}],
+    )
+    assert result.modified_count == 1
+    with pytest.raises(ValueError):
+        await collection.update_one(
+            Comparison(path="id", op="$eq", value="d2"),
+            [{"op": "replace", "path": "/id", "value": "d1"}],
+        )
+    found = await collection.find(Comparison(path="id", op="$eq", value="d2"))
+    assert found == [other]
+
+
+@pytest.mark.asyncio
+async def test_find_with_ordered_index(collection: DocumentCollection[SimpleDocument]) -> None:
+    await collection.create_index("value", ordered=True)
+    docs = [
+        SimpleDocument(
+            id=DocumentID(str(uuid.uuid4())), version=DocumentVersion("1.0"), name=n, value=v
+        )
+        for n, v in [("a", 30), ("b", 10), ("c", 20), ("d", 10), ("e", 40)]
+    ]
+    for doc in docs:
+        await collection.insert_one(doc)
+
+    # Range lookups return documents in insertion order.
+    found = await collection.find(Comparison(path="value", op="$gte", value=20))
+    assert found == [docs[0], docs[2], docs[4]]
+    found = await collection.find(Comparison(path="value", op="$lt", value=20))
+    assert found == [docs[1], docs[3]]
+    found = await collection.find(Comparison(path="value", op="$gt", value=40))
+    assert found == []
+
+    # Sorting on the indexed field keeps ties in insertion order, in both directions.
+    found = await collection.find(filters=None, sort=[("value", SortingOrder.ASC)])
+    assert found == [docs[1], docs[3], docs[2], docs[0], docs[4]]
+    found = await collection.find(filters=None, sort=[("value", SortingOrder.DESC)])
+    assert found == [docs[4], docs[0], docs[2], docs[1], docs[3]]
+    found = await collection.find(
+        Comparison(path="name", op="$ne", value="e"), sort=[("value", SortingOrder.DESC)], limit=2
+    )
+    assert found == [docs[0], docs[2]]
+
+    # Updates move documents within the index.
+    await collection.update_one(
+        Comparison(path="name", op="$eq", value="b"),
+        [{"op": "replace", "path": "/value", "value": 50}],
+    )
+    found = await collection.find(Comparison(path="value", op="$gt", value=35))
+    assert [d["name"] for d in found] == ["b", "e"]
+
+
+@pytest.mark.asyncio
+async def test_ordered_index_on_datetimes(db: DocumentDatabase) -> None:
+    class TimedDocument(TypedDict, total=False):
+        id: DocumentID
+        version: DocumentVersion
+        created_at: datetime
+
+    collection = await db.create_collection("timed", TimedDocument)
+    await collection.create_index("created_at", ordered=True)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    docs = [
+        TimedDocument(id=DocumentID(str(i)), created_at=start + timedelta(days=i)) for i in range(5)
+    ]
+    for doc in reversed(docs):
+        await collection.insert_one(doc)
+
+    found = await collection.find(
+        Comparison(path="created_at", op="$gte", value=start + timedelta(days=3)),
+        sort=[("created_at", SortingOrder.ASC)],
+    )
+    assert found == docs[3:]
+    found = await collection.find(
+        Comparison(path="created_at", op="$lt", value=start + timedelta(days=2))
+    )
+    assert found == [docs[1], docs[0]]
+
+
+@pytest.mark.asyncio
+async def test_find_with_compound_index(collection: DocumentCollection[SimpleDocument]) -> None:
+    await collection.create_index(("name", "value"))
+    docs = [
+        SimpleDocument(
+            id=DocumentID(str(uuid.uuid4())), version=DocumentVersion("1.0"), name=n, value=v
+        )
+        for n, v in [("a", 2), ("b", 0), ("a", 0), ("b", 1), ("a", 1), ("a", 3)]
+    ]
+    for doc in docs:
+        await collection.insert_one(doc)
+
+    # Equality on the leading field alone.
+    found = await collection.find(Comparison(path="name", op="$eq", value="b"))
+    assert found == [docs[1], docs[3]]
+
+    # Equality on the leading field plus a range on the next one.
+    found = await collection.find(
+        And(
+            expressions=[
+                Comparison(path="name", op="$eq", value="a"),
+                Comparison(path="value", op="$gte", value=1),
+                Comparison(path="value", op="$lt", value=3),
+            ]
+        )
+    )
+    assert found == [docs[0], docs[4]]
+
+    # Equality on every field.
+    found = await collection.find(
+        And(
+            expressions=[
+                Comparison(path="value", op="$eq", value=0),
+                Comparison(path="name", op="$eq", value="a"),
+            ]
+        )
+    )
+    assert found == [docs[2]]
+
+
+async def test_compound_index_with_missing_fields(
+    collection: DocumentCollection[SimpleDocument],
+) -> None:
+    await collection.create_index(("name", "value"))
+    await collection.insert_many(
+        [
+            SimpleDocument(
+                id=DocumentID(str(i)), version=DocumentVersion("1.0"), name=f"n{i % 10}", value=i
+            )
+            for i in range(50)
+        ]
+    )
+    await collection.insert_one(
+        SimpleDocument(id=DocumentID("partial"), version=DocumentVersion("1.0"), name="n1")
+    )
+    # The index leaves out the document missing its trailing field, so it cannot tell alone
+    # which documents hold the leading one.
+    by_name = Comparison(path="name", op="$eq", value="n1")
+    assert len(await collection.find(by_name)) == 6
+    assert await collection.count(by_name) == 6 and await collection.exists(by_name)
+    assert (await collection.explain(by_name)).plan.stage == PlanStage.FULL_SCAN
+    update = await collection.update_many(by_name, [{"op": "add", "path": "/profile", "value": {}}])
+    assert update.modified_count == 6
+    # Seeks on both fields are unaffected.
+    both = And(
+        expressions=[by_name, Comparison(path="value", op="$gte", value=20)],
+    )
+    assert (await collection.explain(both)).plan.stage == PlanStage.INDEX_SEEK
+    assert await collection.count(both) == 3
+
+    # Seeks on the leading field alone resume once every document is indexed again.
+    assert (
+        await collection.delete_one(Comparison(path="id", op="$eq", value="partial"))
+    ).deleted_count == 1
+    assert (await collection.explain(by_name)).plan.stage == PlanStage.INDEX_SEEK
+    assert (await collection.delete_many(by_name)).deleted_count == 5
+
+
+@pytest.mark.asyncio
+async def test_unique_compound_index(collection: DocumentCollection[SimpleDocument]) -> None:
+    await collection.create_index(["name", "value"], unique=True)
+    await collection.insert_one(
+        SimpleDocument(id=DocumentID("d1"), version=DocumentVersion("1.0"), name="a", value=1)
+    )
+    await collection.insert_one(
+        SimpleDocument(id=DocumentID("d2"), version=DocumentVersion("1.0"), name="a", value=2)
+    )
+    with pytest.raises(ValueError):
+        await collection.insert_one(
+            SimpleDocument(id=DocumentID("d3"), version=DocumentVersion("1.0"), name="a", value=1)
+        )
+
+
+@pytest.mark.asyncio
+async def test_explain(collection: DocumentCollection[SimpleDocument]) -> None:
+    await collection.create_index("id", unique=True)
+    await collection.create_index("name")
+    await collection.create_index("value", ordered=True)
+    for i in range(100):
+        await collection.insert_one(
+            SimpleDocument(
+                id=DocumentID(f"d{i}"), version=DocumentVersion("1.0"), name=f"n{i % 10}", value=i
+            )
+        )
+
+    result = await collection.explain(filters=None)
+    assert result.plan.stage == PlanStage.FULL_SCAN
+    assert result.documents_examined == 100
+    assert result.documents_returned == 100
+
+    result = await collection.explain(Comparison(path="id", op="$eq", value="d3"))
+    assert result.plan == QueryPlan(stage=PlanStage.INDEX_SEEK, index=("id",))
+    assert result.documents_examined == 1
+    assert result.documents_returned == 1
+
+    # The most selective index wins.
+    result = await collection.explain(
+        And(
+            expressions=[
+                Comparison(path="name", op="$eq", value="n1"),
+                Comparison(path="value", op="$gte", value=98),
+            ]
+        )
+    )
+    assert result.plan == QueryPlan(stage=PlanStage.INDEX_SEEK, index=("value",))
+    assert result.documents_examined == 2
+    assert result.documents_returned == 0
+
+    # Two weakly selective indexes are intersected.
+    result = await collection.explain(
+        And(
+            expressions=[
+                Comparison(path="name", op="$eq", value="n1"),
+                Comparison(path="value", op="$lt", value=10),
+            ]
+        )
+    )
+    assert result.plan.stage == PlanStage.INDEX_INTERSECTION
+    assert result.documents_examined == 1
+    assert result.documents_returned == 1
+
+    # Or needs every branch to be indexed.
+    result = await collection.explain(
+        Or(
+            expressions=[
+                Comparison(path="id", op="$eq", value="d1"),
+                Comparison(path="name", op="$eq", value="n2"),
+            ]
+        )
+    )
+    assert result.plan.stage == PlanStage.INDEX_UNION
+    assert result.documents_examined == 11
+    result = await collection.explain(
+        Or(
+            expressions=[
+                Comparison(path="id", op="$eq", value="d1"),
+                Comparison(path="version", op="$eq", value="1.0"),
+            ]
+        )
+    )
+    assert result.plan.stage == PlanStage.FULL_SCAN
+
+    # Sorting on an ordered index walks it, and stops once the page is complete.
+    result = await collection.explain(
+        filters=None, sort=[("value", SortingOrder.DESC)], limit=3, offset=2
+    )
+    assert result.plan == QueryPlan(stage=PlanStage.INDEX_SCAN, index=("value",))
+    assert result.documents_examined == 5
+    assert result.documents_returned == 3
+
+
+@pytest.mark.asyncio
+async def test_covered_queries(collection: DocumentCollection[SimpleDocument]) -> None:
+    await collection.create_index(("name", "value"))
+    docs = [
+        SimpleDocument(id=DocumentID(f"d{i}"), version=DocumentVersion("1.0"), name=n, value=v)
+        for i, (n, v) in enumerate([("a", 2), ("b", 0), ("a", 0), ("b", 1), ("a", 1)])
+    ]
+    for doc in docs:
+        await collection.insert_one(doc)
+    projection = {"_id": Projection.EXCLUDE, "value": Projection.INCLUDE}
+    name_is_a = Comparison(path="name", op="$eq", value="a")
+
+    # Every projected field is in the index, which alone tells which documents match.
+    found = await collection.find(name_is_a, projection=projection)
+    assert found == [{"value": 2}, {"value": 0}, {"value": 1}]
+    result = await collection.explain(name_is_a, projection=projection)
+    assert result.plan == QueryPlan(
+        stage=PlanStage.INDEX_SEEK, index=("name", "value"), covered=True
+    )
+    assert result.documents_examined == 0
+    assert result.documents_returned == 3
+
+    # Without filters, the index holds every document.
+    sort = [("value", SortingOrder.DESC)]
+    projection = {
+        "_id": Projection.EXCLUDE,
+        "value": Projection.INCLUDE,
+        "name": Projection.INCLUDE,
+    }
+    found = await collection.find(None, projection=projection, sort=sort, limit=2)
+    assert found == [{"value": 2, "name": "a"}, {"value": 1, "name": "b"}]
+    assert [doc async for doc in collection.find_iter(projection=projection, sort=sort)] == [
+        {"value": doc["value"], "name": doc["name"]}
+        for doc in sorted(docs, key=lambda doc: -doc["value"])
+    ]
+    result = await collection.explain(projection=projection)
+    assert result.plan.covered and result.documents_examined == 0
+
+    # Fields outside the index (_id included, unless excluded) have to be read from documents.
+    for projection in [{"value": Projection.INCLUDE}, {"id": Projection.INCLUDE}]:
+        result = await collection.explain(name_is_a, projection=projection)
+        assert not result.plan.covered and result.documents_examined == 3
+    assert await collection.find(name_is_a, projection={"id": Projection.INCLUDE}) == [
+        {"id": "d0"},
+        {"id": "d2"},
+        {"id": "d4"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_find_top_k(collection: DocumentCollection[SimpleDocument]) -> None:
+    docs = [
+        SimpleDocument(id=DocumentID(str(i)), version=DocumentVersion("1.0"), name=n, value=v)
+        for i, (n, v) in enumerate(
+            [("a", 3), ("b", 1), ("c", 3), ("d", 2), ("e", 1), ("f", 3), ("g", 2)]
+        )
+    ]
+    for doc in docs:
+        await collection.insert_one(doc)
+
+    def expected(
+        sort: List[tuple[str, SortingOrder]], offset: int = 0, limit: int = 100
+    ) -> List[SimpleDocument]:
+        result = list(docs)
+        for field, order in reversed(sort):
+            result.sort(key=lambda d: d[field], reverse=order == SortingOrder.DESC)  # type: ignore
+        return result[offset : offset + limit]
+
+    sorts: List[List[tuple[str, SortingOrder]]] = [
+        [("value", SortingOrder.ASC)],
+        [("value", SortingOrder.DESC)],
+        [("value", SortingOrder.DESC), ("name", SortingOrder.DESC)],
+        [("value", SortingOrder.ASC), ("name", SortingOrder.DESC)],
+        [("value", SortingOrder.DESC), ("name", SortingOrder.ASC)],
+    ]
+    for sort in sorts:
+        for offset, limit in [(0, 1), (0, 3), (2, 3), (5, 10)]:
+            found = await collection.find(filters=None, sort=sort, offset=offset, limit=limit)
+            assert found == expected(sort, offset, limit), (sort, offset, limit)
+
+    # Sorting never reorders the stored documents.
+    assert await collection.find(filters=None) == docs
+
+
+async def test_sorted_pages_match_the_full_sort(
+    collection: DocumentCollection[SimpleDocument],
+) -> None:
+    await collection.insert_many(
+        [
+            SimpleDocument(
+                id=DocumentID(f"d{i}"), version=DocumentVersion("1.0"), name="x", value=i % 2
+            )
+            for i in range(17)
+        ]
+    )
+    sorts: List[List[tuple[str, SortingOrder]]] = [
+        [("value", SortingOrder.DESC), ("name", SortingOrder.ASC)],
+        [("value", SortingOrder.ASC), ("value", SortingOrder.DESC)],
+    ]
+    for sort in sorts:
+        # Documents that compare equal keep their order on every page.
+        full = await collection.find(filters=None, sort=sort)
+        for offset, limit in [(0, 5), (2, 10), (7, 3)]:
+            page = await collection.find(filters=None, sort=sort, offset=offset, limit=limit)
+            assert page == full[offset : offset + limit], (sort, offset, limit)
+
+
+@pytest.mark.asyncio
+async def test_find_iter(collection: DocumentCollection[SimpleDocument]) -> None:
+    docs = [
+        SimpleDocument(id=DocumentID(str(i)), version=DocumentVersion("1.0"), name=f"n{i}", value=i)
+        for i in range(10)
+    ]
+    for doc in docs:
+        await collection.insert_one(doc)
+
+    assert [doc async for doc in collection.find_iter(batch_size=3)] == docs
+    assert [
+        doc
+        async for doc in collection.find_iter(
+            filters=Comparison(path="value", op="$gte", value=4),
+            sort=[("value", SortingOrder.DESC)],
+            offset=1,
+            limit=3,
+            batch_size=2,
+        )
+    ] == [docs[8], docs[7], docs[6]]
+    assert [
+        doc async for doc in collection.find_iter(projection={"name": Projection.INCLUDE}, limit=2)
+    ] == [{"name": "n0"}, {"name": "n1"}]
+
+    # Writes made between batches neither break the cursor nor show up in it.
+    seen = []
+    async for doc in collection.find_iter(batch_size=2):
+        seen.append(doc)
+        if doc["id"] == "1":
+            await collection.delete_one(Comparison(path="id", op="$eq", value="0"))
+            await collection.insert_one(
+                SimpleDocument(
+                    id=DocumentID("10"), version=DocumentVersion("1.0"), name="n10", value=10
+                )
+            )
+    assert seen == docs
+
+    with pytest.raises(ValueError):
+        async for _ in collection.find_iter(batch_size=0):
+            pass
+
+
+@pytest.mark.asyncio
+async def test_find_one_count_exists(collection: DocumentCollection[SimpleDocument]) -> None:
+    docs = [
+        SimpleDocument(
+            id=DocumentID(str(i)), version=DocumentVersion("1.0"), name=f"n{i % 3}", value=i
+        )
+        for i in range(9)
+    ]
+    for doc in docs:
+        await collection.insert_one(doc)
+    await collection.create_index("name")
+    await collection.create_index("value", ordered=True)
+
+    by_name = Comparison(path="name", op="$eq", value="n1")
+    assert await collection.find_one(by_name) == docs[1]
+    assert await collection.find_one(by_name, sort=[("value", SortingOrder.DESC)]) == docs[7]
+    assert await collection.find_one(by_name, projection={"name": Projection.INCLUDE}) == {
+        "name": "n1"
+    }
+    assert await collection.find_one(Comparison(path="name", op="$eq", value="x")) is None
+
+    filters: List[QueryFilter] = [
+        by_name,
+        Comparison(path="value", op="$gte", value=4),
+        And(expressions=[by_name, Comparison(path="value", op="$lt", value=5)]),
+        And(expressions=[by_name, Comparison(path="id", op="$ne", value="1")]),
+        Or(expressions=[by_name, Comparison(path="value", op="$in", value=[0, 8])]),
+        And(
+            expressions=[
+                Comparison(path="value", op="$gt", value=1),
+                Comparison(path="value", op="$lt", value="9"),
+            ]
+        ),
+        Comparison(path="name", op="$eq", value="x"),
+        # Repeated values, and values equal to each other, are counted once.
+        Comparison(path="name", op="$in", value=["n1", "n1"]),
+        Comparison(path="value", op="$in", value=[1, 1.0, True, 7, 7]),
+        # A nested branch seeking an index alone is not exact next to an unindexed one.
+        And(
+            expressions=[
+                And(expressions=[by_name]),
+                Or(expressions=[Comparison(path="id", op="$ne", value="1")]),
+            ]
+        ),
+    ]
+    for f in filters:
+        expected = await collection.find(f)
+        assert await collection.count(f) == len(expected), f
+        assert await collection.exists(f) == bool(expected), f
+    assert await collection.count() == 9
+    assert await collection.exists()
+
+
+@pytest.mark.asyncio
+async def test_bulk_writes(collection: DocumentCollection[SimpleDocument]) -> None:
+    await collection.create_index("id", unique=True)
+    await collection.create_index("value", ordered=True)
+    docs = [
+        SimpleDocument(
+            id=DocumentID(str(i)), version=DocumentVersion("1.0"), name=f"n{i % 2}", value=i
+        )
+        for i in range(6)
+    ]
+    result = await collection.insert_many(docs)
+    assert result.inserted_ids == [doc["id"] for doc in docs]
+    assert await collection.find(filters=None) == docs
+
+    # A duplicate, whether within the batch or with a stored document, rejects the whole batch.
+    for batch in (
+        [SimpleDocument(id=DocumentID("6"), version=DocumentVersion("1.0"), name="x", value=6)] * 2,
+        [
+            SimpleDocument(id=DocumentID("7"), version=DocumentVersion("1.0"), name="x", value=7),
+            SimpleDocument(id=DocumentID("0"), version=DocumentVersion("1.0"), name="x", value=8),
+        ],
+    ):
+        with pytest.raises(ValueError):
+            await collection.insert_many(batch)
+    assert await collection.count() == 6
+    assert await collection.count(Comparison(path="value", op="$gte", value=6)) == 0
+
+    odd = Comparison(path="name", op="$eq", value="n1")
+    update = await collection.update_many(odd, [{"op": "replace", "path": "/value", "value": 10}])
+    assert (update.matched_count, update.modified_count) == (3, 3)
+    found = await collection.find(Comparison(path="value", op="$eq", value=10))
+    assert [doc["id"] for doc in found] == ["1", "3", "5"]
+
+    # Updates that would collide on a unique index leave every document untouched.
+    with pytest.raises(ValueError):
+        await collection.update_many(odd, [{"op": "replace", "path": "/id", "value": "x"}])
+    assert await collection.count(Comparison(path="id", op="$in", value=["1", "3", "5"])) == 3
+
+    delete = await collection.delete_many(Comparison(path="value", op="$gte", value=2))
+    assert delete.deleted_count == 5
+    assert await collection.find(filters=None) == [docs[0]]
+    assert await collection.find_one(Comparison(path="value", op="$lt", value=2)) == docs[0]
+
+
+@pytest.mark.asyncio
+async def test_delete_keeps_order_and_indexes(
+    collection: DocumentCollection[SimpleDocument],
+) -> None:
+    await collection.create_index("id", unique=True)
+    await collection.create_index(("name", "value"))
+    docs = [
+        SimpleDocument(
+            id=DocumentID(str(i)), version=DocumentVersion("1.0"), name=f"n{i % 2}", value=i
+        )
+        for i in range(200)
+    ]
+    await collection.insert_many(docs)
+
+    cursor = collection.find_iter(batch_size=10)
+    first = [await anext(cursor) for _ in range(10)]
+
+    # Enough deletions to compact the collection along the way.
+    for i in range(0, 150, 2):
+        await collection.delete_one(Comparison(path="id", op="$eq", value=str(i)))
+    await collection.delete_many(Comparison(path="value", op="$lt", value=100))
+    remaining = [doc for doc in docs[100:] if doc["value"] >= 150 or doc["value"] % 2]
+
+    assert await collection.find(filters=None) == remaining
+    assert await collection.count() == len(remaining)
+    by_name = And(
+        expressions=[
+            Comparison(path="name", op="$eq", value="n0"),
+            Comparison(path="value", op="$gte", value=140),
+        ]
+    )
+    assert await collection.find(by_name) == [
+        doc for doc in remaining if doc["name"] == "n0" and doc["value"] >= 140
+    ]
+    assert await collection.find_one(Comparison(path="id", op="$eq", value="151")) == docs[151]
+
+    # The open cursor reads the collection as it was when it started, compaction included.
+    rest = [doc async for doc in cursor]
+    assert first == docs[:10]
+    assert rest == docs[10:]
+
+    await collection.insert_one(docs[0])
+    assert (await collection.find(filters=None))[-1] == docs[0]
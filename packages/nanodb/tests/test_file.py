@@ -0,0 +1,132 @@
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, TypedDict
+
+import pytest
+from flux0_nanodb.file import FileDocumentDatabase, FsyncPolicy
+from flux0_nanodb.query import Comparison
+from flux0_nanodb.types import DocumentID, DocumentVersion, PlanStage
+
+
+class EventDocument(TypedDict, total=False):
+    id: DocumentID
+    version: DocumentVersion
+    session_id: str
+    offset: int
+    data: dict[str, object]
+    created_at: datetime
+
+
+def make_event(i: int, session_id: str = "s1") -> EventDocument:
+    return EventDocument(
+        id=DocumentID(f"e{i}"),
+        version=DocumentVersion("0.0.1"),
+        session_id=session_id,
+        offset=i,
+        data={"text": f"token {i}", "tags": ["a"]},
+        created_at=datetime(2025, 1, 1, 12, 0, i % 60, tzinfo=timezone.utc),
+    )
+
+
+async def write_workload(db: FileDocumentDatabase) -> List[EventDocument]:
+    events = await db.create_collection("events", EventDocument)
+    await events.create_index("id", unique=True)
+    await events.create_index(("session_id", "offset"))
+    for i in range(100):
+        await events.insert_one(make_event(i))
+    await events.insert_many([make_event(i, "s2") for i in range(100, 110)])
+    await events.update_one(
+        Comparison(path="id", op="$eq", value="e4"),
+        [{"op": "replace", "path": "/data/text", "value": "edited"}],
+    )
+    await events.update_many(
+        Comparison(path="session_id", op="$eq", value="s2"),
+        [{"op": "add", "path": "/data/tags/-", "value": "b"}],
+    )
+    for i in range(0, 90, 3):
+        await events.delete_one(Comparison(path="id", op="$eq", value=f"e{i}"))
+    await events.delete_many(Comparison(path="offset", op="$gte", value=105))
+    scratch = await db.create_collection("scratch", EventDocument)
+    await scratch.insert_one(make_event(0))
+    await db.delete_collection("scratch")
+    return list(await events.find(filters=None))
+
+
+async def crash(db: FileDocumentDatabase, path: Path) -> Path:
+    """
+    Copy the files of an open database as a crash would leave them: without a final snapshot.
+    """
+    await db.sync()
+    crashed = path.parent / f"{path.name}-crashed"
+    shutil.copytree(path, crashed)
+    return crashed
+
+
+@pytest.mark.parametrize("fsync", list(FsyncPolicy))
+async def test_replay_log(tmp_path: Path, fsync: FsyncPolicy) -> None:
+    path = tmp_path / "db"
+    async with FileDocumentDatabase(path, fsync=fsync) as db:
+        expected = await write_workload(db)
+        crashed = await crash(db, path)
+
+    async with FileDocumentDatabase(crashed, fsync=fsync) as reopened:
+        events = await reopened.create_collection("events", EventDocument)
+        assert await events.find(filters=None) == expected
+        assert (await events.find(Comparison(path="id", op="$eq", value="e4")))[0]["data"] == {
+            "text": "edited",
+            "tags": ["a"],
+        }
+        # Indexes are restored too.
+        explained = await events.explain(Comparison(path="session_id", op="$eq", value="s2"))
+        assert explained.plan.stage == PlanStage.INDEX_SEEK
+        with pytest.raises(ValueError):
+            await events.insert_one(make_event(1))
+        with pytest.raises(ValueError):
+            await reopened.get_collection("scratch", EventDocument)
+
+    # Closing took a snapshot, so nothing is left to replay.
+    async with FileDocumentDatabase(path, fsync=fsync) as reopened:
+        assert all(p.stat().st_size == 0 for p in path.glob("wal-*.log"))
+        events = await reopened.create_collection("events", EventDocument)
+        assert await events.find(filters=None) == expected
+
+
+async def test_snapshot_truncates_log(tmp_path: Path) -> None:
+    path = tmp_path / "db"
+    async with FileDocumentDatabase(path) as db:
+        expected = await write_workload(db)
+        await db.snapshot()
+        assert (path / "snapshot.json").exists()
+        assert len(list(path.glob("wal-*.log"))) == 1
+        events = await db.get_collection("events", EventDocument)
+        await events.insert_one(make_event(200))
+        expected.append(make_event(200))
+        # The record written after the snapshot is only in the log.
+        crashed = await crash(db, path)
+
+    async with FileDocumentDatabase(crashed) as db:
+        events = await db.create_collection("events", EventDocument)
+        assert await events.find(filters=None) == expected
+
+
+async def test_torn_record_is_dropped(tmp_path: Path) -> None:
+    path = tmp_path / "db"
+    async with FileDocumentDatabase(path) as db:
+        events = await db.create_collection("events", EventDocument)
+        await events.insert_one(make_event(1))
+        await events.insert_one(make_event(2))
+        crashed = await crash(db, path)
+
+    segment = next(crashed.glob("wal-*.log"))
+    data = segment.read_bytes()
+    segment.write_bytes(data[: len(data) - 10])
+
+    async with FileDocumentDatabase(crashed) as db:
+        events = await db.create_collection("events", EventDocument)
+        assert await events.find(filters=None) == [make_event(1)]
+        await events.insert_one(make_event(3))
+
+    async with FileDocumentDatabase(crashed) as db:
+        events = await db.create_collection("events", EventDocument)
+        assert await events.find(filters=None) == [make_event(1), make_event(3)]
@@ -0,0 +1,48 @@
+from typing import Any, List, TypedDict
+
+from flux0_nanodb.memory import MemoryDocumentCollection, MemoryDocumentDatabase
+from flux0_nanodb.mvcc import ReadView
+from flux0_nanodb.query import Comparison
+from flux0_nanodb.types import DocumentID, DocumentVersion
+
+
+class Doc(TypedDict, total=False):
+    id: DocumentID
+    version: DocumentVersion
+    n: int
+
+
+def test_read_view() -> None:
+    slots: List[Any] = [{"n": 0}, {"n": 1}, {"n": 2}]
+    view = ReadView(slots)
+    view.preserve(slots, [0, 1])
+    slots[0], slots[1] = {"n": 10}, None
+    view.preserve(slots, [0, 3])  # the first version is kept, later slots are not seen
+    slots[0] = {"n": 20}
+    slots.append({"n": 3})
+    assert list(view) == [{"n": 0}, {"n": 1}, {"n": 2}]
+    # Views of other slots are left alone.
+    view.preserve([{"n": 5}], [2])
+    assert view[2] == {"n": 2}
+
+
+async def test_cursors_read_a_point_in_time() -> None:
+    db = MemoryDocumentDatabase()
+    collection = await db.create_collection("docs", Doc)
+    await collection.create_index("n", ordered=True)
+    docs = [Doc(id=DocumentID(f"d{i}"), version=DocumentVersion("1"), n=i) for i in range(10)]
+    await collection.insert_many(docs)
+
+    cursor = collection.find_iter(Comparison(path="n", op="$gte", value=2), batch_size=2)
+    assert [await anext(cursor) for _ in range(2)] == docs[2:4]
+    # Writers go ahead while the cursor is open, without it seeing their writes.
+    await collection.update_many(
+        Comparison(path="n", op="$gte", value=0), [{"op": "replace", "path": "/n", "value": -1}]
+    )
+    await collection.delete_one(Comparison(path="id", op="$eq", value="d5"))
+    await collection.insert_one(Doc(id=DocumentID("d10"), version=DocumentVersion("1"), n=10))
+    assert [doc async for doc in cursor] == docs[4:]
+
+    assert isinstance(collection, MemoryDocumentCollection)
+    assert len(collection._views) == 0
+    assert await collection.count(Comparison(path="n", op="$eq", value=-1)) == 9
@@ -0,0 +1,217 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Sequence, TypedDict
+
+import pytest
+from flux0_nanodb import memory, partition
+from flux0_nanodb.api import DocumentCollection
+from flux0_nanodb.memory import MemoryDocumentDatabase
+from flux0_nanodb.partition import PartitionedDocumentCollection
+from flux0_nanodb.query import And, Comparison, Or
+from flux0_nanodb.types import DocumentID, DocumentVersion, PlanStage, SortingOrder
+
+
+class Event(TypedDict, total=False):
+    id: DocumentID
+    version: DocumentVersion
+    session_id: str
+    offset: int
+
+
+def make_event(session: int, offset: int) -> Event:
+    return Event(
+        id=DocumentID(f"e{session}-{offset}"),
+        version=DocumentVersion("1"),
+        session_id=f"s{session}",
+        offset=offset,
+    )
+
+
+EVENTS = [make_event(session, offset) for offset in range(4) for session in range(10)]
+
+
+@pytest.fixture
+async def events() -> DocumentCollection[Event]:
+    db = MemoryDocumentDatabase()
+    collection = await db.create_collection("events", Event, partition_key="session_id")
+    await collection.create_index("id")
+    await collection.insert_many(EVENTS)
+    return collection
+
+
+def ids(docs: Sequence[Event]) -> List[str]:
+    return [doc["id"] for doc in docs]
+
+
+async def test_pinned_queries_read_their_partitions(events: DocumentCollection[Event]) -> None:
+    pinned = And(
+        expressions=[
+            Comparison(path="session_id", op="$eq", value="s3"),
+            Comparison(path="offset", op="$gte", value=1),
+        ]
+    )
+    assert ids(await events.find(pinned)) == ["e3-1", "e3-2", "e3-3"]
+    result = await events.explain(pinned)
+    assert result.plan.stage == PlanStage.PARTITIONS
+    assert len(result.plan.children) == 1
+    assert result.documents_examined == 4
+
+    either = Or(
+        expressions=[
+            Comparison(path="session_id", op="$eq", value="s1"),
+            Comparison(path="session_id", op="$in", value=["s2", "s404"]),
+        ]
+    )
+    assert await events.count(either) == 8
+    assert len((await events.explain(either)).plan.children) == 2
+
+    # Other queries read every partition.
+    assert ids(await events.find(Comparison(path="id", op="$eq", value="e7-2"))) == ["e7-2"]
+    assert (
+        len((await events.explain(Comparison(path="offset", op="$eq", value=0))).plan.children)
+        == 10
+    )
+
+
+async def test_unpinned_queries_merge_partitions(events: DocumentCollection[Event]) -> None:
+    assert sorted(ids(await events.find(None))) == sorted(ids(EVENTS))
+    sort = [("offset", SortingOrder.DESC)]
+    page = await events.find(None, sort=sort, limit=5, offset=8)
+    assert [doc["offset"] for doc in page] == [3, 3, 2, 2, 2]
+    cursor = [
+        doc async for doc in events.find_iter(None, sort=sort, limit=5, offset=8, batch_size=2)
+    ]
+    assert cursor == page
+    assert len([doc async for doc in events.find_iter(None, offset=35)]) == 5
+
+
+async def test_partition_scans_on_executor(
+    events: DocumentCollection[Event], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(partition, "PARALLEL_THRESHOLD", 5)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        db = MemoryDocumentDatabase(executor=executor)
+        threaded = await db.create_collection("events", Event, partition_key="session_id")
+        # Only the first partition is large enough for the executor.
+        await threaded.insert_many(EVENTS + [make_event(0, 4)])
+        await events.insert_one(make_event(0, 4))
+        sort = [("offset", SortingOrder.DESC), ("session_id", SortingOrder.ASC)]
+        assert await threaded.find(None, sort=sort) == await events.find(None, sort=sort)
+        assert sorted(ids(await threaded.find(None))) == sorted(ids(await events.find(None)))
+
+
+async def test_writes(events: DocumentCollection[Event]) -> None:
+    s1 = Comparison(path="session_id", op="$eq", value="s1")
+    result = await events.update_many(s1, [{"op": "replace", "path": "/offset", "value": 9}])
+    assert result.matched_count == 4
+    assert await events.count(Comparison(path="offset", op="$eq", value=9)) == 4
+
+    with pytest.raises(ValueError, match="partition key"):
+        await events.update_one(s1, [{"op": "replace", "path": "/session_id", "value": "s2"}])
+    upserted = await events.update_one(
+        Comparison(path="id", op="$eq", value="new"),
+        [
+            {"op": "add", "path": "/id", "value": "new"},
+            {"op": "add", "path": "/session_id", "value": "s42"},
+        ],
+        upsert=True,
+    )
+    assert upserted.upserted_id == "new"
+    assert await events.count(Comparison(path="session_id", op="$eq", value="s42")) == 1
+
+    with pytest.raises(ValueError, match="partition key"):
+        await events.insert_one(Event(id=DocumentID("orphan")))
+
+    # Emptied partitions are dropped.
+    assert isinstance(events, PartitionedDocumentCollection)
+    assert (
+        await events.delete_many(Comparison(path="session_id", op="$in", value=["s1", "s42"]))
+    ).deleted_count == 5
+    assert len(events._partitions) == 9
+    assert await events.find(s1) == []
+
+
+async def test_unique_indexes(events: DocumentCollection[Event]) -> None:
+    with pytest.raises(ValueError, match="partition key"):
+        await events.create_index("offset", unique=True, ordered=True)
+    with pytest.raises(ValueError, match="Duplicate"):
+        await events.create_index("offset", unique=True)
+    await events.create_index(("session_id", "offset"), unique=True)
+
+    # Writes spanning several partitions apply in full or not at all.
+    with pytest.raises(ValueError):
+        await events.insert_many([make_event(20, 0), make_event(1, 0)])
+    assert await events.count(None) == len(EVENTS)
+    with pytest.raises(ValueError):
+        await events.update_many(
+            Or(
+                expressions=[
+                    Comparison(path="id", op="$eq", value="e0-0"),
+                    Comparison(path="id", op="$in", value=["e5-0", "e5-1"]),
+                ]
+            ),
+            [{"op": "replace", "path": "/offset", "value": 7}],
+        )
+    assert await events.count(Comparison(path="offset", op="$eq", value=7)) == 0
+
+    # Partitions created later get the indexes too.
+    await events.insert_one(make_event(30, 0))
+    with pytest.raises(ValueError):
+        await events.insert_one(make_event(30, 0))
+
+
+async def test_indexes_unique_across_partitions(monkeypatch: pytest.MonkeyPatch) -> None:
+    db = MemoryDocumentDatabase()
+    events = await db.create_collection("events", Event, partition_key="session_id")
+    await events.insert_many(EVENTS[:20])
+    await events.create_index("id", unique=True)
+    await events.insert_many(EVENTS[20:])
+
+    # Documents are found in the partition holding their value, without reading the others.
+    result = await events.explain(Comparison(path="id", op="$eq", value="e3-2"))
+    assert len(result.plan.children) == 1 and result.documents_examined == 1
+    result = await events.explain(Comparison(path="id", op="$in", value=["e3-2", "e4-0", "x"]))
+    assert len(result.plan.children) == 2 and result.documents_returned == 2
+    assert await events.find(Comparison(path="id", op="$eq", value="x")) == []
+    assert (await events.delete_one(Comparison(path="id", op="$eq", value="e3-2"))).deleted_count
+
+    # Values are unique across partitions, and free again once deleted.
+    duplicate = Event(id=DocumentID("e3-3"), version=DocumentVersion("1"), session_id="s7")
+    with pytest.raises(ValueError, match="Duplicate"):
+        await events.insert_one(duplicate)
+    with pytest.raises(ValueError, match="Duplicate"):
+        await events.insert_many([make_event(42, 0), duplicate])
+    with pytest.raises(ValueError, match="Duplicate"):
+        await events.update_one(
+            Comparison(path="id", op="$eq", value="e7-0"),
+            [{"op": "replace", "path": "/id", "value": "e3-3"}],
+        )
+    assert await events.count(None) == len(EVENTS) - 1
+    await events.delete_many(Comparison(path="session_id", op="$eq", value="s3"))
+    await events.insert_one(duplicate)
+    assert ids(await events.find(Comparison(path="id", op="$eq", value="e3-3"))) == ["e3-3"]
+    # Updates move values between documents.
+    await events.update_one(
+        Comparison(path="id", op="$eq", value="e7-0"),
+        [{"op": "replace", "path": "/id", "value": "renamed"}],
+    )
+    assert ids(await events.find(Comparison(path="id", op="$eq", value="renamed"))) == ["renamed"]
+    assert await events.find(Comparison(path="id", op="$eq", value="e7-0")) == []
+
+    # Compacting a partition indexes its documents again.
+    monkeypatch.setattr(memory, "COMPACTION_THRESHOLD", 1)
+    await events.delete_many(Comparison(path="id", op="$in", value=["e5-0", "e5-1", "e5-2"]))
+    assert ids(await events.find(Comparison(path="id", op="$eq", value="e5-3"))) == ["e5-3"]
+    await events.insert_one(make_event(5, 0))
+
+
+async def test_watch_spans_partitions(events: DocumentCollection[Event]) -> None:
+    stream = events.watch()
+    await events.insert_many([make_event(50, 0), make_event(51, 0)])
+    await events.delete_one(Comparison(path="id", op="$eq", value="e2-2"))
+    changes = [await anext(stream) for _ in range(3)]
+    assert [(change.operation, change.document_id) for change in changes] == [
+        ("insert", "e50-0"),
+        ("insert", "e51-0"),
+        ("delete", "e2-2"),
+    ]
+    assert [change.sequence for change in changes] == sorted({c.sequence for c in changes})
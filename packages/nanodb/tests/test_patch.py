@@ -0,0 +1,99 @@
+import copy
+from typing import Any, Dict, List
+
+import jsonpatch
+import pytest
+from flux0_nanodb.common import convert_patch
+from flux0_nanodb.patch import apply_patch
+from flux0_nanodb.types import JSONPatchOperation
+
+
+def make_doc() -> Dict[str, Any]:
+    return {
+        "id": "1",
+        "title": "Session",
+        "offsets": {"client": 0},
+        "metadata": {"tags": ["a", "b"], "nested": {"x/y": 1, "m~n": 2}},
+        "events": [{"n": 1}, {"n": 2}],
+    }
+
+
+@pytest.mark.parametrize(
+    "patch",
+    [
+        [{"op": "replace", "path": "/title", "value": "Renamed"}],
+        [{"op": "replace", "path": "/offsets/client", "value": 5}],
+        [{"op": "add", "path": "/offsets/agent", "value": 1}],
+        [{"op": "add", "path": "/metadata/tags/-", "value": "c"}],
+        [{"op": "add", "path": "/metadata/tags/0", "value": "z"}],
+        [{"op": "add", "path": "/metadata/tags/2", "value": "z"}],
+        [{"op": "remove", "path": "/metadata/tags/1"}],
+        [{"op": "remove", "path": "/title"}],
+        [{"op": "replace", "path": "/metadata/nested/x~1y", "value": 3}],
+        [{"op": "remove", "path": "/metadata/nested/m~0n"}],
+        [{"op": "replace", "path": "/events/1/n", "value": 3}],
+        [
+            {"op": "test", "path": "/offsets/client", "value": 0},
+            {"op": "replace", "path": "/offsets/client", "value": 1},
+            {"op": "replace", "path": "/offsets/client", "value": 2},
+        ],
+        [
+            {"op": "add", "path": "/extra", "value": {"list": []}},
+            {"op": "add", "path": "/extra/list/-", "value": 1},
+        ],
+        [{"op": "move", "from_": "/title", "path": "/name"}],
+        [{"op": "copy", "from_": "/offsets", "path": "/copied"}],
+    ],
+)
+def test_apply_patch_matches_jsonpatch(patch: List[JSONPatchOperation]) -> None:
+    doc = make_doc()
+    original = copy.deepcopy(doc)
+    expected = jsonpatch.apply_patch(doc, convert_patch(patch), in_place=False)
+    assert apply_patch(doc, patch) == expected
+    assert doc == original
+
+
+@pytest.mark.parametrize(
+    "patch",
+    [
+        [{"op": "replace", "path": "/missing", "value": 1}],
+        [{"op": "remove", "path": "/missing"}],
+        [{"op": "add", "path": "/missing/child", "value": 1}],
+        [{"op": "add", "path": "/metadata/tags/3", "value": "c"}],
+        [{"op": "remove", "path": "/metadata/tags/01"}],
+        [{"op": "replace", "path": "/title/child", "value": 1}],
+        [{"op": "replace", "path": "title", "value": 1}],
+        [{"op": "test", "path": "/offsets/client", "value": 1}],
+        [{"op": "move", "from_": "/missing", "path": "/name"}],
+        [
+            {"op": "replace", "path": "/title", "value": "Renamed"},
+            {"op": "remove", "path": "/missing"},
+        ],
+    ],
+)
+def test_apply_patch_invalid(patch: List[JSONPatchOperation]) -> None:
+    doc = make_doc()
+    original = copy.deepcopy(doc)
+    with pytest.raises(ValueError):
+        apply_patch(doc, patch)
+    assert doc == original
+
+
+def test_apply_patch_copies_only_modified_path() -> None:
+    doc = make_doc()
+    added: Dict[str, List[int]] = {"list": []}
+    patched = apply_patch(
+        doc,
+        [
+            {"op": "replace", "path": "/offsets/client", "value": 7},
+            {"op": "add", "path": "/added", "value": added},
+            {"op": "add", "path": "/added/list/-", "value": 1},
+        ],
+    )
+    assert patched is not doc and patched["offsets"] is not doc["offsets"]
+    # Untouched members are shared with the original document.
+    assert patched["metadata"] is doc["metadata"]
+    assert patched["events"] is doc["events"]
+    # Values taken from the patch are never modified in place either.
+    assert added == {"list": []}
+    assert patched["added"] == {"list": [1]}
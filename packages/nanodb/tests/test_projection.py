@@ -1,7 +1,12 @@
 from typing import Any, Dict, Mapping
 
 import pytest
-from flux0_nanodb.projection import Projection, apply_projection
+from flux0_nanodb.projection import (
+    Projection,
+    apply_projection,
+    compile_projection,
+    projected_fields,
+)
 
 
 def test_inclusion_projection() -> None:
@@ -41,6 +46,8 @@ def test_exclusion_projection() -> None:
         "address": {"city": "Wonderland"},
     }
     assert projected == expected
+    # Nested documents are copied rather than modified.
+    assert doc["address"] == {"city": "Wonderland", "zip": "12345"}
 
 
 def test_mix_projection_error() -> None:
@@ -48,3 +55,27 @@ def test_mix_projection_error() -> None:
     proj: Mapping[str, Projection] = {"a": Projection.INCLUDE, "b": Projection.EXCLUDE}
     with pytest.raises(ValueError):
         apply_projection(doc, proj)
+
+
+def test_compiled_projection() -> None:
+    docs: list[Mapping[str, Any]] = [
+        {"_id": i, "name": f"n{i}", "address": {"city": f"c{i}", "zip": "1"}} for i in range(3)
+    ]
+    include = compile_projection({"address.city": Projection.INCLUDE, "name": Projection.INCLUDE})
+    assert [include(doc) for doc in docs] == [
+        {"_id": i, "address": {"city": f"c{i}"}, "name": f"n{i}"} for i in range(3)
+    ]
+    exclude = compile_projection({"_id": Projection.EXCLUDE, "address.zip": Projection.EXCLUDE})
+    assert exclude(docs[0]) == {"name": "n0", "address": {"city": "c0"}}
+    assert docs[0]["address"] == {"city": "c0", "zip": "1"}
+
+
+def test_projected_fields() -> None:
+    assert projected_fields({"a": Projection.INCLUDE, "b.c": Projection.INCLUDE}) == frozenset(
+        {"_id", "a", "b.c"}
+    )
+    assert projected_fields({"_id": Projection.EXCLUDE, "a": Projection.INCLUDE}) == frozenset(
+        {"a"}
+    )
+    assert projected_fields({"a": Projection.EXCLUDE}) is None
+    assert projected_fields({}) is None
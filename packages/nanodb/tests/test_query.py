@@ -1,3 +1,4 @@
+from datetime import datetime, timedelta, timezone
 from typing import Any, Mapping
 
 import pytest
@@ -6,6 +7,7 @@ from flux0_nanodb.query import (
     Comparison,
     Or,
     QueryFilter,
+    compile_query,
     matches_query,
 )
 
@@ -174,3 +176,52 @@ def test_invalid_query_filter_type() -> None:
     # Passing a type that is not a valid QueryFilter should raise a TypeError.
     with pytest.raises(TypeError):
         matches_query(42, {"dummy": "data"})  # type: ignore
+
+
+def test_comparison_datetime() -> None:
+    now = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    candidate: Mapping[str, Any] = {"created_at": now}
+    assert matches_query(Comparison(path="created_at", op="$eq", value=now), candidate)
+    assert matches_query(
+        Comparison(path="created_at", op="$gt", value=now - timedelta(seconds=1)), candidate
+    )
+    assert not matches_query(Comparison(path="created_at", op="$lt", value=now), candidate)
+    # Naive and aware datetimes, or datetimes and numbers, are never ordered.
+    assert not matches_query(
+        Comparison(path="created_at", op="$lt", value=datetime(2030, 1, 1)), candidate
+    )
+    assert not matches_query(Comparison(path="created_at", op="$gt", value=0), candidate)
+
+
+def test_compile_query_is_cached() -> None:
+    query: QueryFilter = And(
+        expressions=[
+            Comparison(path="type", op="$in", value=["message", "status"]),
+            Comparison(path="offset", op="$gte", value=2),
+        ]
+    )
+    same: QueryFilter = And(
+        expressions=[
+            Comparison(path="type", op="$in", value=["message", "status"]),
+            Comparison(path="offset", op="$gte", value=2),
+        ]
+    )
+    match = compile_query(query)
+    assert compile_query(same) is match
+    assert match({"type": "status", "offset": 2})
+    assert not match({"type": "tool", "offset": 2})
+    assert not match({"type": "status", "offset": 1})
+    # Values of different types get distinct matchers.
+    assert compile_query(Comparison(path="a", op="$eq", value=1)) is not compile_query(
+        Comparison(path="a", op="$eq", value=True)
+    )
+
+
+def test_compile_query_validates_once() -> None:
+    with pytest.raises(TypeError):
+        compile_query(Comparison(path="age", op="$in", value=30))
+    # Filters holding unhashable values still compile.
+    tags: Any = [["a"], "b"]
+    match = compile_query(Comparison(path="tags", op="$in", value=tags))
+    assert match({"tags": "b"})
+    assert not match({"tags": ["a"]})
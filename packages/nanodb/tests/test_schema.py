@@ -0,0 +1,89 @@
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional, TypedDict
+
+import pytest
+from flux0_nanodb.common import validate_is_total
+from flux0_nanodb.schema import compile_deserializer, compile_schema, compile_serializer
+from flux0_nanodb.types import DocumentID, DocumentVersion
+
+
+class TotalDocument(TypedDict):
+    id: DocumentID
+    version: DocumentVersion
+    name: str
+    email: Optional[str]
+    created_at: datetime
+
+
+# Documents built by serializers have to be valid nanodb documents, whose fields may be missing.
+class UserDocument(TypedDict, total=False):
+    id: DocumentID
+    version: DocumentVersion
+    name: str
+    email: Optional[str]
+    created_at: datetime
+
+
+class PartialDocument(TypedDict, total=False):
+    id: DocumentID
+    name: str
+
+
+@dataclass(frozen=True)
+class User:
+    id: str
+    name: str
+    email: Optional[str]
+    created_at: datetime
+
+
+def test_compile_schema() -> None:
+    compiled = compile_schema(TotalDocument)
+    assert compile_schema(TotalDocument) is compiled
+    assert compiled.fields == ("id", "version", "name", "email", "created_at")
+    assert compiled.required == set(compiled.fields)
+    assert compiled.nullable == {"email"}
+    assert compile_schema(PartialDocument).required == set()
+
+
+def test_validate() -> None:
+    document = {
+        "id": "1",
+        "version": "1",
+        "name": "Alice",
+        "email": None,
+        "created_at": datetime.now(timezone.utc),
+    }
+    compile_schema(TotalDocument).validate(document)
+    del document["name"], document["email"]
+    with pytest.raises(TypeError, match=r"missing required keys: \['name', 'email'\]"):
+        validate_is_total(document, TotalDocument)
+    validate_is_total({}, PartialDocument)
+
+
+def test_serializer_round_trip() -> None:
+    user = User(id="u1", name="Alice", email=None, created_at=datetime.now(timezone.utc))
+    serialize = compile_serializer(UserDocument, User)
+    document = serialize(user, version=DocumentVersion("1"))
+    assert document == {
+        "id": "u1",
+        "version": "1",
+        "name": "Alice",
+        "email": None,
+        "created_at": user.created_at,
+    }
+    assert list(document) == list(compile_schema(UserDocument).fields)
+    with pytest.raises(TypeError):
+        serialize(user)
+
+    deserialize = compile_deserializer(TotalDocument, User)
+    assert deserialize(document) == user
+    del document["email"]  # nullable fields may be missing
+    assert deserialize(document) == user
+    del document["name"]
+    with pytest.raises(KeyError):
+        deserialize(document)
+
+    with pytest.raises(ValueError):
+        compile_deserializer(PartialDocument, User)
@@ -0,0 +1,205 @@
+import asyncio
+import io
+import os
+import pickle
+from datetime import datetime
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Optional, Required, Tuple, TypedDict
+from zoneinfo import ZoneInfo
+
+import pytest
+from flux0_nanodb.memory import MemoryDocumentDatabase
+from flux0_nanodb.query import Comparison
+from flux0_nanodb.shared import DatabaseServer, RemoteDocumentDatabase, _Unpickler
+from flux0_nanodb.types import Accumulator, DocumentID, DocumentVersion, PlanStage, SortingOrder
+
+
+class Doc(TypedDict, total=False):
+    id: DocumentID
+    version: DocumentVersion
+    n: int
+    at: datetime
+
+
+class Strict(TypedDict, total=False):
+    id: DocumentID
+    version: DocumentVersion
+    n: Required[int]
+
+
+def make_doc(i: int) -> Doc:
+    return Doc(id=DocumentID(f"d{i}"), version=DocumentVersion("1"), n=i)
+
+
+@pytest.fixture
+async def clients(
+    tmp_path: Path,
+) -> AsyncIterator[Tuple[RemoteDocumentDatabase, RemoteDocumentDatabase]]:
+    path = tmp_path / "db.sock"
+    async with (
+        DatabaseServer(MemoryDocumentDatabase(), path),
+        RemoteDocumentDatabase(path) as first,
+        RemoteDocumentDatabase(path) as second,
+    ):
+        yield first, second
+
+
+async def test_clients_share_the_database(
+    clients: Tuple[RemoteDocumentDatabase, RemoteDocumentDatabase],
+) -> None:
+    first, second = clients
+    docs = await first.create_collection("docs", Doc)
+    await docs.create_index("id", unique=True)
+    await docs.insert_many([make_doc(i) for i in range(5)])
+
+    # Declaring the collection again, from another process, finds the same documents.
+    shared = await second.create_collection("docs", Doc)
+    assert await shared.count() == 5
+    page = await shared.find(
+        Comparison(path="n", op="$gte", value=1), sort=[("n", SortingOrder.DESC)], limit=2
+    )
+    assert [doc["id"] for doc in page] == ["d4", "d3"]
+    assert [doc["n"] async for doc in shared.find_iter(batch_size=2)] == [0, 1, 2, 3, 4]
+    assert await shared.aggregate(None, (), {"n": Accumulator("$max", "n")}) == [{"n": 4}]
+    explained = await shared.explain(Comparison(path="id", op="$eq", value="d2"))
+    assert explained.plan.stage == PlanStage.INDEX_SEEK
+
+    # Errors come back as they were raised.
+    with pytest.raises(ValueError):
+        await shared.insert_one(make_doc(1))
+    strict = await second.create_collection("strict", Strict)
+    with pytest.raises(TypeError, match="Strict"):
+        await strict.insert_one(Strict(id=DocumentID("x")))  # type: ignore[typeddict-item]
+    await first.delete_collection("strict")
+    with pytest.raises(ValueError):
+        await strict.count()
+
+
+async def test_requests_are_pipelined(
+    clients: Tuple[RemoteDocumentDatabase, RemoteDocumentDatabase],
+) -> None:
+    first, _ = clients
+    docs = await first.create_collection("docs", Doc)
+    results = await asyncio.gather(*(docs.insert_one(make_doc(i)) for i in range(50)))
+    assert [result.inserted_id for result in results] == [f"d{i}" for i in range(50)]
+    counts = await asyncio.gather(
+        *(docs.count(Comparison(path="n", op="$lt", value=i)) for i in range(50))
+    )
+    assert counts == list(range(50))
+
+
+async def test_slow_requests_hold_up_no_other(
+    clients: Tuple[RemoteDocumentDatabase, RemoteDocumentDatabase], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    first, _ = clients
+    docs = await first.create_collection("docs", Doc)
+    await docs.insert_one(make_doc(0))
+    finishing = asyncio.Event()
+    call = DatabaseServer._call
+
+    async def slow_finds(
+        self: DatabaseServer, target: Optional[str], method: str, arguments: Dict[str, Any]
+    ) -> Any:
+        if method == "find":
+            await finishing.wait()
+        return await call(self, target, method, arguments)
+
+    monkeypatch.setattr(DatabaseServer, "_call", slow_finds)
+    found = asyncio.ensure_future(docs.find(None))
+    # Later requests of the same client are answered meanwhile, in order.
+    await asyncio.wait_for(docs.insert_one(make_doc(1)), 1)
+    assert await asyncio.wait_for(docs.count(), 1) == 2
+    assert not found.done()
+    finishing.set()
+    assert len(await found) == 2
+
+
+async def test_watch(clients: Tuple[RemoteDocumentDatabase, RemoteDocumentDatabase]) -> None:
+    first, second = clients
+    docs = await first.create_collection("docs", Doc)
+    watched = await second.create_collection("docs", Doc)
+    stream = watched.watch(Comparison(path="n", op="$gte", value=1))
+    # Requests of a client are handled in order: the stream is open once this returns.
+    await watched.count()
+    await docs.insert_many([make_doc(i) for i in range(3)])
+    await docs.delete_one(Comparison(path="id", op="$eq", value="d2"))
+    events = [await asyncio.wait_for(anext(stream), 1) for _ in range(3)]
+    assert [(event.operation, event.document_id) for event in events] == [
+        ("insert", "d1"),
+        ("insert", "d2"),
+        ("delete", "d2"),
+    ]
+    stream.close()
+    with pytest.raises(StopAsyncIteration):
+        await anext(stream)
+
+    # A client sees the events of its own writes by the time they return.
+    own = docs.watch(buffer_size=2)
+    await docs.insert_one(make_doc(3))
+    assert (await anext(own)).document_id == "d3"
+    await docs.insert_many([make_doc(i) for i in range(4, 7)])
+    with pytest.raises(ValueError, match="fell more than 2 events behind"):
+        await anext(own)
+
+    with pytest.raises(ValueError, match="resume token"):
+        await anext(docs.watch(resume_after="unknown:1"))
+
+
+async def test_lost_connection(tmp_path: Path) -> None:
+    path = tmp_path / "db.sock"
+    client = RemoteDocumentDatabase(path)
+    async with DatabaseServer(MemoryDocumentDatabase(), path):
+        assert os.stat(path).st_mode & 0o777 == 0o600
+        await client.__aenter__()
+        docs = await client.create_collection("docs", Doc)
+        stream = docs.watch()
+        await docs.count()
+    with pytest.raises(ConnectionError):
+        await asyncio.wait_for(anext(stream), 1)
+    with pytest.raises(ConnectionError):
+        await docs.count()
+    await client.__aexit__(None, None, None)
+
+
+async def test_unexpected_messages_are_refused(tmp_path: Path) -> None:
+    path = tmp_path / "db.sock"
+    db = MemoryDocumentDatabase()
+    async with (
+        DatabaseServer(db, path),
+        RemoteDocumentDatabase(path) as client,
+    ):
+        reader, writer = await asyncio.open_unix_connection(path)
+        body = pickle.dumps((None, "create_collection", {"name": os.getcwd}))
+        writer.write(len(body).to_bytes(4, "big") + (7).to_bytes(8, "big") + body)
+        header = await asyncio.wait_for(reader.readexactly(12), 1)
+        assert int.from_bytes(header[4:], "big") == 7
+        kind, error = pickle.loads(await reader.readexactly(int.from_bytes(header[:4], "big")))
+        assert kind == "error" and "not allowed" in str(error)
+        writer.close()
+
+        # Requests and answers that cannot be decoded fail on their own, not the connection.
+        docs = await client.create_collection("docs", Doc)
+        stream = docs.watch()
+        zoned = datetime(2025, 1, 1, tzinfo=ZoneInfo("Europe/Paris"))
+        with pytest.raises(RuntimeError, match="not allowed"):
+            await docs.insert_one(Doc(id=DocumentID("d1"), version=DocumentVersion("1"), at=zoned))
+        served = await db.get_collection("docs", Doc)
+        await served.insert_one(Doc(id=DocumentID("d2"), version=DocumentVersion("1"), at=zoned))
+        with pytest.raises(RuntimeError, match="not allowed"):
+            await docs.find(None)
+        with pytest.raises(RuntimeError, match="not allowed"):
+            await asyncio.wait_for(anext(stream), 1)
+        assert await docs.count() == 1
+
+    # Classes are allowed by name, not by module: a dotted name would reach the modules they
+    # import.
+    def lookup(module: str, name: str) -> bytes:
+        strings = [text.encode() for text in (module, name)]
+        # Protocol 4 opcodes: PROTO, SHORT_BINUNICODE twice, STACK_GLOBAL and STOP.
+        body = b"".join(b"\x8c" + bytes([len(text)]) + text for text in strings)
+        return b"\x80\x04" + body + b"\x93."
+
+    with pytest.raises(pickle.UnpicklingError):
+        _Unpickler(io.BytesIO(lookup("flux0_nanodb.query", "datetime.now"))).load()
+    query = Comparison(path="n", op="$in", value=[1])
+    assert _Unpickler(io.BytesIO(pickle.dumps(query, protocol=5))).load() == query
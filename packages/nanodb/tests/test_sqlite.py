@@ -0,0 +1,205 @@
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, List, Optional, Tuple, TypedDict
+
+import pytest
+from flux0_nanodb.api import DocumentCollection
+from flux0_nanodb.memory import MemoryDocumentDatabase
+from flux0_nanodb.projection import Projection
+from flux0_nanodb.query import And, Comparison, Or, QueryFilter
+from flux0_nanodb.sqlite import SQLiteDocumentDatabase
+from flux0_nanodb.types import DocumentID, DocumentVersion, PlanStage, SortingOrder
+
+
+class Doc(TypedDict, total=False):
+    id: DocumentID
+    version: DocumentVersion
+    kind: Any
+    n: Any
+    meta: dict[str, Any]
+    created_at: datetime
+
+
+def make_docs() -> List[Doc]:
+    kinds: List[Any] = ["a", "b", "c", 1, True, None]
+    ns: List[Any] = [0, 1, 2.5, -3, "2", False, 1e300]
+    docs = []
+    for i in range(40):
+        doc = Doc(
+            id=DocumentID(f"d{i}"),
+            version=DocumentVersion("1"),
+            kind=kinds[i % len(kinds)],
+            meta={"rank": i % 5, "tags": ["x"] if i % 2 else []},
+            created_at=datetime(2025, 1, 1, i % 24, tzinfo=timezone.utc),
+        )
+        if i % 9:
+            doc["n"] = ns[i % len(ns)]
+        docs.append(doc)
+    return docs
+
+
+FILTERS: List[Optional[QueryFilter]] = [
+    None,
+    Comparison(path="kind", op="$eq", value="a"),
+    Comparison(path="kind", op="$ne", value="a"),
+    Comparison(path="kind", op="$eq", value=1),
+    Comparison(path="kind", op="$ne", value=None),  # type: ignore[arg-type]
+    Comparison(path="kind", op="$gt", value="a"),
+    Comparison(path="n", op="$gt", value=0),
+    Comparison(path="n", op="$lte", value=1),
+    Comparison(path="n", op="$ne", value=0),
+    Comparison(path="n", op="$eq", value=float("nan")),
+    Comparison(path="n", op="$in", value=[0, "2", 2.5]),
+    Comparison(path="n", op="$in", value=[]),
+    Comparison(path="meta.rank", op="$eq", value=3),
+    Comparison(path="created_at", op="$gte", value=datetime(2025, 1, 1, 12, tzinfo=timezone.utc)),
+    And(
+        expressions=[
+            Comparison(path="kind", op="$in", value=["a", "b"]),
+            Comparison(path="n", op="$gte", value=0),
+        ]
+    ),
+    Or(
+        expressions=[
+            Comparison(path="kind", op="$eq", value="c"),
+            Comparison(
+                path="created_at", op="$lt", value=datetime(2025, 1, 1, 3, tzinfo=timezone.utc)
+            ),
+        ]
+    ),
+    And(expressions=[]),
+    Or(expressions=[]),
+]
+
+
+@pytest.fixture
+async def collections(
+    tmp_path: Path,
+) -> AsyncIterator[Tuple[DocumentCollection[Doc], DocumentCollection[Doc]]]:
+    async with SQLiteDocumentDatabase(tmp_path / "db.sqlite3") as db:
+        sqlite = await db.create_collection("docs", Doc)
+        memory = await MemoryDocumentDatabase().create_collection("docs", Doc)
+        for collection in (sqlite, memory):
+            await collection.create_index("kind")
+            await collection.insert_many(make_docs())
+        yield sqlite, memory
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+async def test_matches_memory(
+    collections: Tuple[DocumentCollection[Doc], DocumentCollection[Doc]],
+    filters: Optional[QueryFilter],
+) -> None:
+    sqlite, memory = collections
+    assert await sqlite.find(filters) == await memory.find(filters)
+    assert await sqlite.count(filters) == await memory.count(filters)
+    assert await sqlite.exists(filters) == await memory.exists(filters)
+    assert [doc async for doc in sqlite.find_iter(filters, offset=2, limit=7, batch_size=3)] == [
+        doc async for doc in memory.find_iter(filters, offset=2, limit=7, batch_size=3)
+    ]
+    sort = [("meta.rank", SortingOrder.DESC), ("id", SortingOrder.ASC)]
+    for projection in (
+        None,
+        {"meta.rank": Projection.INCLUDE, "n": Projection.INCLUDE},
+        {"meta": Projection.EXCLUDE, "created_at": Projection.EXCLUDE},
+    ):
+        assert await sqlite.find(
+            filters, projection, limit=5, offset=1, sort=sort
+        ) == await memory.find(filters, projection, limit=5, offset=1, sort=sort)
+
+
+async def test_writes_match_memory(
+    collections: Tuple[DocumentCollection[Doc], DocumentCollection[Doc]],
+) -> None:
+    sqlite, memory = collections
+    n_positive = Comparison(path="n", op="$gt", value=0)
+    for collection in (sqlite, memory):
+        await collection.update_one(n_positive, [{"op": "replace", "path": "/kind", "value": "z"}])
+        await collection.update_many(
+            Comparison(path="kind", op="$eq", value="b"),
+            [{"op": "add", "path": "/meta/tags/-", "value": "y"}],
+        )
+        await collection.delete_one(Comparison(path="kind", op="$eq", value="c"))
+        await collection.delete_many(
+            Comparison(
+                path="created_at", op="$lt", value=datetime(2025, 1, 1, 2, tzinfo=timezone.utc)
+            )
+        )
+        await collection.delete_many(Comparison(path="meta.rank", op="$eq", value=4))
+    assert await sqlite.find(None) == await memory.find(None)
+
+    with pytest.raises(ValueError):
+        await sqlite.update_many(n_positive, [{"op": "remove", "path": "/missing"}])
+    assert await sqlite.find(None) == await memory.find(None)
+
+    result = await sqlite.update_one(
+        Comparison(path="id", op="$eq", value="new"),
+        [
+            {"op": "add", "path": "/id", "value": "new"},
+            {"op": "add", "path": "/kind", "value": "a"},
+        ],
+        upsert=True,
+    )
+    assert result.upserted_id == "new"
+    assert await sqlite.find_one(Comparison(path="id", op="$eq", value="new")) == {
+        "id": "new",
+        "kind": "a",
+    }
+
+
+async def test_indexes(tmp_path: Path) -> None:
+    path = tmp_path / "db.sqlite3"
+    async with SQLiteDocumentDatabase(path) as db:
+        docs = await db.create_collection("docs", Doc)
+        await docs.insert_many(make_docs())
+        await docs.create_index("id", unique=True)
+        await docs.create_index(("kind", "meta"))
+        with pytest.raises(ValueError):
+            await docs.create_index("kind", unique=True)
+        with pytest.raises(ValueError):
+            await docs.insert_one(Doc(id=DocumentID("d1"), version=DocumentVersion("1")))
+        with pytest.raises(ValueError):
+            await docs.insert_one(Doc(id=DocumentID("x"), n=float("nan")))
+
+        explained = await docs.explain(Comparison(path="id", op="$eq", value="d3"))
+        assert explained.plan.stage == PlanStage.INDEX_SEEK
+        assert explained.plan.index == ("id",)
+        assert explained.documents_examined == 1
+        explained = await docs.explain(sort=[("id", SortingOrder.ASC)], limit=3)
+        assert explained.plan.stage == PlanStage.INDEX_SCAN
+        explained = await docs.explain(
+            Or(
+                expressions=[
+                    Comparison(path="id", op="$eq", value="d3"),
+                    Comparison(path="kind", op="$eq", value="b"),
+                ]
+            )
+        )
+        assert explained.plan.stage == PlanStage.INDEX_UNION
+        explained = await docs.explain(Comparison(path="n", op="$eq", value=1))
+        assert explained.plan.stage == PlanStage.FULL_SCAN
+        # Indexes are told apart however their fields are named.
+        await docs.create_index(("kind", "n"))
+        await docs.create_index("kind_n")
+        explained = await docs.explain(Comparison(path="kind_n", op="$eq", value=1))
+        assert explained.plan.index == ("kind_n",)
+
+    # Collections and indexes are durable, and declaring them again is harmless.
+    async with SQLiteDocumentDatabase(path) as db:
+        docs = await db.create_collection("docs", Doc)
+        await docs.create_index("id", unique=True)
+        assert await docs.count() == 40
+        with pytest.raises(ValueError):
+            await docs.insert_one(Doc(id=DocumentID("d1"), version=DocumentVersion("1")))
+        await db.delete_collection("docs")
+        with pytest.raises(ValueError):
+            await db.get_collection("docs", Doc)
+
+
+async def test_partition_key_is_indexed(tmp_path: Path) -> None:
+    async with SQLiteDocumentDatabase(tmp_path / "db.sqlite3") as db:
+        docs = await db.create_collection("docs", Doc, partition_key="kind")
+        await docs.insert_many(make_docs())
+        explained = await docs.explain(Comparison(path="kind", op="$eq", value="a"))
+        assert explained.plan.stage == PlanStage.INDEX_SEEK
+        assert explained.plan.index == ("kind",)
@@ -0,0 +1,122 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import AsyncIterator, TypedDict
+
+import pytest
+from flux0_nanodb.api import DocumentDatabase
+from flux0_nanodb.memory import MemoryDocumentDatabase
+from flux0_nanodb.query import Comparison
+from flux0_nanodb.sqlite import SQLiteDocumentDatabase
+from flux0_nanodb.ttl import Cascade, ExpirySweeper, TTLIndex
+from flux0_nanodb.types import DocumentID, DocumentVersion
+
+EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+class Session(TypedDict, total=False):
+    id: DocumentID
+    version: DocumentVersion
+    mode: str
+    created_at: datetime
+
+
+class Event(TypedDict, total=False):
+    id: DocumentID
+    version: DocumentVersion
+    session_id: str
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = EPOCH
+
+    def __call__(self) -> datetime:
+        return self.now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+async def db(request: pytest.FixtureRequest, tmp_path: Path) -> AsyncIterator[DocumentDatabase]:
+    if request.param == "memory":
+        yield MemoryDocumentDatabase()
+    else:
+        async with SQLiteDocumentDatabase(tmp_path / "db.sqlite3") as db:
+            yield db
+
+
+async def populate(db: DocumentDatabase, count: int) -> TTLIndex:
+    sessions = await db.create_collection("sessions", Session)
+    events = await db.create_collection("events", Event)
+    await events.create_index("session_id")
+    await sessions.insert_many(
+        [
+            Session(
+                id=DocumentID(f"s{i}"),
+                version=DocumentVersion("1"),
+                mode="auto" if i % 2 else "manual",
+                created_at=EPOCH + timedelta(minutes=i),
+            )
+            for i in range(count)
+        ]
+    )
+    await events.insert_many(
+        [
+            Event(id=DocumentID(f"e{i}-{j}"), version=DocumentVersion("1"), session_id=f"s{i}")
+            for i in range(count)
+            for j in range(2)
+        ]
+    )
+    return TTLIndex(
+        sessions, "created_at", timedelta(hours=1), cascade=[Cascade(events, "session_id")]
+    )
+
+
+async def test_sweep(db: DocumentDatabase) -> None:
+    index = await populate(db, 25)
+    events = index.cascade[0].collection
+    clock = Clock()
+    sweeper = ExpirySweeper([index], batch_size=4, clock=clock)
+
+    assert await sweeper.sweep() == 0
+    # Sessions created more than an hour ago expire, in slices, with their events.
+    clock.now = EPOCH + timedelta(hours=1, minutes=10, seconds=30)
+    assert await sweeper.sweep() == 11 * 3
+    remaining = await index.collection.find(None)
+    assert [doc["id"] for doc in remaining] == [f"s{i}" for i in range(11, 25)]
+    assert len(await events.find(None)) == 14 * 2
+    assert await events.find(Comparison(path="session_id", op="$eq", value="s10")) == []
+
+    assert await sweeper.sweep() == 0
+
+
+async def test_sweep_filters(db: DocumentDatabase) -> None:
+    index = await populate(db, 10)
+    index = TTLIndex(
+        index.collection,
+        index.field,
+        index.expire_after,
+        filters=Comparison(path="mode", op="$eq", value="auto"),
+    )
+    clock = Clock()
+    clock.now = EPOCH + timedelta(days=1)
+    assert await ExpirySweeper([index], clock=clock).sweep() == 5
+    remaining = await index.collection.find(None)
+    assert all(doc["mode"] == "manual" for doc in remaining)
+
+
+async def test_sweeper_runs_in_background(db: DocumentDatabase) -> None:
+    index = await populate(db, 5)
+    clock = Clock()
+    clock.now = EPOCH + timedelta(days=1)
+    async with ExpirySweeper([index], interval=0.01, clock=clock):
+        for _ in range(100):
+            if not await index.collection.find(None):
+                break
+            await asyncio.sleep(0.01)
+    assert await index.collection.find(None) == []
+    assert await index.cascade[0].collection.find(None) == []
+
+
+def test_batch_size_must_be_positive() -> None:
+    with pytest.raises(ValueError):
+        ExpirySweeper([], batch_size=0)
@@ -0,0 +1,59 @@
+from typing import Any, Dict, TypedDict
+
+import pytest
+from flux0_nanodb.memory import MemoryDocumentDatabase
+from flux0_nanodb.projection import Projection
+from flux0_nanodb.query import Comparison
+from flux0_nanodb.types import DocumentID, DocumentVersion
+from flux0_nanodb.view import DocumentView, ListView
+
+
+class Doc(TypedDict, total=False):
+    id: DocumentID
+    version: DocumentVersion
+    data: Dict[str, Any]
+
+
+def test_document_view() -> None:
+    data = {"id": "1", "data": {"tags": ["a", {"b": 1}]}}
+    view = DocumentView(data)
+    assert view == data and data == view
+    assert isinstance(view["data"], DocumentView)
+    tags = view["data"]["tags"]
+    assert isinstance(tags, ListView) and tags == ["a", {"b": 1}]
+    assert isinstance(tags[1], DocumentView) and isinstance(tags[:1], ListView)
+    # Nested views are created once.
+    nested = view["data"]
+    assert nested is view.get("data") and nested["tags"] is tags
+    assert tags[-1] is tags[1]
+    assert view.get("missing") is None and "id" in view and len(view) == 2
+    with pytest.raises(TypeError):
+        view["id"] = "2"  # type: ignore[index]
+    with pytest.raises(TypeError):
+        view["data"]["tags"][0] = "z"
+    copied = view.copy()
+    copied["id"] = "2"
+    assert data["id"] == "1"
+
+
+async def test_read_only_collection() -> None:
+    collection = await MemoryDocumentDatabase(read_only=True).create_collection("docs", Doc)
+    await collection.insert_one(
+        Doc(id=DocumentID("1"), version=DocumentVersion("1"), data={"n": 1, "tags": ["a"]})
+    )
+    found = await collection.find_one(Comparison(path="id", op="$eq", value="1"))
+    assert isinstance(found, DocumentView)
+    with pytest.raises(TypeError):
+        found["data"]["n"] = 2
+
+    projected = await collection.find(None, projection={"data.tags": Projection.INCLUDE})
+    assert isinstance(projected[0], DocumentView)
+    assert [doc async for doc in collection.find_iter()] == [found]
+
+    # Views keep showing the document as it was read.
+    await collection.update_one(
+        Comparison(path="id", op="$eq", value="1"),
+        [{"op": "replace", "path": "/data/n", "value": 2}],
+    )
+    assert found["data"]["n"] == 1
+    assert (await collection.find(None))[0]["data"]["n"] == 2
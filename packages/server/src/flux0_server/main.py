@@ -1,11 +1,13 @@
 import asyncio
 import importlib
+import multiprocessing
 import os
+import socket
 import sys
 import traceback
 from contextlib import AsyncExitStack, asynccontextmanager
 from pathlib import Path
-from typing import AsyncIterator, Iterable
+from typing import AsyncIterator, Iterable, List, Optional
 
 import toml
 import uvicorn
@@ -23,7 +25,11 @@ from flux0_core.storage.nanodb_memory import (
 )
 from flux0_core.storage.types import StorageType
 from flux0_core.users import UserStore
+from flux0_nanodb.api import DocumentDatabase
+from flux0_nanodb.file import FileDocumentDatabase
 from flux0_nanodb.memory import MemoryDocumentDatabase
+from flux0_nanodb.shared import DatabaseServer, RemoteDocumentDatabase
+from flux0_nanodb.sqlite import SQLiteDocumentDatabase
 from flux0_stream.emitter.api import EventEmitter
 from flux0_stream.emitter.memory import MemoryEventEmitter
 from flux0_stream.store.memory import MemoryEventStore
@@ -49,9 +55,24 @@ class StartupError(Exception):
         super().__init__(message)
 
 
+async def open_database(settings: Settings, exit_stack: AsyncExitStack) -> DocumentDatabase:
+    if settings.stores_type == StorageType.NANODB_MEMORY:
+        return MemoryDocumentDatabase()
+    elif settings.stores_type == StorageType.NANODB_FILE:
+        return await exit_stack.enter_async_context(
+            FileDocumentDatabase(settings.nanodb_path, fsync=settings.nanodb_fsync)
+        )
+    elif settings.stores_type == StorageType.NANODB_SQLITE:
+        return await exit_stack.enter_async_context(
+            SQLiteDocumentDatabase(settings.nanodb_sqlite_path)
+        )
+    else:
+        raise StartupError(f"Unsupported storage type: {settings.stores_type}")
+
+
 @asynccontextmanager
 async def setup_container(
-    settings: Settings, exit_stack: AsyncExitStack
+    settings: Settings, exit_stack: AsyncExitStack, db: Optional[DocumentDatabase] = None
 ) -> AsyncIterator[Container]:
     c = Container()
 
@@ -59,35 +80,34 @@ async def setup_container(
     c[Logger] = LOGGER
     c[Logger].set_level(settings.log_level)
 
-    if settings.stores_type == StorageType.NANODB_MEMORY:
-        db = MemoryDocumentDatabase()
-        event_store = await exit_stack.enter_async_context(MemoryEventStore())
-        c[EventEmitter] = Singleton(
-            await exit_stack.enter_async_context(
-                MemoryEventEmitter(event_store=event_store, logger=LOGGER)
-            )
-        )
-        global BACKGROUND_TASK_SERVICE
-        BACKGROUND_TASK_SERVICE = await exit_stack.enter_async_context(
-            BackgroundTaskService(LOGGER)
-        )
-        user_store = await exit_stack.enter_async_context(UserDocumentStore(db))
-        agent_store = await exit_stack.enter_async_context(AgentDocumentStore(db))
-        session_store = await exit_stack.enter_async_context(SessionDocumentStore(db))
-        c[SessionService] = SessionService(
-            contextual_correlator=CORRELATOR,
-            logger=LOGGER,
-            agent_store=agent_store,
-            session_store=session_store,
-            background_task_service=BACKGROUND_TASK_SERVICE,
-            agent_runner_factory=ContainerAgentRunnerFactory(c),
-            event_emitter=c[EventEmitter],
+    if db is None:
+        db = await open_database(settings, exit_stack)
+
+    event_store = await exit_stack.enter_async_context(MemoryEventStore())
+    c[EventEmitter] = Singleton(
+        await exit_stack.enter_async_context(
+            MemoryEventEmitter(event_store=event_store, logger=LOGGER)
         )
-        c[UserStore] = user_store
-        c[AgentStore] = agent_store
-        c[SessionStore] = session_store
-    else:
-        raise StartupError(f"Unsupported storage type: {settings.stores_type}")
+    )
+    global BACKGROUND_TASK_SERVICE
+    BACKGROUND_TASK_SERVICE = await exit_stack.enter_async_context(BackgroundTaskService(LOGGER))
+    user_store = await exit_stack.enter_async_context(UserDocumentStore(db))
+    agent_store = await exit_stack.enter_async_context(AgentDocumentStore(db))
+    session_store = await exit_stack.enter_async_context(
+        SessionDocumentStore(db, session_ttl=settings.session_ttl)
+    )
+    c[SessionService] = SessionService(
+        contextual_correlator=CORRELATOR,
+        logger=LOGGER,
+        agent_store=agent_store,
+        session_store=session_store,
+        background_task_service=BACKGROUND_TASK_SERVICE,
+        agent_runner_factory=ContainerAgentRunnerFactory(c),
+        event_emitter=c[EventEmitter],
+    )
+    c[UserStore] = user_store
+    c[AgentStore] = agent_store
+    c[SessionStore] = session_store
 
     if settings.auth_type == AuthType.NOOP:
         c[AuthHandler] = NoopAuthHandler(user_store=c[UserStore])
@@ -128,6 +148,7 @@ async def load_modules(
 async def serve_app(
     app: ASGIApp,
     port: int,
+    sockets: Optional[List[socket.socket]] = None,
 ) -> None:
     config = uvicorn.Config(
         app,
@@ -140,7 +161,7 @@ async def serve_app(
 
     try:
         LOGGER.info("Server is ready")
-        await server.serve()
+        await server.serve(sockets=sockets)
         await asyncio.sleep(0)  # Ensures the cancellation error can be raised
     except (KeyboardInterrupt, asyncio.CancelledError):
         await BACKGROUND_TASK_SERVICE.cancel_all(reason="Server shutting down")
@@ -166,11 +187,13 @@ async def get_module_list_from_config() -> list[str]:
 
 
 @asynccontextmanager
-async def setup_app(settings: Settings) -> AsyncIterator[ASGIApp]:
+async def setup_app(
+    settings: Settings, db: Optional[DocumentDatabase] = None
+) -> AsyncIterator[ASGIApp]:
     exit_stack = AsyncExitStack()
 
     async with (
-        setup_container(settings, exit_stack) as container,
+        setup_container(settings, exit_stack, db) as container,
         exit_stack,
     ):
         modules = set(await get_module_list_from_config() + settings.modules)
@@ -183,6 +206,9 @@ async def setup_app(settings: Settings) -> AsyncIterator[ASGIApp]:
 
 async def start_server(settings: Settings) -> None:
     LOGGER.info(f"Flux0 server version {VERSION}")
+    if settings.workers > 1:
+        await serve_workers(settings)
+        return
     async with setup_app(settings) as app:
         await serve_app(
             app,
@@ -190,6 +216,59 @@ async def start_server(settings: Settings) -> None:
         )
 
 
+async def serve_workers(settings: Settings) -> None:
+    """
+    Serve the app from several worker processes accepting connections on a shared socket, so
+    that requests are handled on several cores. This process keeps the database and serves it
+    to the workers, each of which runs its own stores over it. Sessions expire from this process
+    alone.
+    """
+    async with AsyncExitStack() as exit_stack:
+        db = await open_database(settings, exit_stack)
+        await exit_stack.enter_async_context(DatabaseServer(db, settings.nanodb_socket_path))
+        if settings.session_ttl is not None:
+            # The store reaches the database through the server, as the stores of the workers
+            # do: the server hands out collections already declared, which the database itself
+            # would refuse to declare again.
+            remote = await exit_stack.enter_async_context(
+                RemoteDocumentDatabase(settings.nanodb_socket_path)
+            )
+            await exit_stack.enter_async_context(
+                SessionDocumentStore(remote, session_ttl=settings.session_ttl)
+            )
+        sock = socket.create_server(("0.0.0.0", settings.port))
+        exit_stack.callback(sock.close)
+        context = multiprocessing.get_context("spawn")
+        workers = [
+            context.Process(target=run_worker, args=(settings, sock), name=f"flux0-worker-{i}")
+            for i in range(settings.workers)
+        ]
+        for worker in workers:
+            worker.start()
+        LOGGER.info(f"Started {len(workers)} workers")
+        try:
+            await asyncio.gather(*(asyncio.to_thread(worker.join) for worker in workers))
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+            await asyncio.gather(*(asyncio.to_thread(worker.join) for worker in workers))
+
+
+def run_worker(settings: Settings, sock: socket.socket) -> None:
+    asyncio.run(start_worker(settings, sock))
+
+
+async def start_worker(settings: Settings, sock: socket.socket) -> None:
+    # Expired sessions are swept by the process serving the database, not by every worker.
+    worker_settings = settings.model_copy(update={"session_ttl": None})
+    async with (
+        RemoteDocumentDatabase(settings.nanodb_socket_path) as db,
+        setup_app(worker_settings, db) as app,
+    ):
+        await serve_app(app, settings.port, sockets=[sock])
+
+
 def main() -> None:
     asyncio.run(start_server(settings))
 
@@ -1,9 +1,12 @@
 import enum
-from typing import List, Union
+from datetime import timedelta
+from pathlib import Path
+from typing import List, Optional, Union
 
 from flux0_api.auth import AuthType
 from flux0_core.logging import LogLevel
 from flux0_core.storage.types import StorageType
+from flux0_nanodb.file import FsyncPolicy
 from pydantic import Field, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -22,6 +25,17 @@ class Settings(BaseSettings):
     auth_type: AuthType = Field(default_factory=lambda: AuthType.NOOP)
     log_level: LogLevel = Field(default_factory=lambda: LogLevel.INFO)
     stores_type: StorageType = Field(default_factory=lambda: StorageType.NANODB_MEMORY)
+    # Where and how durably the nanodb_file storage type keeps its data.
+    nanodb_path: Path = Field(default=Path("data/nanodb"))
+    nanodb_fsync: FsyncPolicy = Field(default=FsyncPolicy.GROUP)
+    # The database file of the nanodb_sqlite storage type.
+    nanodb_sqlite_path: Path = Field(default=Path("data/nanodb.sqlite3"))
+    # How many processes serve the API. With more than one, this process keeps the database and
+    # serves it to them over the nanodb_socket_path Unix domain socket.
+    workers: int = Field(default=1, ge=1)
+    nanodb_socket_path: Path = Field(default=Path("data/nanodb.sock"))
+    # Sessions older than this are deleted along with their events (in seconds or ISO 8601).
+    session_ttl: Optional[timedelta] = Field(default=None)
     modules: List[str] = Field(default_factory=list)
 
     @field_validator("modules", mode="before")